@@ -0,0 +1,164 @@
+import json
+import typing
+
+import bleuart
+
+# 配置方案中允许出现的配置项，也就是对应的AT指令的名字，波特率需要特殊处理，因此单独列出
+PROFILE_KEYS = ("UUIDS", "UUIDW", "UUIDN", "AUTO_CFG", "AUTO_MAC", "INTVL")
+PROFILE_KEY_BAUDRATE = "UART"
+
+# 配置项的中文名，在出现异常时携带在异常消息中
+PROFILE_KEY_NAMES = {
+    "UUIDS": "蓝牙透传主服务UUID",
+    "UUIDW": "蓝牙透传写特征UUID",
+    "UUIDN": "蓝牙透传通知特征UUID",
+    "AUTO_CFG": "自动重连功能",
+    "AUTO_MAC": "自动重连的设备",
+    "INTVL": "广播间隔",
+    "UART": "波特率",
+}
+
+
+class AdapterProfile:
+    """
+        适配器的配置方案，描述适配器期望的完整状态
+    """
+
+    def __init__(self, name: str, config: typing.Dict[str, typing.Any]):
+        """
+            创建配置方案
+        @param name: 方案的名字
+        @param config: 配置项到配置值的映射表，配置项为对应的AT指令的名字，比如 {"UUIDS": "FFF0"}
+        """
+        self.name = name
+        self.config: typing.Dict[str, str] = {}
+        for key, value in config.items():
+            key = key.upper()
+            if key not in PROFILE_KEYS and key != PROFILE_KEY_BAUDRATE:
+                raise ValueError(f"配置方案 '{name}' 中存在不支持的配置项 '{key}'，只支持 {PROFILE_KEYS + (PROFILE_KEY_BAUDRATE,)}")
+            # 按照指令表中设置指令的编码器编码，同时也完成了配置值的校验
+            self.config[key] = bleuart.AT_COMMAND_TABLE[f"{key}="].encoder(value)
+
+    def __str__(self):
+        return f"{self.name}: {self.config}"
+
+
+# 新一手册中的默认透传服务与特征，重置适配器时使用此方案
+PROFILE_DEFAULT = AdapterProfile("新一默认", {
+    "UUIDS": "FFF0",
+    "UUIDN": "FFF1",
+    "UUIDW": "FFF2",
+    "AUTO_CFG": 0,
+})
+
+
+def load_profiles(file_path: str) -> typing.Dict[str, AdapterProfile]:
+    """
+        从文件中加载配置方案，支持JSON与TOML格式，文件的顶层为 方案名: {配置项: 配置值}
+    @param file_path: 文件路径，以 .toml 结尾的按照TOML解析，其他的按照JSON解析
+    @return: 方案名到方案的映射表
+    """
+    if file_path.lower().endswith(".toml"):
+        import tomllib  # 只有用到TOML格式时才需要
+        with open(file_path, "rb") as f:
+            content = tomllib.load(f)
+    else:
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = json.load(f)
+    return {name: AdapterProfile(name, config) for name, config in content.items()}
+
+
+def normalize_value(key: str, value: typing.Any) -> str:
+    """
+        规范化配置值，先按照指令表中设置指令的编码器编码，再统一大小写，
+        因为模块应答的UUID与MAC的大小写可能与方案中的不一致
+    @param key: 配置项
+    @param value: 配置值，可以是方案中的字符串，也可以是指令表解码后的类型
+    @return:
+    """
+    return bleuart.AT_COMMAND_TABLE[f"{key}="].encoder(value).strip().upper()
+
+
+def is_same_value(key: str, value_a: typing.Any, value_b: typing.Any) -> bool:
+    """
+        比较两个配置值是否一致，无法编码的值（比如模块应答了意料之外的格式）认为是不一致的
+    @param key: 配置项
+    @param value_a: 配置值
+    @param value_b: 配置值
+    @return:
+    """
+    try:
+        return normalize_value(key, value_a) == normalize_value(key, value_b)
+    except ValueError:
+        return False
+
+
+def read_adapter_state(adapter: bleuart.BLEToUartAdapter, keys: typing.Iterable[str],
+                       use_cache: bool = True) -> typing.Dict[str, typing.Any]:
+    """
+        批量读取适配器当前的配置
+    @param adapter: 适配器
+    @param keys: 需要读取的配置项
+    @param use_cache: 是否允许直接从配置缓存中读取
+    @return: 配置项到配置值的映射表，配置值为指令表解码后的类型
+    """
+    keys = list(keys)
+    results = adapter.call_batch([(f"{key}?",) for key in keys], use_cache=use_cache)
+    state = {}
+    for key, result in zip(keys, results):
+        if not result.ok:
+            raise bleuart.AdapterException(f"读取 '{PROFILE_KEY_NAMES[key]}' 失败：{result.error}")
+        state[key] = result.value
+    return state
+
+
+def diff_profile(profile: AdapterProfile, state: typing.Dict[str, str]) -> typing.List[typing.Tuple[str, str]]:
+    """
+        计算出把适配器从当前状态切换到配置方案需要写入的最小配置集合
+    @param profile: 配置方案
+    @param state: 适配器当前的配置
+    @return: 需要写入的 (配置项, 配置值)，保持配置方案中的顺序，波特率不在此处理
+    """
+    changes = []
+    for key, value in profile.config.items():
+        if key not in PROFILE_KEYS:
+            continue
+        if key not in state or not is_same_value(key, state[key], value):
+            changes.append((key, value))
+    return changes
+
+
+def apply_profile(adapter: bleuart.BLEToUartAdapter, profile: AdapterProfile,
+                  verify: bool = True, use_cache: bool = False) -> typing.List[typing.Tuple[str, str]]:
+    """
+        把配置方案应用到适配器：读取当前状态，只写入有差异的配置项，最后回读验证
+    @param adapter: 适配器
+    @param profile: 配置方案
+    @param verify: 是否回读验证，没有需要写入的配置项时也会验证
+    @param use_cache: 是否允许从配置缓存中读取当前状态，模块可能被其他上位机改过配置，默认直接从模块读取；
+        读取的结果会刷新配置缓存，写入时依旧可以跳过与缓存一致的配置项
+    @return: 实际写入的 (配置项, 配置值)
+    """
+    keys = [key for key in profile.config.keys() if key in PROFILE_KEYS]
+    changes = diff_profile(profile, read_adapter_state(adapter, keys, use_cache=use_cache))
+    if len(changes) > 0:
+        results = adapter.call_batch([(f"{key}=", value) for key, value in changes], stop_on_error=True)
+        for result in results:
+            if not result.ok:
+                raise result.error
+    if verify and len(keys) > 0:
+        # 回读全部的配置项，没有写入时也要验证，防止基于过期的状态误判为不需要写入
+        state = read_adapter_state(adapter, keys, use_cache=False)
+        for key, value in diff_profile(profile, state):
+            raise bleuart.AdapterException(
+                f"配置方案 '{profile.name}' 回读验证失败，{PROFILE_KEY_NAMES[key]}期望为 {value}，实际为 {state.get(key)}")
+
+    # 波特率放在最后切换，切换后pyserial端也需要同步切换，try_change_baudrate 自带回读验证
+    if PROFILE_KEY_BAUDRATE in profile.config:
+        baudrate_index = int(profile.config[PROFILE_KEY_BAUDRATE])
+        if baudrate_index != adapter.baudrate_current_index:
+            adapter.try_change_baudrate(baudrate_index)
+            changes.append((PROFILE_KEY_BAUDRATE, profile.config[PROFILE_KEY_BAUDRATE]))
+
+    bleuart.logger.info(f"应用配置方案 '{profile.name}' 完成，写入的配置项：{changes}")
+    return changes
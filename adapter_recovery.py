@@ -0,0 +1,140 @@
+import threading
+import time
+import typing
+
+import bleuart
+
+
+class RecoverySupervisor:
+    """
+        适配器的恢复管理，串口丢失后在后台线程中按照退避间隔重新打开串口，
+        使用之前的波特率握手，恢复配置，并且在丢失前正在扫描时继续扫描
+    """
+
+    BACKOFF_INITIAL = 0.2  # 第一次重试前等待的秒数
+    BACKOFF_MAX = 3.0  # 重试间隔的上限
+
+    def __init__(self, adapter: bleuart.BLEToUartAdapter, deadline: float = 30,
+                 restore_calls: typing.List[typing.Tuple] | None = None):
+        """
+            创建恢复管理，同时接管适配器的串口丢失回调
+        @param adapter: 适配器
+        @param deadline: 最多尝试恢复多久，以秒为单位，超过后放弃
+        @param restore_calls: 恢复通信后需要执行的指令，格式同 BLEToUartAdapter.call_batch，
+                              启用了配置缓存时，与缓存一致的设置不会真实的发送
+        """
+        self.adapter = adapter
+        self.deadline = deadline
+        self.restore_calls = list(restore_calls) if restore_calls is not None else []
+
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._wakeup_event = threading.Event()  # 置位时立刻进行下一次重试，比如串口重新出现的时候
+        self._cancel_event = threading.Event()
+
+        # 开始恢复时的回调，参数为导致丢失的异常
+        self.on_recovery_start: typing.Callable[[Exception | None], None] | None = None
+        # 恢复成功时的回调，参数为恢复的耗时，以秒为单位
+        self.on_recovered: typing.Callable[[float], None] | None = None
+        # 放弃恢复时的回调，参数为最后一次失败的异常
+        self.on_recovery_failed: typing.Callable[[Exception | None], None] | None = None
+
+        adapter.callback_on_port_lost = self.notify_port_lost
+
+    @property
+    def recovering(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def notify_port_lost(self, error: Exception | None = None):
+        """
+            通知串口已经丢失，可以由适配器的扫描线程或者串口热插拔监视调用，正在恢复时重复的通知无效
+        @param error: 导致丢失的异常
+        @return:
+        """
+        with self._lock:
+            if self.recovering or self._cancel_event.is_set():
+                return
+            self._wakeup_event.clear()
+            self._thread = threading.Thread(target=self.thread_recover, args=(error,), name="适配器恢复",
+                                            daemon=True)
+            self._thread.start()
+
+    def notify_port_added(self):
+        """
+            通知有串口重新出现，正在等待重试时立刻重试
+        @return:
+        """
+        self._wakeup_event.set()
+
+    def cancel(self):
+        """
+            取消恢复，适配器被主动关闭时需要调用
+        @return:
+        """
+        self._cancel_event.set()
+        self._wakeup_event.set()
+        self.adapter.callback_on_port_lost = None
+
+    def try_reopen(self) -> bool:
+        """
+            尝试一次重新打开与恢复通信
+        @return: 是否成功，串口还不存在时返回False，串口上不是之前的模块时抛出异常
+        """
+        adapter = self.adapter
+        if not adapter.open():
+            return False
+        try:
+            adapter.resume()
+            if len(self.restore_calls) > 0:
+                for result in adapter.call_batch(self.restore_calls):
+                    if not result.ok:
+                        raise result.error
+        except Exception:
+            adapter.close()
+            raise
+        return True
+
+    def thread_recover(self, error: Exception | None):
+        adapter = self.adapter
+        time_start = time.monotonic()
+        bleuart.logger.warning(f"适配器串口丢失，开始恢复：{error}")
+        if self.on_recovery_start is not None:
+            self.on_recovery_start(error)
+
+        # 扫描线程退出后再重新打开，避免旧的扫描线程把新的扫描状态改掉
+        resume_scan = adapter.scan_interrupted or adapter.scan_state == adapter.ScanState.RUNNING
+        adapter.scan_interrupted = False
+        adapter.close()
+        adapter.wait_scan_thread_exit(2)
+        adapter.set_scan_state(adapter.ScanState.STOPPED)
+
+        delay = self.BACKOFF_INITIAL
+        last_error: Exception | None = error
+        while not self._cancel_event.is_set():
+            if self._wakeup_event.wait(delay):
+                self._wakeup_event.clear()
+            if self._cancel_event.is_set():
+                break
+            try:
+                if self.try_reopen():
+                    duration = time.monotonic() - time_start
+                    bleuart.logger.info(f"适配器已恢复，耗时 {duration:.2f}s")
+                    if resume_scan:
+                        adapter.start_scan()
+                    if self.on_recovered is not None:
+                        self.on_recovered(duration)
+                    return
+            except bleuart.AdapterMismatchException as e:
+                last_error = e  # 串口上不是之前的模块，继续重试没有意义
+                break
+            except Exception as e:
+                last_error = e
+            if time.monotonic() - time_start > self.deadline:
+                break
+            delay = min(delay * 2, self.BACKOFF_MAX)
+
+        if self._cancel_event.is_set():
+            return
+        bleuart.logger.error(f"适配器恢复失败，放弃恢复：{last_error}")
+        if self.on_recovery_failed is not None:
+            self.on_recovery_failed(last_error)
@@ -0,0 +1,361 @@
+"""
+    bleuart 的离线性能基准测试，不需要连接硬件，使用模拟的串口对象驱动真实的解析与指令路径
+
+    用法：
+        python bench_bleuart.py                            # 运行并以JSON格式输出到控制台
+        python bench_bleuart.py -o result.json             # 同时保存结果
+        python bench_bleuart.py --baseline old.json        # 与旧的结果对比，出现性能回退时返回非0
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import bleuart
+
+
+class FakeSerial:
+    """
+        模拟的串口对象，实现了 BLEToUartAdapter 用到的 pyserial 接口，
+        写入指令时按照应答表自动把应答放入接收缓冲区
+    """
+
+    def __init__(self, responses: typing.Dict[bytes, bytes] | None = None):
+        """
+            创建模拟的串口
+        @param responses: 指令到应答的映射表，指令为完整的 b'AT+XXX\\r\\n'
+        """
+        self.port = "FAKE"
+        self.baudrate = 115200
+        self.timeout = 0
+        self.is_open = True
+        self.responses = responses if responses is not None else {}
+        self._rx = b""
+        self._rx_pos = 0
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def feed(self, data: bytes):
+        """
+            往接收缓冲区中追加数据，模拟适配器发送过来的数据
+        @param data: 数据
+        @return:
+        """
+        self._rx = self._rx[self._rx_pos:] + data
+        self._rx_pos = 0
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._rx) - self._rx_pos
+
+    def read(self, size: int = 1) -> bytes:
+        data = self._rx[self._rx_pos:self._rx_pos + size]
+        self._rx_pos += len(data)
+        return data
+
+    def write(self, data: bytes) -> int:
+        resp = self.responses.get(bytes(data))
+        if resp is not None:
+            self.feed(resp)
+        return len(data)
+
+
+def create_adapter(fake: FakeSerial) -> bleuart.BLEToUartAdapter:
+    """
+        创建一个使用模拟串口的适配器，不会启动扫描线程
+    @param fake: 模拟的串口
+    @return:
+    """
+    adapter = bleuart.BLEToUartAdapter(fake.port)
+    adapter._ser = fake
+    return adapter
+
+
+def make_scan_lines(count: int, device_count: int) -> typing.List[str]:
+    """
+        生成扫描结果行，循环使用 device_count 个不同的设备
+    @param count: 行数
+    @param device_count: 不同设备的个数
+    @return: 不带回车换行的扫描结果行
+    """
+    lines = []
+    for i in range(count):
+        index = i % device_count
+        mac = ":".join(f"{(index >> shift) & 0xFF:02X}" for shift in (40, 32, 24, 16, 8, 0))
+        lines.append(f"{mac} {index % 2} -{40 + index % 60} Device_{index}")
+    return lines
+
+
+def best_of(fn: typing.Callable[[], None], repeat: int) -> float:
+    """
+        多次运行取最短耗时，减少系统调度带来的干扰
+    @param fn: 被测函数
+    @param repeat: 运行次数
+    @return: 最短耗时，以秒为单位
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - time_start)
+    return best
+
+
+def bench_wait_response(line_count: int, repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        wait_response 的行吞吐量，模拟一轮扫描的全部应答
+    """
+    data = "".join(f"{line}\r\n" for line in make_scan_lines(line_count, 100)).encode() + b"+SCAN END\r\n"
+    fake = FakeSerial()
+    adapter = create_adapter(fake)
+
+    def run():
+        fake.feed(data)
+        adapter.wait_response("+SCAN END", 60, lambda _: None)
+
+    elapsed = best_of(run, repeat)
+    return {"value": line_count / elapsed, "unit": "lines/s", "higher_is_better": True}
+
+
+def bench_extract_from_at_response(number: int, repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        extract_from_at_response 的单次耗时，一半是结束行，一半是普通的行
+    """
+    lines = ["xx+UUIDS:FFF0\r\n", "AA:BB:CC:DD:EE:FF 0 -50 Device\r\n"]
+    end_lines = [bleuart.BLEToUartAdapter.RESP_ERROR, "+UUIDS"]
+    extract = bleuart.BLEToUartAdapter.extract_from_at_response
+
+    def run():
+        for i in range(number):
+            extract(lines[i & 1], end_lines)
+
+    elapsed = best_of(run, repeat)
+    return {"value": elapsed / number * 1e9, "unit": "ns/op", "higher_is_better": False}
+
+
+def bench_scan_line_parse(number: int, repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        扫描结果行的解析速率，设备都已经在映射表中
+    """
+    lines = make_scan_lines(number, 100)
+    adapter = create_adapter(FakeSerial())
+
+    def run():
+        parse = adapter.parse_scan_line
+        for line in lines:
+            parse(line)
+
+    elapsed = best_of(run, repeat)
+    return {"value": number / elapsed, "unit": "lines/s", "higher_is_better": True}
+
+
+def bench_scan_event_publish(number: int, repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        扫描线程中每一行的完整处理速率，包括解析与写入扫描事件的环形缓冲区，挂着一个从不读取的游标
+    """
+    lines = make_scan_lines(number, 100)
+    adapter = create_adapter(FakeSerial())
+    adapter.scan_events.subscribe()
+
+    def run():
+        on_scan_line = adapter.on_scan_line
+        for line in lines:
+            on_scan_line(line)
+
+    elapsed = best_of(run, repeat)
+    return {"value": number / elapsed, "unit": "lines/s", "higher_is_better": True}
+
+
+def bench_device_history_write(number: int, repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        设备历史的写入速率，按照写入线程的批次大小分批写入临时数据库，每一批一个事务
+    """
+    import device_history
+    import scan_events
+    events = []
+    for i, line in enumerate(make_scan_lines(number, 100)):
+        mac, mac_type, rssi, name = line.split(" ", 3)
+        events.append(scan_events.ScanEvent(i, time.time(), mac, int(mac_type), int(rssi), name))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = device_history.DeviceHistoryStore(os.path.join(work_dir, "history.db"))
+        conn = device_history.connect(store.path)
+
+        def run():
+            for i in range(0, len(events), store.batch_size):
+                store.write_batch(conn, events[i:i + store.batch_size])
+
+        try:
+            elapsed = best_of(run, repeat)
+        finally:
+            conn.close()
+    return {"value": number / elapsed, "unit": "events/s", "higher_is_better": True}
+
+
+def bench_device_map_update(device_count: int, repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        设备映射表在不同规模下的更新耗时，包括首次插入与之后的更新
+    """
+    lines = make_scan_lines(device_count * 2, device_count)
+
+    def run():
+        adapter = create_adapter(FakeSerial())
+        parse = adapter.parse_scan_line
+        for line in lines:
+            parse(line)
+
+    elapsed = best_of(run, repeat)
+    return {"value": elapsed / len(lines) * 1e9, "unit": "ns/op", "higher_is_better": False}
+
+
+def bench_exec_round_trip(number: int, repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        一条指令完整的收发与解析耗时，不包含模块需要的固定前置等待
+    """
+    fake = FakeSerial({b"AT+UUIDS?\r\n": b"+UUIDS:FFF0\r\n"})
+    adapter = create_adapter(fake)
+
+    def run():
+        for _ in range(number):
+            adapter.exec_no_delay("UUIDS?", "+UUIDS")
+
+    elapsed = best_of(run, repeat)
+    return {"value": elapsed / number * 1e6, "unit": "us/op", "higher_is_better": False}
+
+
+def bench_stream_demux(line_count: int, repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        分路器的吞吐量，透传数据、事件与指令应答混在一起，按照串口读取的块大小输入
+    """
+    import stream_demux
+    parts = []
+    for i, line in enumerate(make_scan_lines(line_count, 100)):
+        if i % 50 == 0:
+            parts.append("+CONNECTED\r\n" if i % 100 == 0 else "+DISCONN\r\n")
+        parts.append(f"payload-{line}\r\n" if i % 2 == 0 else f"{line}\r\n")
+    data = "".join(parts).encode() + b"xx+UUIDS:FFF0\r\n"
+    chunk_size = bleuart.BLEToUartAdapter.READ_CHUNK_SIZE
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    demux = stream_demux.StreamDemux()
+
+    def run():
+        demux.begin("+UUIDS")
+        for chunk in chunks:
+            demux.feed(chunk)
+        demux.end()
+
+    elapsed = best_of(run, repeat)
+    return {"value": len(data) / elapsed / 1e6, "unit": "MB/s", "higher_is_better": True}
+
+
+def bench_import(repeat: int, module_name: str = "bleuart") -> typing.Dict[str, typing.Any]:
+    """
+        在新的进程中导入模块的耗时，同时检查导入时没有创建任何文件与线程
+    """
+    code = (f"import threading, time; t = time.perf_counter(); import {module_name}; "
+            "print(time.perf_counter() - t, threading.active_count())")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [
+        os.path.dirname(os.path.abspath(bleuart.__file__)), os.environ.get("PYTHONPATH")])))
+    best = float("inf")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for _ in range(repeat):
+            output = subprocess.check_output([sys.executable, "-c", code], cwd=work_dir, env=env, text=True)
+            elapsed, thread_count = output.split()
+            best = min(best, float(elapsed))
+            if int(thread_count) != 1:
+                raise RuntimeError(f"导入 {module_name} 时启动了{int(thread_count) - 1}个线程")
+        if len(os.listdir(work_dir)) > 0:
+            raise RuntimeError(f"导入 {module_name} 时创建了文件：{os.listdir(work_dir)}")
+    return {"value": best * 1e3, "unit": "ms", "higher_is_better": False}
+
+
+def run_all(quick: bool = False) -> typing.Dict[str, typing.Any]:
+    """
+        运行全部的基准测试
+    @param quick: 快速模式，减少规模与重复次数，只用于冒烟检查
+    @return: 可以直接序列化为JSON的结果
+    """
+    scale = 10 if quick else 1
+    repeat = 2 if quick else 5
+    results = {
+        "wait_response_throughput": bench_wait_response(20000 // scale, repeat),
+        "extract_from_at_response": bench_extract_from_at_response(100000 // scale, repeat),
+        "scan_line_parse_rate": bench_scan_line_parse(100000 // scale, repeat),
+        "scan_event_publish_rate": bench_scan_event_publish(100000 // scale, repeat),
+        "exec_round_trip": bench_exec_round_trip(2000 // scale, repeat),
+        "stream_demux_throughput": bench_stream_demux(100000 // scale, repeat),
+        "device_history_write_rate": bench_device_history_write(50000 // scale, repeat),
+        "import_bleuart": bench_import(repeat),
+    }
+    for device_count in (100, 1000, 10000):
+        results[f"device_map_update_{device_count}"] = bench_device_map_update(device_count, repeat)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(results: typing.Dict[str, typing.Any], baseline: typing.Dict[str, typing.Any],
+            threshold: float) -> typing.List[str]:
+    """
+        与基线结果对比，找出性能回退超过阈值的项
+    @param results: 本次的结果
+    @param baseline: 基线结果
+    @param threshold: 允许的回退比例，比如0.2表示20%
+    @return: 回退项的描述
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None or base["value"] <= 0:
+            continue
+        if result["higher_is_better"]:
+            change = (base["value"] - result["value"]) / base["value"]
+        else:
+            change = (result["value"] - base["value"]) / base["value"]
+        if change > threshold:
+            regressions.append(f"{name}: {base['value']:.1f} -> {result['value']:.1f} {result['unit']} "
+                               f"（回退 {change * 100:.0f}%）")
+    return regressions
+
+
+def main(argv: typing.List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="bleuart 离线性能基准测试")
+    parser.add_argument("-o", "--output", help="结果保存的JSON文件路径")
+    parser.add_argument("--baseline", help="用于对比的基线结果JSON文件路径")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的回退比例，默认0.2")
+    parser.add_argument("--quick", action="store_true", help="快速模式，只用于冒烟检查")
+    args = parser.parse_args(argv)
+
+    results = run_all(args.quick)
+    content = json.dumps(results, ensure_ascii=False, indent=4)
+    print(content)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if len(regressions) > 0:
+            print("出现性能回退：\n" + "\n".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
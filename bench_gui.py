@@ -0,0 +1,333 @@
+"""
+    GUI设备列表的性能测试工具，向 App 注入模拟的广播流，统计回调耗时，UI帧延迟与内存占用
+
+    用法：
+        python bench_gui.py --devices 100 1000 --rate 500 --duration 10     # 使用真实的Tk（Linux下可以用 xvfb-run）
+        python bench_gui.py --mock --devices 100 1000 10000                   # 使用模拟的控件，不需要显示器
+        python bench_gui.py --startup                                         # 只测试导入与启动的耗时
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+import tkinter as tk
+import tracemalloc
+import typing
+
+import bench_bleuart
+import bleuart
+import gui_ble_to_uart
+import log
+import rssi_timeline
+
+
+class TimingStats:
+    """
+        耗时统计，保存全部的样本，测试规模有限，不需要做直方图
+    """
+
+    def __init__(self):
+        self.samples: typing.List[float] = []
+
+    def add(self, duration: float):
+        self.samples.append(duration)
+
+    def to_dict(self, scale: float = 1e3, unit: str = "ms") -> typing.Dict[str, typing.Any]:
+        if len(self.samples) == 0:
+            return {"count": 0, "unit": unit}
+        samples = sorted(self.samples)
+        return {
+            "count": len(samples),
+            "mean": sum(samples) / len(samples) * scale,
+            "p50": samples[len(samples) // 2] * scale,
+            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * scale,
+            "max": samples[-1] * scale,
+            "unit": unit,
+        }
+
+
+def timed(fn: typing.Callable, stats: TimingStats) -> typing.Callable:
+    """
+        包装一个函数，统计每次调用的耗时
+    """
+
+    def wrapper(*args, **kwargs):
+        time_start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.add(time.perf_counter() - time_start)
+
+    return wrapper
+
+
+class MockVar:
+    def __init__(self, value=None):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+
+class MockTreeview:
+    """
+        模拟 ttk.Treeview 中 App 用到的接口，只保存数据不做绘制
+    """
+
+    def __init__(self):
+        self._items: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+
+    def exists(self, iid):
+        return iid in self._items
+
+    def insert(self, parent, index, values=None, iid=None):
+        self._items[iid] = {"values": list(values)}
+        return iid
+
+    def item(self, iid, values=None):
+        if values is None:
+            return {"values": list(self._items[iid]["values"])}
+        self._items[iid]["values"] = list(values)
+
+    def get_children(self, item=None):
+        return tuple(self._items.keys())
+
+    def delete(self, *iids):
+        for iid in iids:
+            self._items.pop(iid, None)
+
+
+class MockCanvas:
+    def delete(self, *tags):
+        return None
+
+
+class MockRoot:
+    """
+        模拟根窗口，定时任务不会被执行，由测试代码自己驱动
+    """
+
+    def after(self, ms, func=None, *args):
+        return None
+
+    def after_idle(self, func, *args):
+        return None
+
+
+def create_adapter_scanning() -> bleuart.BLEToUartAdapter:
+    """
+        创建一个处于扫描状态的适配器，让 App 认为扫描正在进行
+    """
+    adapter = bench_bleuart.create_adapter(bench_bleuart.FakeSerial())
+    adapter.set_scan_state(bleuart.BLEToUartAdapter.ScanState.RUNNING)
+    return adapter
+
+
+def create_mock_app() -> gui_ble_to_uart.App:
+    """
+        创建一个使用模拟控件的 App，只初始化设备列表相关的属性
+    """
+    app = gui_ble_to_uart.App.__new__(gui_ble_to_uart.App)
+    app.root = MockRoot()
+    app.tree_view_device_list = MockTreeview()
+    app.var_filter_device_name = MockVar("")
+    app.device_adv_record_map = {}
+    app.rssi_timelines = rssi_timeline.RssiTimelineMap()
+    app.rssi_sparkline_map = {}
+    app.rssi_detail_rendered = None
+    app.canvas_rssi_detail = MockCanvas()
+    return app
+
+
+def create_devices(adapter: bleuart.BLEToUartAdapter, device_count: int, event_count: int) -> typing.List[bleuart.BLEDevice]:
+    """
+        生成广播事件流，经过真实的扫描行解析得到设备实例
+    """
+    events = []
+    for line in bench_bleuart.make_scan_lines(event_count, device_count):
+        events.append(adapter.parse_scan_line(line))
+    return events
+
+
+def measure_memory(app: gui_ble_to_uart.App, adapter: bleuart.BLEToUartAdapter, device_count: int) -> float:
+    """
+        统计每个设备在列表中占用的内存
+    @return: 字节/设备
+    """
+    app.clear_device_list()
+    devices = create_devices(adapter, device_count, device_count)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for device in devices:
+        app.on_device_found(device)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - before) / device_count
+
+
+def measure_rssi_timeline_memory(device_count: int) -> float:
+    """
+        统计每个设备的信号强度时间线写满后占用的内存，与扫描时长无关
+    @return: 字节/设备
+    """
+    timelines = rssi_timeline.RssiTimelineMap()
+    macs = [f"{i:012X}" for i in range(device_count)]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for _ in range(timelines.capacity * 2):
+        for mac in macs:
+            timelines.add(mac, time.time(), -60)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - before) / device_count
+
+
+def run_mock(device_count: int, rate: int, duration: float) -> typing.Dict[str, typing.Any]:
+    """
+        使用模拟控件运行，只统计Python侧的回调耗时，没有UI帧延迟
+    """
+    app = create_mock_app()
+    adapter = create_adapter_scanning()
+    app.ble_adapter = adapter
+    stats_found, stats_check, stats_clear = TimingStats(), TimingStats(), TimingStats()
+    on_device_found = timed(app.on_device_found, stats_found)
+    task_check = timed(app.task_check_device_adv_time, stats_check)
+
+    event_count = int(rate * duration)
+    for index, device in enumerate(create_devices(adapter, device_count, event_count)):
+        on_device_found(device)
+        if index % rate == rate - 1:  # 每秒一次的检查任务
+            task_check()
+    timed(app.clear_device_list, stats_clear)()
+
+    return {
+        "mode": "mock",
+        "devices": device_count,
+        "rate": rate,
+        "events": event_count,
+        "on_device_found": stats_found.to_dict(1e6, "us"),
+        "task_check_device_adv_time": stats_check.to_dict(),
+        "clear_device_list": stats_clear.to_dict(),
+        "memory_per_device": measure_memory(app, adapter, device_count),
+        "rssi_timeline_memory_per_device": measure_rssi_timeline_memory(device_count),
+    }
+
+
+def run_tk(device_count: int, rate: int, duration: float) -> typing.Dict[str, typing.Any]:
+    """
+        使用真实的Tk运行，广播事件在主循环中按照速率注入，同时用一个16毫秒的定时器探测UI帧延迟
+    """
+    root = tk.Tk()
+    root.geometry("1080x480")
+    app = gui_ble_to_uart.App(root)
+    app.build_device_panel()
+    adapter = create_adapter_scanning()
+    app.ble_adapter = adapter
+    app.rssi_cursor = adapter.scan_events.subscribe()
+
+    stats_found, stats_check, stats_clear, stats_frame = TimingStats(), TimingStats(), TimingStats(), TimingStats()
+    stats_rssi = TimingStats()
+    app.on_device_found = timed(app.on_device_found, stats_found)
+    app.task_check_device_adv_time = timed(app.task_check_device_adv_time, stats_check)
+    app.task_render_rssi_timelines = timed(app.task_render_rssi_timelines, stats_rssi)
+
+    events = create_devices(adapter, device_count, int(rate * duration))
+    state = {"sent": 0, "time_start": time.perf_counter(), "frame_last": time.perf_counter()}
+    frame_interval_ms = 16
+
+    def feed():
+        elapsed = time.perf_counter() - state["time_start"]
+        target = min(len(events), int(elapsed * rate))
+        while state["sent"] < target:
+            device = events[state["sent"]]
+            adapter.scan_events.publish(device.mac, device.mac_type, device.rssi, device.name)
+            app.on_device_found(device)
+            state["sent"] += 1
+        if state["sent"] >= len(events):
+            root.quit()
+            return
+        root.after(5, feed)
+
+    def frame_probe():
+        now = time.perf_counter()
+        stats_frame.add(max(0.0, now - state["frame_last"] - frame_interval_ms / 1000))
+        state["frame_last"] = now
+        root.after(frame_interval_ms, frame_probe)
+
+    root.after(0, feed)
+    root.after(frame_interval_ms, frame_probe)
+    root.mainloop()
+
+    timed(app.clear_device_list, stats_clear)()
+    root.update()
+    result = {
+        "mode": "tk",
+        "devices": device_count,
+        "rate": rate,
+        "events": len(events),
+        "on_device_found": stats_found.to_dict(1e6, "us"),
+        "task_check_device_adv_time": stats_check.to_dict(),
+        "task_render_rssi_timelines": stats_rssi.to_dict(),
+        "clear_device_list": stats_clear.to_dict(),
+        "frame_latency": stats_frame.to_dict(),
+        "memory_per_device": measure_memory(app, adapter, device_count),
+        "rssi_timeline_memory_per_device": measure_rssi_timeline_memory(device_count),
+    }
+    root.destroy()
+    return result
+
+
+def run_startup(repeat: int) -> typing.Dict[str, typing.Any]:
+    """
+        测试GUI模块的导入耗时，以及串口选择与设备面板分别创建完成的耗时
+    """
+    phases: typing.Dict[str, TimingStats] = {}
+    for _ in range(repeat):
+        root = tk.Tk()
+        app = gui_ble_to_uart.App(root)
+        root.update()
+        app.build_device_panel()
+        for name, duration in app.startup_timer.phases:
+            phases.setdefault(name, TimingStats()).add(duration)
+        root.destroy()
+    return {
+        "mode": "startup",
+        "import_gui": bench_bleuart.bench_import(repeat, "gui_ble_to_uart"),
+        "phases": {name: stats.to_dict() for name, stats in phases.items()},
+    }
+
+
+def main(argv: typing.List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="GUI设备列表的性能测试")
+    parser.add_argument("--devices", type=int, nargs="+", default=[100, 1000], help="不同设备的个数，可以指定多个")
+    parser.add_argument("--rate", type=int, default=500, help="每秒注入的广播事件数")
+    parser.add_argument("--duration", type=float, default=10, help="每轮注入的持续时间，以秒为单位")
+    parser.add_argument("--mock", action="store_true", help="使用模拟的控件，不需要显示器")
+    parser.add_argument("--startup", action="store_true", help="只测试导入与启动的耗时")
+    parser.add_argument("-o", "--output", help="结果保存的JSON文件路径")
+    args = parser.parse_args(argv)
+
+    # 注入的每一个广播事件都会输出一行日志，测试时不写日志文件，只输出警告以上的日志，避免日志的IO影响测量结果
+    log.LOG_DIR = None
+    log.set_level(gui_ble_to_uart.logger.name, logging.WARNING)
+    log.set_level(bleuart.logger.name, logging.WARNING)
+
+    if args.startup:
+        results = [run_startup(5)]
+    else:
+        run = run_mock if args.mock else run_tk
+        results = [run(device_count, args.rate, args.duration) for device_count in args.devices]
+    content = json.dumps({"results": results}, ensure_ascii=False, indent=4)
+    print(content)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(content)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,7 @@
+import functools
+import json
+import logging
+import os
 import re
 import threading
 import time
@@ -5,11 +9,25 @@ import traceback
 import typing
 import serial
 
+import command_latency
 import log
+import scan_events
+import stream_demux
+import wire_trace
 
 logger = log.getLogger("BLE转串口适配器通信日志")
 
 
+def set_logger(new_logger: logging.Logger):
+    """
+        替换库使用的日志对象，比如批量运行的脚本不需要日志文件时，可以注入一个自己配置的日志对象
+    @param new_logger: 日志对象
+    @return:
+    """
+    global logger
+    logger = new_logger
+
+
 class BLEDevice:
 
     def __init__(self):
@@ -33,6 +51,257 @@ class AdapterException(Exception):
     """
 
 
+class AdapterMismatchException(AdapterException):
+    """
+        串口重新打开后，上面已经不是之前的那个适配器了
+    """
+
+
+class ATCommandResult:
+    """
+        批量执行指令时，单条指令的执行结果
+    """
+
+    def __init__(self, cmd: str, resp_end_lines: str | typing.List[str]):
+        self.cmd: str = cmd  # 指令本身，不带AT+开头
+        self.resp_end_lines = resp_end_lines  # 接受的应答结束行
+        self.resp: str | typing.List[str] | None = None  # 应答，与exec的返回值格式一致
+        self.value: typing.Any = None  # 由指令表中的解码器解码后的应答，只有 call_batch 会填充此值
+        self.error: Exception | None = None  # 执行失败时的异常，成功则为None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __str__(self):
+        return ("{"
+                f"cmd: '{self.cmd}', "
+                f"resp: {self.resp!r}, "
+                f"error: {self.error!r}"
+                "}")
+
+
+# 完整的MAC地址，比如 'AA:BB:CC:DD:EE:FF'
+MAC_PATTERN = re.compile(r"^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$")
+
+
+@functools.lru_cache(maxsize=None)
+def compile_end_line_pattern(end_line: str) -> re.Pattern:
+    """
+        编译提取应答结束行的正则，结束行的种类是有限的，因此编译结果可以一直缓存下来
+    @param end_line: 应答结束标志行
+    @return:
+    """
+    return re.compile(r"(" + re.escape(end_line) + ".*?)\r\n")
+
+
+def get_last_line(resp: str | typing.List[str]) -> str:
+    """
+        获取应答的结束行，应答中可能混有透传过来的数据，结束行总是最后一行
+    @param resp: 应答
+    @return:
+    """
+    return resp if isinstance(resp, str) else resp[-1]
+
+
+class ATCommand:
+    """
+        AT指令的声明，描述了指令的参数编码，应答结束行，超时以及应答的解码
+    """
+
+    class Kind:
+        GET = 0  # 读取指令，形如 'UUIDS?'
+        SET = 1  # 设置指令，形如 'UUIDS=FFF0'，没有参数时形如 'AUTO_DEL'
+        ACTION = 2  # 动作指令，应答不是OK与ERROR，需要自定义解码
+
+    def __init__(self, name: str, kind: int, end_lines: str | typing.List[str], desc: str, timeout: float = 3,
+                 encoder: typing.Callable[..., str] | None = None,
+                 decoder: typing.Callable[[str | typing.List[str], tuple], typing.Any] | None = None,
+                 adaptive_timeout: bool | None = None):
+        """
+            声明一条AT指令
+        @param name: 指令的名字，不带AT+开头，比如 'UUIDS'
+        @param kind: 指令的类型，参考 ATCommand.Kind
+        @param end_lines: 接受的应答结束行
+        @param desc: 指令的描述，在出现异常时，此描述将携带在异常消息中一起抛出
+        @param timeout: 默认的应答超时，以秒为单位
+        @param encoder: 参数编码器，把调用的参数编码为 '=' 之后的字符串，为None时表示指令没有参数
+        @param decoder: 应答解码器，参数为 (应答, 调用的参数)，为None时使用指令类型的默认解码
+        @param adaptive_timeout: 是否根据学习到的应答耗时缩短超时，为None时只有读取与设置指令会学习，
+            耗时取决于外部的指令（比如连接、软复位）不能学习
+        """
+        self.name = name
+        self.kind = kind
+        self.end_lines = end_lines
+        self.desc = desc
+        self.timeout = timeout
+        self.encoder = encoder
+        self.decoder = decoder
+        self.adaptive_timeout = kind in (self.Kind.GET, self.Kind.SET) if adaptive_timeout is None else adaptive_timeout
+        # 预先编译好应答结束行的匹配正则
+        for end_line in ([end_lines] if isinstance(end_lines, str) else end_lines):
+            compile_end_line_pattern(end_line)
+
+    @property
+    def key(self) -> str:
+        """
+            指令在指令表中的键，读取指令以 '?' 结尾，带参数的指令以 '=' 结尾
+        @return:
+        """
+        if self.kind == self.Kind.GET:
+            return f"{self.name}?"
+        if self.encoder is not None:
+            return f"{self.name}="
+        return self.name
+
+    def encode(self, *args) -> str:
+        """
+            把调用的参数编码为完整的指令，不带AT+开头，不带\r\n结尾
+        @param args: 调用的参数
+        @return:
+        """
+        if self.kind == self.Kind.GET:
+            return f"{self.name}?"
+        if self.encoder is None:
+            if len(args) > 0:
+                raise TypeError(f"指令 '{self.name}' 不接受参数")
+            return self.name
+        return f"{self.name}={self.encoder(*args)}"
+
+    def decode(self, resp: str | typing.List[str], args: tuple = ()) -> typing.Any:
+        """
+            解码应答
+        @param resp: 应答，与exec的返回值格式一致
+        @param args: 调用的参数
+        @return: 解码后的结果
+        """
+        if self.decoder is not None:
+            return self.decoder(resp, args)
+        line = get_last_line(resp)
+        if line == BLEToUartAdapter.RESP_ERROR:
+            raise AdapterException(f"执行 '{self.desc}' BLE转串口模块上报错误")
+        if self.kind == self.Kind.GET:
+            return line[line.index(':') + 1:]
+        return None
+
+    def batch_item(self, *args, timeout: float | None = None) -> typing.Tuple[str, str | typing.List[str], float]:
+        """
+            生成 exec_batch 需要的指令项
+        @param args: 调用的参数
+        @param timeout: 应答超时，为None时使用声明中的超时
+        @return:
+        """
+        return self.encode(*args), self.end_lines, self.timeout if timeout is None else timeout
+
+
+class AdapterConfigCache:
+    """
+        适配器的配置缓存，以适配器模块自身的MAC地址为键，记录已知的模块配置，
+        在设置的值与缓存一致时可以跳过指令的执行，在读取时可以直接从缓存中获得
+    """
+
+    # 需要缓存的配置项，也就是对应的AT指令的名字
+    KEYS = ("UUIDS", "UUIDW", "UUIDN", "AUTO_CFG", "AUTO_MAC", "UART", "INTVL", "VER")
+    # 软复位之后依旧可信的配置项，固件版本号不会因为软复位而改变
+    KEYS_KEEP_ON_REBOOT = ("VER",)
+
+    def __init__(self, file_path: str | None = None):
+        """
+            创建配置缓存
+        @param file_path: 持久化的文件路径，为None时只在内存中缓存
+        """
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._config_map = {
+            # 模块MAC地址到配置的映射表，布局为：
+            # mac地址: {配置项: 配置值}
+        }
+        if self.file_path is not None:
+            self.load()
+
+    def load(self):
+        """
+            从文件中加载缓存，文件不存在或者损坏时忽略
+        @return:
+        """
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                config_map = json.load(f)
+            if isinstance(config_map, dict):
+                with self._lock:
+                    self._config_map = config_map
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"加载适配器配置缓存失败，将忽略旧的缓存：{e}")
+
+    def save(self):
+        """
+            保存缓存到文件中，先写临时文件再替换，避免写入一半导致文件损坏
+        @return:
+        """
+        if self.file_path is None:
+            return
+        with self._lock:
+            content = json.dumps(self._config_map, ensure_ascii=False, indent=4)
+        try:
+            file_tmp = f"{self.file_path}.tmp"
+            with open(file_tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(file_tmp, self.file_path)
+        except Exception as e:
+            logger.warning(f"保存适配器配置缓存失败：{e}")
+
+    def get(self, mac: str | None, key: str) -> str | None:
+        """
+            获取缓存的配置值
+        @param mac: 适配器模块的MAC地址
+        @param key: 配置项
+        @return: 没有缓存时返回None
+        """
+        if mac is None:
+            return None
+        with self._lock:
+            return self._config_map.get(mac, {}).get(key)
+
+    def put(self, mac: str | None, key: str, value: str):
+        """
+            更新缓存的配置值，只有 KEYS 中的配置项会被缓存
+        @param mac: 适配器模块的MAC地址
+        @param key: 配置项
+        @param value: 配置值
+        @return:
+        """
+        if mac is None or key not in self.KEYS:
+            return
+        with self._lock:
+            config = self._config_map.setdefault(mac, {})
+            if config.get(key) == value:
+                return
+            config[key] = value
+        self.save()
+
+    def invalidate(self, mac: str | None, keys: typing.Iterable[str] | None = None):
+        """
+            使缓存失效
+        @param mac: 适配器模块的MAC地址
+        @param keys: 需要失效的配置项，为None时失效此模块的全部配置
+        @return:
+        """
+        if mac is None:
+            return
+        with self._lock:
+            if mac not in self._config_map:
+                return
+            if keys is None:
+                del self._config_map[mac]
+            else:
+                config = self._config_map[mac]
+                for key in keys:
+                    config.pop(key, None)
+        self.save()
+
+
 class BLEToUartAdapter:
     """
         蓝牙转串口的适配器的封装类
@@ -58,7 +327,14 @@ class BLEToUartAdapter:
         6: 230400,
     }
 
-    def __init__(self, port):
+    # 扫描时临时切换到的高波特率参数，密集环境下的扫描结果远超38400能承载的数据量
+    SCAN_BAUDRATE_INDEX = 6
+
+    READ_CHUNK_SIZE = 4096  # 每次从串口读取的最大字节数，读到多少就处理多少，不再逐字节读取
+    DRAIN_QUIET_TIME = 0.05  # 丢弃迟到的应答时，串口安静多久认为已经读完，以秒为单位
+
+    def __init__(self, port, config_cache: AdapterConfigCache | None = None,
+                 latency_tracker: "command_latency.CommandLatencyTracker | None" = None):
         self._ser: serial.Serial = serial.Serial()
         self._ser.timeout = 0
         self._ser.port = port
@@ -66,15 +342,70 @@ class BLEToUartAdapter:
 
         self.baudrate_current_index = -1
 
+        # 配置缓存，为None时不使用缓存，每次都真实的执行指令
+        self.config_cache: AdapterConfigCache | None = config_cache
+        self.module_mac: str | None = None  # 适配器模块自身的MAC地址，作为配置缓存的键
+        # 指令耗时的统计，为None时使用指令声明的超时，否则根据学习到的耗时缩短等待应答的超时
+        self.latency_tracker: command_latency.CommandLatencyTracker | None = latency_tracker
+
         self.scan_state: int = self.ScanState.STOPPED  # 标志当前是否有在Scan，如果有的话，其他一切操作都不能进行
         self.has_stop_scan_by_cmd = False  # 标志当前是否有尝试过使用指令去结束扫描
+        self.has_start_scan_by_cmd = False  # 标志当前是否已经发送了开始扫描的指令，还没有等到 '+SCAN END'
+        self._scan_state_cond = threading.Condition()  # 扫描状态变化时通知等待者，扫描相关指令的发送也在此锁内进行
+        self._scan_stopped_event = threading.Event()  # 扫描彻底停止时置位
+        self._scan_stopped_event.set()
         self.scan_device_map = {
             # 设备信息的映射表，布局为：
             # mac地址: 设备实例
         }
 
-        # 设备发现时的回调
+        # 通信追踪器，为None时不追踪，追踪时以串口号作为适配器ID，通过 wire_tracer 属性设置
+        self._wire_tracer: wire_trace.WireTracer | None = None
+
+        # 设备发现的事件，多个消费者各自通过 scan_events.subscribe() 得到的游标读取，扫描线程不会被消费者拖慢
+        self.scan_events = scan_events.ScanEventRing()
+        # 设备发现时的回调，在扫描线程中直接调用，只适合很快的处理，慢的消费者应当使用 scan_events
         self.callback_on_device_found: typing.Callable[[BLEDevice], None] | None = None
+        # 串口丢失时的回调，在扫描线程中调用，参数为导致丢失的异常
+        self.callback_on_port_lost: typing.Callable[[Exception], None] | None = None
+        # 串口丢失时是否正在扫描，恢复时据此决定是否需要继续扫描
+        self.scan_interrupted = False
+        self._scan_thread: threading.Thread | None = None
+
+        # 扫描时临时切换到的波特率参数，为None时不切换，一般为 SCAN_BAUDRATE_INDEX
+        self.scan_baudrate_index: int | None = None
+        # 扫描前用户的波特率参数，扫描停止后需要恢复，为None时表示没有切换过
+        self.scan_baudrate_restore_index: int | None = None
+        self._scan_session_begun = False  # 本次扫描是否已经做过扫描前的准备
+        # 各个波特率下扫描结果的行数统计，布局为：
+        # 波特率: [保留的行数, 丢弃的行数]
+        self.scan_line_stats: typing.Dict[int, typing.List[int]] = {}
+        self._scan_lines_kept = 0  # 本次扫描中解析成功的设备信息行数
+        self._scan_lines_lost = 0  # 本次扫描中被截断或者粘连而丢弃的行数
+
+        # 接收数据的分路器，应答、模块主动上报的事件与透传数据在这里分开
+        self.stream_demux = stream_demux.StreamDemux()
+        self.stream_demux.on_event = self.on_stream_event
+        self.stream_demux.on_payload = self.on_stream_payload
+        self._rx_lock = threading.RLock()  # 读取串口的锁，发送指令到收完应答期间一直持有，空闲时的读取不会抢走应答
+        # 模块主动上报事件时的回调，比如 '+CONNECTED'、'+DISCONN'，参数为事件行
+        self.callback_on_event: typing.Callable[[str], None] | None = None
+        # 收到透传数据时的回调，参数为原始数据
+        self.callback_on_payload: typing.Callable[[bytes], None] | None = None
+
+    @property
+    def wire_tracer(self) -> wire_trace.WireTracer | None:
+        return self._wire_tracer
+
+    @wire_tracer.setter
+    def wire_tracer(self, wire_tracer: wire_trace.WireTracer | None):
+        """
+            设置通信追踪器，只有设置了追踪器时分路器才会复制出每一行交给追踪器，不追踪时没有额外的开销
+        @param wire_tracer: 追踪器，为None时停止追踪
+        @return:
+        """
+        self._wire_tracer = wire_tracer
+        self.stream_demux.on_raw_line = self.on_rx_line if wire_tracer is not None else None
 
     @staticmethod
     def from_baudrate_get_index(baudrate: int):
@@ -95,7 +426,8 @@ class BLEToUartAdapter:
         try:
             if not self._ser.is_open:
                 self._ser.open()  # 首先需要打开串口设备，为后续的通信做准备
-                threading.Thread(target=self.thread_scan, ).start()  # 在开启设备成功后，再启用扫描用的子线程
+                self._scan_thread = threading.Thread(target=self.thread_scan, )
+                self._scan_thread.start()  # 在开启设备成功后，再启用扫描用的子线程
             return True
         except Exception as e:
             logger.error(f"打开串口失败： {e}")
@@ -106,18 +438,26 @@ class BLEToUartAdapter:
             self._ser.close()
         except Exception as e:
             logger.error(f"关闭串口失败：{e}")
+        if self.latency_tracker is not None:
+            self.latency_tracker.save()
 
     def check_is_ble_to_uart_device(self):
         """
             检查是否是BLE转串口的模块
         @return:
         """
+        self.module_mac = None  # 重新检查时，不能信任之前的模块身份
         self.baudrate_current_index = self.detect_baudrate()
         if self.baudrate_current_index == -1:
             raise AdapterException("无法自动侦测到波特率，可能该设备并不是蓝牙转串口模块")
         baudrate_current_value = self.BAUDRATE_MAP[self.baudrate_current_index]
         logger.info(f"侦测到的波特率是：{baudrate_current_value}")
 
+        # 启用了配置缓存时，需要知道模块自身的MAC地址作为缓存的键
+        if self.config_cache is not None:
+            self.module_mac = self.call("MAC?")
+            self.config_cache.put(self.module_mac, "UART", str(self.baudrate_current_index))
+
     def __enter__(self):
         """
             兼容with语法
@@ -131,7 +471,7 @@ class BLEToUartAdapter:
         """
             兼容with语法
         """
-        self.stop_scan()  # 如果存在扫描，则停止扫描后再认为关闭完成
+        self.stop_scan().wait()  # 如果存在扫描，则停止扫描后再认为关闭完成
         self.close()
 
     def wait_response(self, end_lines: str | typing.List[str], timeout: float,
@@ -145,67 +485,117 @@ class BLEToUartAdapter:
         @param end_lines: 应答以什么为结尾？
         @return:
         """
+        if not isinstance(end_lines, (str, list, tuple)):
+            raise TypeError("等待蓝牙转串口模块的AT指令应答要么是一个字符串，要么是一个字符串数组，不支持其他类型")
         lines = []
-        is_1_str = True
-        if not isinstance(end_lines, str):
-            if not isinstance(end_lines, (list, tuple)):
-                raise TypeError("等待蓝牙转串口模块的AT指令应答要么是一个字符串，要么是一个字符串数组，不支持其他类型")
-            is_1_str = False
-        time_start = time.time()
-        line_buffer = bytearray()
-        while True:
-            # 超时内等待结果
-            if time.time() - time_start > timeout:
-                # 指令发送不正常或者应答结束标志行不对就会导致这个问题，当然，不排查转串口模块有问题
-                raise TimeoutError("等待超时，BLE转串口模块没有正确应答AT指令")
-
-            # 在超时内读取一行
-            data_read = self._ser.read()
-            if len(data_read) > 0:
-                line_buffer.extend(data_read)
-                # logger.info(line_buffer)
-            if not line_buffer.endswith(b"\r\n"):
-                time.sleep(0.001)
-                continue
-            resp_line = line_buffer.decode(encoding="utf-8", errors="ignore")
-            line_buffer.clear()  # 记得一行处理完毕后，清除掉BUFFER
-
-            # logger.info(f"应答行：{resp_line}")
-            # 检查是否需要实时处理
-            if on_line_callback is not None:
-                on_line_callback(self.extract_from_at_response(resp_line, end_lines))
-
-            # 检查是否需要停止处理
-            if callable(on_stop_callback) and on_stop_callback():
-                return None
-
-            # 追加到应答结果中
-            lines.append(resp_line)
-            # 检查是否结束
-            if is_1_str and end_lines in resp_line:
-                break
-
-            if not is_1_str:
-                finish = False
-                for end_line_start_with in end_lines:
-                    # logger.info(f"{resp_line} -- {end_line_start_with} --- {end_line_start_withs}")
-                    if end_line_start_with in resp_line:
-                        finish = True
+        demux = self.stream_demux
+        with self._rx_lock:
+            demux.begin(end_lines)
+            try:
+                time_start = time.time()
+                while True:
+                    response = demux.next_response()
+                    if response is None:
+                        # 超时内等待结果
+                        if time.time() - time_start > timeout:
+                            # 指令发送不正常或者应答结束标志行不对就会导致这个问题，当然，不排查转串口模块有问题
+                            raise TimeoutError("等待超时，BLE转串口模块没有正确应答AT指令")
+                        # 一次读出接收缓冲区中所有的数据，由分路器一次性切分成行
+                        data_read = self._ser.read(self.READ_CHUNK_SIZE)
+                        if len(data_read) > 0:
+                            demux.feed(data_read)
+                        else:
+                            time.sleep(0.001)  # 只在没有数据的时候让出CPU，否则积压的行会越来越多
+                        continue
+                    resp_line, is_end = response
+
+                    # 检查是否需要实时处理
+                    if on_line_callback is not None:
+                        on_line_callback(resp_line)
+
+                    # 检查是否需要停止处理
+                    if callable(on_stop_callback) and on_stop_callback():
+                        return None
+
+                    # 追加到应答结果中，分路器已经去除了回车换行与混在结束行前面的透传数据
+                    lines.append(resp_line)
+                    if is_end:
                         break
-                if finish:
-                    break
+            finally:
+                demux.end()
 
         return lines[0] if len(lines) == 1 else lines  # 这里我做一个封装，如果应答结果是单行的，那就直接返回一行字符串
 
+    def drain_late_response(self, end_lines: str | typing.List[str], timeout: float):
+        """
+            等待应答超时之后，读取并丢弃迟到的应答，直到收到应答结束行或者超时，
+            之后继续读取直到串口安静下来，把结束行之后残留的数据也读完
+        @param end_lines: 超时的指令的应答结束行
+        @param timeout: 最多等待迟到的应答多久
+        @return:
+        """
+        with self._rx_lock:
+            try:
+                self.wait_response(end_lines, timeout)
+                logger.info("已丢弃迟到的应答")
+            except TimeoutError:
+                pass
+            time_data = time.time()
+            while time.time() - time_data < self.DRAIN_QUIET_TIME:
+                data_read = self._ser.read(self.READ_CHUNK_SIZE)
+                if len(data_read) > 0:
+                    self.stream_demux.feed(data_read)
+                    time_data = time.time()
+                else:
+                    time.sleep(0.001)
+
     def send(self, cmd: str):
         """
             发送指令
         @param cmd: 指令本身，不带AT+开头的字符串，也不需要带回车换行结尾
         @return:
         """
-        cmd = f"AT+{cmd}\r\n"
+        cmd = f"AT+{cmd}\r\n".encode("ASCII")
         # logger.info(f"最终执行的指令是：{cmd}")
-        self._ser.write(cmd.encode("ASCII"))
+        wire_tracer = self._wire_tracer
+        if wire_tracer is not None:
+            wire_tracer.record(self._ser.port, wire_tracer.DIR_TX, cmd)
+        self._ser.write(cmd)
+
+    def pump(self) -> int:
+        """
+            读取一次串口中已经收到的数据并交给分路器，用于没有指令在等待应答时接收事件与透传数据，
+            正在等待应答时直接返回，数据由等待应答的线程处理
+        @return: 读取到的字节数
+        """
+        if not self._rx_lock.acquire(blocking=False):
+            return 0
+        try:
+            data_read = self._ser.read(self.READ_CHUNK_SIZE)
+            if len(data_read) > 0:
+                self.stream_demux.feed(data_read)
+            self.stream_demux.flush_partial()
+            return len(data_read)
+        finally:
+            self._rx_lock.release()
+
+    def on_rx_line(self, line: bytes):
+        wire_tracer = self._wire_tracer
+        if wire_tracer is not None:
+            # 扫描时上报的设备信息行以MAC地址开头，追踪器不记录时只计数，免得挤掉缓冲区中的指令与应答
+            if not wire_tracer.trace_scan_lines and self.has_start_scan_by_cmd and line[2:3] == b":":
+                wire_tracer.skip_scan_line()
+                return
+            wire_tracer.record(self._ser.port, wire_tracer.DIR_RX, line)
+
+    def on_stream_event(self, event: str):
+        logger.info(f"模块上报事件：{event}")
+        if self.callback_on_event is not None:
+            self.callback_on_event(event)
+
+    def on_stream_payload(self, data: bytes):
+        if self.callback_on_payload is not None:
+            self.callback_on_payload(data)
 
     @staticmethod
     def extract_from_at_response(line: str, resp_end_lines: str | typing.List[str]):
@@ -217,7 +607,7 @@ class BLEToUartAdapter:
         """
         if isinstance(resp_end_lines, str):
             if resp_end_lines in line:
-                ser_obj = re.search(r"(" + re.escape(resp_end_lines) + ".*?)\r\n", line)
+                ser_obj = compile_end_line_pattern(resp_end_lines).search(line)
                 # print(ser_obj)
                 if ser_obj is not None:
                     line = ser_obj.group(1)
@@ -226,7 +616,7 @@ class BLEToUartAdapter:
         else:
             for end_line in resp_end_lines:
                 if end_line in line:
-                    ser_obj = re.search(r"(" + re.escape(end_line) + ".*?)\r\n", line)
+                    ser_obj = compile_end_line_pattern(end_line).search(line)
                     # print(ser_obj)
                     if ser_obj is not None:
                         line = ser_obj.group(1)
@@ -234,6 +624,57 @@ class BLEToUartAdapter:
                     line = line.replace("\r\n", "")
         return line
 
+    def check_can_exec(self, cmd: str):
+        """
+            检查当前是否允许执行指令
+        @param cmd: 指令
+        @return:
+        """
+        # 扫描线程自己在两轮扫描之间执行的指令（比如切换扫描用的波特率）不会与扫描抢占串口
+        if self.scan_state != self.ScanState.STOPPED and threading.current_thread() is not self._scan_thread:
+            raise RuntimeError("在扫描的时候，不允许任何其他指令执行，请开发者做好停止扫描再执行指令的逻辑")
+        if cmd.startswith("+"):
+            logger.warning("'AT+'已经被自动添加到头部，请开发者检查是否是多余的添加，还是协议更新了，"
+                           "如果是协议更新请检查适配。")
+
+    def exec_no_delay(self, cmd: str, resp_end_lines: str | typing.List[str], timeout: float = 3,
+                      on_line_callback: typing.Callable[[str], None] = None):
+        """
+            不做前置等待，直接发送指令并且等待应答，调用者需要自己保证模块此时已经可以接受指令
+        @param on_line_callback: 在有一行应答时，如果需要关心实时的一个应答结果，可以直接实现此回调进行处理
+        @param timeout: 等待超时，启用了指令耗时统计时是超时的上限，实际的超时根据学习到的耗时决定
+        @param cmd: 指令
+        @param resp_end_lines: 接受的应答结束行
+        @return:
+        """
+        # 只有在指令表中声明了可以学习的指令才使用耗时统计，扫描控制这类不在指令表中的指令也不学习
+        at_cmd = AT_COMMAND_TABLE.get(command_latency.command_key(cmd))
+        latency_tracker = self.latency_tracker if at_cmd is not None and at_cmd.adaptive_timeout else None
+        if latency_tracker is not None:
+            # 还不知道模块的MAC地址时（比如识别波特率时），以串口号作为适配器ID
+            adapter_id = self.module_mac if self.module_mac is not None else self._ser.port
+            baudrate = self._ser.baudrate
+            timeout_learned = latency_tracker.timeout(adapter_id, cmd, baudrate, timeout)
+        else:
+            timeout_learned = timeout
+        with self._rx_lock:  # 发送之后立刻占住串口的读取，应答不会被空闲时的读取当作透传数据
+            self.send(cmd)
+            time_send = time.perf_counter()
+            # 等待应答，混在应答中的透传数据已经由分路器分离出去了
+            try:
+                resp = self.wait_response(resp_end_lines, timeout_learned, on_line_callback)
+            except TimeoutError:
+                if timeout_learned < timeout:
+                    logger.warning(f"指令 '{cmd}' 在学习到的超时 {timeout_learned:.2f}s 内没有应答")
+                    latency_tracker.record_timeout(adapter_id, cmd, baudrate, timeout_learned)
+                    # 模块可能只是慢了，释放读取锁之前把迟到的应答读完，否则会被当作下一条指令的应答
+                    self.drain_late_response(resp_end_lines, min(timeout_learned, timeout - timeout_learned))
+                raise
+        if latency_tracker is not None:
+            latency_tracker.record(adapter_id, cmd, baudrate, time.perf_counter() - time_send)
+        self.update_config_cache(cmd, resp)
+        return resp
+
     def exec(self, cmd: str, resp_end_lines: str | typing.List[str], timeout: float = 3,
              on_line_callback: typing.Callable[[str], None] = None):
         """
@@ -244,66 +685,225 @@ class BLEToUartAdapter:
         @param resp_end_lines: 接受的应答结束行
         @return:
         """
-        if self.scan_state != self.ScanState.STOPPED:
-            raise RuntimeError("在扫描的时候，不允许任何其他指令执行，请开发者做好停止扫描再执行指令的逻辑")
-        if cmd.startswith("+"):
-            logger.warning("'AT+'已经被自动添加到头部，请开发者检查是否是多余的添加，还是协议更新了，"
-                           "如果是协议更新请检查适配。")
+        self.check_can_exec(cmd)
         # 执行指令
         time.sleep(0.5)  # 新一的模块有点毛病，回复了指令不等于芯片在正常工作，因此我们需要先等一会儿
-        self.send(cmd)
-        # 等待应答
-        resp = self.wait_response(resp_end_lines, timeout, on_line_callback)
-        # 初步处理一下应答，因为应答数据可能包含透传过来的数据
-        resp = [resp] if isinstance(resp, str) else resp
-        for i in range(len(resp)):
-            line: str = resp[i]
-            resp[i] = self.extract_from_at_response(line, resp_end_lines)
+        return self.exec_no_delay(cmd, resp_end_lines, timeout, on_line_callback)
+
+    def exec_batch(self, cmds: typing.List[typing.Tuple], timeout: float = 3,
+                   stop_on_error: bool = False, use_cache: bool = True) -> typing.List[ATCommandResult]:
+        """
+            批量执行指令，只在第一条指令前做一次前置等待，后续的指令在上一条指令应答结束后立刻发送，
+            应答按照顺序与指令一一对应
+        @param cmds: 指令列表，每一项为 (指令, 应答结束行) 或者 (指令, 应答结束行, 超时)
+        @param timeout: 每条指令默认的等待超时
+        @param stop_on_error: 遇到模块上报错误时是否停止执行后续的指令
+        @param use_cache: 是否允许直接从配置缓存中得到应答，需要回读验证的场景应当禁用
+        @return: 与指令列表一一对应的执行结果，失败的指令在结果中携带异常而不是直接抛出
+        """
+        results = []
+        for item in cmds:
+            self.check_can_exec(item[0])
+            results.append(ATCommandResult(item[0], item[1]))
+
+        # 能直接由配置缓存得到应答的指令不需要真实的执行
+        resp_from_cache = [self.get_resp_from_config_cache(result.cmd) if use_cache else None for result in results]
+        if all(resp is not None for resp in resp_from_cache):
+            for i, result in enumerate(results):
+                result.resp = resp_from_cache[i]
+            return results
+
+        time.sleep(0.5)  # 新一的模块有点毛病，回复了指令不等于芯片在正常工作，因此我们需要先等一会儿
+        for i, result in enumerate(results):
+            if resp_from_cache[i] is not None:
+                result.resp = resp_from_cache[i]
+                continue
+            cmd_timeout = cmds[i][2] if len(cmds[i]) > 2 else timeout
+            try:
+                result.resp = self.exec_no_delay(result.cmd, result.resp_end_lines, cmd_timeout)
+            except TimeoutError as e:
+                # 超时后无法确认后续的应答是否还能和指令对齐，因此剩下的指令不再执行
+                result.error = e
+                for skipped in results[i + 1:]:
+                    skipped.error = AdapterException(f"指令 '{result.cmd}' 应答超时，未执行此指令")
+                break
+            if result.resp == self.RESP_ERROR:
+                result.error = AdapterException(f"执行 '{result.cmd}' BLE转串口模块上报错误")
+                if stop_on_error:
+                    for skipped in results[i + 1:]:
+                        skipped.error = AdapterException(f"指令 '{result.cmd}' 执行失败，未执行此指令")
+                    break
+        return results
+
+    def call(self, key: str, *args, timeout: float | None = None, use_cache: bool = True) -> typing.Any:
+        """
+            按照指令表执行指令，并且返回解码后的应答
+        @param key: 指令在指令表中的键，比如 'UUIDS?'，'UUIDS='，'AUTO_DEL'
+        @param args: 指令的参数
+        @param timeout: 应答超时，为None时使用指令表中声明的超时
+        @param use_cache: 是否允许直接从配置缓存中得到应答
+        @return: 解码后的应答
+        """
+        at_cmd = AT_COMMAND_TABLE[key]
+        cmd = at_cmd.encode(*args)
+        resp = self.get_resp_from_config_cache(cmd) if use_cache else None
+        if resp is None:
+            resp = self.exec(cmd, at_cmd.end_lines, at_cmd.timeout if timeout is None else timeout)
+        return at_cmd.decode(resp, args)
+
+    def call_batch(self, calls: typing.List[typing.Tuple], stop_on_error: bool = False,
+                   use_cache: bool = True) -> typing.List[ATCommandResult]:
+        """
+            按照指令表批量执行指令，应答解码后放在结果的 value 中，解码失败的异常放在结果的 error 中
+        @param calls: 调用列表，每一项为 (指令在指令表中的键, 参数...)
+        @param stop_on_error: 遇到模块上报错误时是否停止执行后续的指令
+        @param use_cache: 是否允许直接从配置缓存中得到应答
+        @return: 与调用列表一一对应的执行结果
+        """
+        at_cmds = [AT_COMMAND_TABLE[call[0]] for call in calls]
+        results = self.exec_batch([at_cmd.batch_item(*call[1:]) for at_cmd, call in zip(at_cmds, calls)],
+                                  stop_on_error=stop_on_error, use_cache=use_cache)
+        for at_cmd, call, result in zip(at_cmds, calls, results):
+            if result.resp is None:
+                continue  # 没有执行的指令，异常已经在结果中了
+            try:
+                result.value = at_cmd.decode(result.resp, call[1:])
+                result.error = None
+            except Exception as e:
+                result.error = e
+        return results
+
+    @staticmethod
+    def parse_config_cmd(cmd: str) -> typing.Tuple[str, str | None]:
+        """
+            解析指令中的配置项与配置值
+        @param cmd: 指令，比如 'UUIDS=FFF0' 或者 'UUIDS?'
+        @return: (配置项, 配置值)，读取指令的配置值为None
+        """
+        if cmd.endswith("?"):
+            return cmd[:-1], None
+        key, _, value = cmd.partition("=")
+        return key, value
+
+    def get_resp_from_config_cache(self, cmd: str) -> str | None:
+        """
+            尝试从配置缓存中得到指令的应答，设置的值与缓存一致时，认为模块会应答OK，
+            读取的值有缓存时，构造出与模块一致的应答行
+        @param cmd: 指令
+        @return: 无法从缓存中得到应答时返回None
+        """
+        if self.config_cache is None:
+            return None
+        key, value = self.parse_config_cmd(cmd)
+        value_cached = self.config_cache.get(self.module_mac, key)
+        if value_cached is None:
+            return None
+        if value is None:
+            return f"+{key}:{value_cached}"
+        if value == value_cached:
+            return self.RESP_OK
+        return None
 
-        return resp[0] if len(resp) == 1 else resp
+    def update_config_cache(self, cmd: str, resp: str | typing.List[str]):
+        """
+            根据指令成功执行的应答更新配置缓存
+        @param cmd: 指令
+        @param resp: 应答
+        @return:
+        """
+        if self.config_cache is None:
+            return
+        key, value = self.parse_config_cmd(cmd)
+        if key == "REBOOT":
+            # 软复位后模块中的配置以模块为准，缓存中只保留不会改变的配置项
+            keys = [k for k in self.config_cache.KEYS if k not in self.config_cache.KEYS_KEEP_ON_REBOOT]
+            self.config_cache.invalidate(self.module_mac, keys)
+        elif not isinstance(resp, str):
+            return
+        elif key == "AUTO_DEL":
+            if resp == self.RESP_OK:
+                self.config_cache.invalidate(self.module_mac, ["AUTO_MAC"])
+        elif value is None:
+            if resp.startswith(f"+{key}:"):
+                self.config_cache.put(self.module_mac, key, self.get_data(resp))
+        elif resp == self.RESP_OK:
+            self.config_cache.put(self.module_mac, key, value)
 
     def on_scan_found(self, device: BLEDevice):
         # logger.info(f"扫描到的设备信息：{device}")
+        self.scan_events.publish(device.mac, device.mac_type, device.rssi, device.name)
         if self.callback_on_device_found is not None:  # 回调通知一下设备发现的消息
             self.callback_on_device_found(device)
 
+    def parse_scan_line(self, line: str) -> BLEDevice | None:
+        """
+            解析一行扫描结果，并且更新到设备映射表中
+        @param line: 扫描结果行，已经去除了尾部的回车换行
+        @return: 更新后的设备实例，不是设备信息的行返回None
+        """
+        # 跳过一些非设备信息的打印
+        if line.startswith("+"):
+            return None
+
+        # 解析设备信息，先解析一定存在的基础信息，残缺的行在放入映射表之前就会抛出异常
+        info_arr = line.split(' ', 3)
+        mac_from_line = info_arr[0]
+        if len(mac_from_line) != 17:
+            raise ValueError(f"MAC地址的长度不对：{mac_from_line}")
+        mac_type = int(info_arr[1])
+        rssi = int(info_arr[2])
+        # 查看是否已经有当前设备了，如果有，取出之前的设备实例直接更新
+        if mac_from_line in self.scan_device_map:
+            ble_device = self.scan_device_map[mac_from_line]
+        else:
+            ble_device = BLEDevice()
+            self.scan_device_map[mac_from_line] = ble_device  # 将设备实例放入到映射表中
+        # 赋值一定存在的基础信息
+        ble_device.mac = mac_from_line
+        ble_device.mac_type = mac_type
+        ble_device.rssi = rssi
+        # 名字不一定存在，因为需要确认
+        if len(info_arr) == 4:
+            ble_device.name = info_arr[3]
+        # logger.info(ble_device)
+        return ble_device
+
+    def on_scan_line(self, line: str):
+        """
+            扫描线程中每收到一行时的处理
+        @param line: 扫描结果行
+        @return:
+        """
+        try:
+            ble_device = self.parse_scan_line(line)
+        except (ValueError, IndexError):
+            # 波特率承载不了扫描结果时，接收缓冲区溢出，行会被截断或者粘连，丢弃这一行并且计数
+            self._scan_lines_lost += 1
+            return
+        if ble_device is not None:
+            self._scan_lines_kept += 1
+            self.on_scan_found(ble_device)
+
     def thread_scan(self):
         """
             子线程，在此线程中进行扫描操作
         @return:
         """
-
-        def on_scan_line(line: str):
-            # 跳过一些非设备信息的打印
-            if line.startswith("+"):
-                return
-
-            # 解析设备信息
-            info_arr = line.split(' ', 3)
-            # 查看是否已经有当前设备了，如果有，取出之前的设备实例直接更新
-            mac_from_line = info_arr[0]
-            if mac_from_line in self.scan_device_map:
-                ble_device = self.scan_device_map[mac_from_line]
-            else:
-                ble_device = BLEDevice()
-                self.scan_device_map[mac_from_line] = ble_device  # 将设备实例放入到映射表中
-            # 赋值一定存在的基础信息
-            ble_device.mac = mac_from_line
-            ble_device.mac_type = int(info_arr[1])
-            ble_device.rssi = int(info_arr[2])
-            # 名字不一定存在，因为需要确认
-            if len(info_arr) == 4:
-                ble_device.name = info_arr[3]
-            # logger.info(ble_device)
-            self.on_scan_found(ble_device)
+        on_scan_line = self.on_scan_line
 
         while self._ser.is_open:
-            if self.scan_state == self.ScanState.RUNNING:
-                try:
-                    # 执行扫描
-                    time.sleep(0.5)
-                    self.send("SCAN=1")
-                    self.has_stop_scan_by_cmd = False
+            try:
+                if self.scan_state == self.ScanState.RUNNING:
+                    if not self._scan_session_begun:
+                        self.begin_scan_session()
+                    # 执行扫描，等待期间如果被要求停止扫描，那就不需要再开始了
+                    with self._scan_state_cond:
+                        self._scan_state_cond.wait_for(lambda: self.scan_state != self.ScanState.RUNNING, 0.5)
+                        if self.scan_state != self.ScanState.RUNNING:
+                            continue
+                        self.send("SCAN=1")
+                        self.has_start_scan_by_cmd = True
+                        self.has_stop_scan_by_cmd = False
                     try:
                         time_start = time.time()
 
@@ -313,59 +913,239 @@ class BLEToUartAdapter:
 
                             # 快速重启搜索  # TODO 此逻辑可能导致信号差的设备无法搜索到，待验证稳定性
                             if time_end > 0.8:
-                                if not self.has_stop_scan_by_cmd:
-                                    self.send("SCAN=0")
-                                    self.has_stop_scan_by_cmd = True
+                                self.send_scan_stop_once()
                                 return False
 
-                            # 检测到正在停止扫描，我们需要检查扫描的剩余时间，如果还要超过1S才能结束，
-                            # 那我们就提前发送指令结束，否则的话直接等扫描过程自己结束即可
+                            # 正在停止扫描时，stop_scan 已经发送过结束扫描的指令了，此处只是兜底
                             if self.scan_state == self.ScanState.STOPPING:
-                                if time_end > 1 and not self.has_stop_scan_by_cmd:
-                                    self.send("SCAN=0")
-                                    self.has_stop_scan_by_cmd = True
+                                self.send_scan_stop_once()
                                 return False  # 让外部等待应答的处理函数等待结束执行
 
                         self.wait_response("+SCAN END", 10, on_scan_line, on_stop_check)
                         # logger.info(f"本次蓝牙设备扫描耗时：{time.time() - time_start}")
                     except TimeoutError:
                         pass  # 忽略此处的超时异常
-                except serial.SerialException as se:
-                    if self.is_not_port_permission_error(str(se)):  # 遇到无权限的问题，就可能是串口重启错误了
-                        self.close()
-                        self.scan_state = self.ScanState.STOPPED
-                except Exception as e:
-                    logger.error(f"在扫描线程中出现了可能打断行解析的致命异常：\n{traceback.format_exception(e)}")
+                    finally:
+                        with self._scan_state_cond:
+                            self.has_start_scan_by_cmd = False
+                else:
+                    if self.scan_state != self.ScanState.STOPPED:
+                        # 先恢复用户的波特率再通知扫描已经停止，停止后立刻执行的指令不会用错波特率
+                        if self._scan_session_begun:
+                            self.end_scan_session()
+                        self.set_scan_state(self.ScanState.STOPPED)
+                    # 等待开始扫描的通知，超时是为了能及时发现串口已经被关闭
+                    with self._scan_state_cond:
+                        self._scan_state_cond.wait_for(lambda: self.scan_state == self.ScanState.RUNNING, 0.1)
+                    # 空闲时接收事件与透传数据，串口丢失（比如USB松动）时读取会抛出异常
+                    if self._ser.is_open:
+                        self.pump()
+            except (serial.SerialException, OSError) as e:
+                self.on_port_lost(e)
+                break
+            except Exception as e:
+                logger.error(f"在扫描线程中出现了可能打断行解析的致命异常：\n{traceback.format_exception(e)}")
+
+        # 串口关闭后扫描线程就退出了，不能让等待扫描停止的调用者一直等下去，也没有办法再恢复用户的波特率了
+        self._scan_session_begun = False
+        self.scan_baudrate_restore_index = None
+        self.set_scan_state(self.ScanState.STOPPED)
+
+    def begin_scan_session(self):
+        """
+            扫描开始前的准备，在扫描线程中调用，按照配置临时切换到扫描用的高波特率，切换失败时继续使用原来的波特率扫描
+        @return:
+        """
+        self._scan_session_begun = True
+        self._scan_lines_kept = 0
+        self._scan_lines_lost = 0
+        baudrate_index = self.scan_baudrate_index
+        baudrate_index_user = self.baudrate_current_index
+        if baudrate_index is None or baudrate_index_user == -1 or baudrate_index == baudrate_index_user:
+            return
+        try:
+            self.try_change_baudrate(baudrate_index)
+            self.scan_baudrate_restore_index = baudrate_index_user
+            logger.info(f"扫描期间临时使用波特率：{self.BAUDRATE_MAP[baudrate_index]}")
+        except (serial.SerialException, OSError):
+            raise
+        except Exception as e:
+            logger.warning(f"切换到扫描用的波特率 {self.BAUDRATE_MAP[baudrate_index]} 失败，"
+                           f"继续使用 {self.BAUDRATE_MAP[baudrate_index_user]} 扫描：{e}")
+            self.recover_baudrate(baudrate_index_user)
+
+    def end_scan_session(self):
+        """
+            扫描停止后的收尾，在扫描线程中调用，记录本次扫描的丢行情况，恢复用户的波特率
+        @return:
+        """
+        self._scan_session_begun = False
+        if self._scan_lines_kept + self._scan_lines_lost > 0:
+            baudrate = self._ser.baudrate
+            stats = self.scan_line_stats.setdefault(baudrate, [0, 0])
+            stats[0] += self._scan_lines_kept
+            stats[1] += self._scan_lines_lost
+            logger.info(f"本次扫描使用波特率 {baudrate}，保留 {self._scan_lines_kept} 行，"
+                        f"丢弃 {self._scan_lines_lost} 行")
+        baudrate_index_user = self.scan_baudrate_restore_index
+        if baudrate_index_user is None:
+            return
+        self.scan_baudrate_restore_index = None
+        try:
+            self.try_change_baudrate(baudrate_index_user)
+            logger.info(f"扫描结束，已恢复波特率：{self.BAUDRATE_MAP[baudrate_index_user]}")
+        except (serial.SerialException, OSError):
+            raise
+        except Exception as e:
+            logger.error(f"扫描结束后恢复波特率 {self.BAUDRATE_MAP[baudrate_index_user]} 失败：{e}")
+            self.recover_baudrate(baudrate_index_user)
+
+    def recover_baudrate(self, baudrate_index: int):
+        """
+            切换波特率失败后，模块与pyserial端的波特率可能不一致，先尝试期望的波特率，不通时再重新识别
+        @param baudrate_index: 期望的波特率参数
+        @return:
+        """
+        self._ser.baudrate = self.BAUDRATE_MAP[baudrate_index]
+        try:
+            self.get_version(1, False)
+            self.baudrate_current_index = baudrate_index
+        except TimeoutError:
+            self.baudrate_current_index = self.detect_baudrate()
+            if self.baudrate_current_index == -1:
+                logger.error("无法重新识别波特率，请重新连接适配器")
             else:
-                self.scan_state = self.ScanState.STOPPED
-                time.sleep(0.01)
+                logger.warning(f"重新识别到的波特率是：{self.BAUDRATE_MAP[self.baudrate_current_index]}")
 
-    @staticmethod
-    def is_not_port_permission_error(error_msg: str):
+    def scan_line_loss(self) -> typing.Dict[int, typing.Tuple[int, int, float]]:
+        """
+            各个波特率下扫描结果的丢行情况，用于比较不同波特率的扫描效果
+        @return: 波特率: (保留的行数, 丢弃的行数, 丢弃的比例)
+        """
+        return {baudrate: (kept, lost, lost / (kept + lost))
+                for baudrate, (kept, lost) in self.scan_line_stats.items()}
+
+    def set_scan_state(self, scan_state: int):
+        """
+            更新扫描状态，并且通知等待状态变化的线程
+        @param scan_state: 扫描状态，参考 ScanState
+        @return:
+        """
+        with self._scan_state_cond:
+            self.scan_state = scan_state
+            if scan_state == self.ScanState.STOPPED:
+                self._scan_stopped_event.set()
+            else:
+                self._scan_stopped_event.clear()
+            self._scan_state_cond.notify_all()
+
+    def send_scan_stop_once(self):
+        """
+            发送结束扫描的指令，一轮扫描中只会发送一次
+        @return:
+        """
+        with self._scan_state_cond:
+            if self.has_start_scan_by_cmd and not self.has_stop_scan_by_cmd:
+                self.send("SCAN=0")
+                self.has_stop_scan_by_cmd = True
+
+    def on_port_lost(self, error: Exception):
+        """
+            串口通信出现异常，一般是串口已经丢失（比如USB松动），关闭串口并通知恢复
+        @param error: 导致丢失的异常
+        @return:
+        """
+        logger.error(f"串口 {self._ser.port} 通信异常，关闭串口：{error}")
+        with self._scan_state_cond:
+            if self.scan_state == self.ScanState.RUNNING:
+                self.scan_interrupted = True
+        if self.scan_baudrate_restore_index is not None:
+            # 串口丢失时没有办法恢复用户的波特率，恢复通信时会以握手或者重新识别为准
+            logger.warning("串口丢失时正在使用扫描用的波特率，没能恢复用户的波特率")
+            self.scan_baudrate_restore_index = None
+        self._scan_session_begun = False
+        self.close()
+        self.set_scan_state(self.ScanState.STOPPED)
+        if self.callback_on_port_lost is not None:
+            self.callback_on_port_lost(error)
+
+    def wait_scan_thread_exit(self, timeout: float | None = None) -> bool:
+        """
+            等待扫描线程退出，串口关闭后扫描线程会很快退出
+        @param timeout: 最多等多久，为None时一直等
+        @return: 是否已经退出
         """
-            检查是否是串口无权限的错误消息
-        @param error_msg: 错误消息
+        thread = self._scan_thread
+        if thread is None or thread is threading.current_thread():
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def resume(self):
+        """
+            串口重新打开后恢复通信，串口对象会保留之前的波特率，所以只需要一批握手指令，握手超时才重新识别波特率，
+            同时检查是否还是之前的那个模块
         @return:
         """
-        return 'PermissionError' in error_msg
+        module_mac = self.module_mac
+        results = self.call_batch([("VER?",), ("MAC?",)], use_cache=False)
+        if isinstance(results[0].error, TimeoutError):
+            logger.warning("使用之前的波特率握手失败，重新识别波特率")
+            self.check_is_ble_to_uart_device()
+            module_mac_now = self.call("MAC?")
+        else:
+            for result in results:
+                if not result.ok:
+                    raise result.error
+            module_mac_now = results[1].value
+        if module_mac is not None and module_mac_now != module_mac:
+            raise AdapterMismatchException(f"串口上已经是另一个适配器了：{module_mac_now}，之前的是：{module_mac}")
+        self.module_mac = module_mac_now
 
     def start_scan(self):
         """
             启动蓝牙扫描，同时禁止其他的指令执行
         @return:
         """
-        self.scan_state = self.ScanState.RUNNING
+        self.set_scan_state(self.ScanState.RUNNING)
 
-    def stop_scan(self):
+    def stop_scan(self) -> threading.Event:
         """
-            停止蓝牙扫描，并且等待彻底停止完成
-        @return:
+            停止蓝牙扫描，立刻发送结束扫描的指令，但是不等待扫描彻底停止
+        @return: 扫描彻底停止（扫描线程收到 '+SCAN END'）时置位的事件，需要等待的调用者可以 wait() 此事件
         """
-        if self.scan_state == self.ScanState.STOPPED:
-            return
-        self.scan_state = self.ScanState.STOPPING
-        while self.scan_state != self.ScanState.STOPPED:  # 一直等，等到扫描彻底结束
-            time.sleep(0.01)
+        with self._scan_state_cond:
+            if self.scan_state == self.ScanState.STOPPED:
+                return self._scan_stopped_event
+            self.set_scan_state(self.ScanState.STOPPING)
+            try:
+                self.send_scan_stop_once()
+            except Exception as e:
+                logger.error(f"发送结束扫描的指令失败：{e}")
+        return self._scan_stopped_event
+
+    def subscribe(self, policy: scan_events.SubscriptionPolicy,
+                  callback: typing.Callable[[scan_events.ScanEvent], None] | None = None
+                  ) -> scan_events.DeviceSubscription:
+        """
+            按照策略订阅设备的变化，比如只关心新设备，或者信号强度变化超过一定的值，
+            同一个设备在节流间隔内的多次变化会合并为一次
+        @param policy: 订阅策略
+        @param callback: 传入时在订阅自己的线程中推送，否则由调用者自己调用 poll() 拉取
+        @return: 订阅，不再需要时调用 close()
+        """
+        subscription = scan_events.DeviceSubscription(self.scan_events, policy)
+        if callback is not None:
+            subscription.start(callback)
+        return subscription
+
+    def wait_scan_stopped(self, timeout: float | None = None) -> bool:
+        """
+            等待扫描彻底停止
+        @param timeout: 最多等多久，为None时一直等
+        @return: 是否已经停止
+        """
+        return self._scan_stopped_event.wait(timeout)
 
     @staticmethod
     def get_data(line: str):
@@ -389,7 +1169,7 @@ class BLEToUartAdapter:
             self._ser.baudrate = self.BAUDRATE_MAP[baudrate_index]
             # 然后尝试通信
             try:
-                self.get_version(3)
+                self.get_version(3, False)
                 return baudrate_index
             except TimeoutError:
                 pass
@@ -408,13 +1188,12 @@ class BLEToUartAdapter:
             for try_count in range(3):
                 try:
                     # 先执行指令修改波特率，并且等待有成功的应答
-                    resp = self.exec_set(f"UART={baudrate}", "设置波特率")
-                    logger.info(f"切换波特率的指令已经完成执行：{resp}")
+                    self.call("UART=", baudrate)
+                    logger.info(f"切换波特率的指令已经完成执行：{baudrate}")
                     # 然后再在pyserial端切换到对应的波特率
                     self._ser.baudrate = self.BAUDRATE_MAP[baudrate]
                     # 回读验证是否更改成功
-                    resp = self.exec_get_no_error("UART")
-                    baudrate_index_from_device = int(resp)
+                    baudrate_index_from_device = self.call("UART?", use_cache=False)
                     logger.info(f"切换波特率成功，当前的波特率是：{self.BAUDRATE_MAP[baudrate_index_from_device]}")
                     self.baudrate_current_index = baudrate_index_from_device
                     return
@@ -429,7 +1208,7 @@ class BLEToUartAdapter:
             软复位BLE转串口的模块
         @return:
         """
-        self.exec("REBOOT=1", "+READY")
+        self.call("REBOOT=", 1)
 
     # 连接设备的应答
     RESP_CONNECTED = "+CONNECTED"
@@ -442,32 +1221,21 @@ class BLEToUartAdapter:
         @param typ: MAC地址的类型
         @return:
         """
-        cmd = f"CONN={mac},{typ}"
-        resp = self.exec(cmd, [self.RESP_CONNECTED, self.RESP_CON_TIMEOUT], timeout=10)
-        if resp == self.RESP_CON_TIMEOUT:
-            raise TimeoutError(f"BLE转串口模块上报连接到MAC为{mac}，MAC Type为{typ}的设备超时")
+        self.call("CONN=", mac, typ)
 
     def get_slave_device_connected(self) -> str | None:
         """
             获取当前已连接的蓝牙设备
         @return: 蓝牙地址
         """
-        resp = self.exec("DEV?", ["+DEV", self.RESP_ERROR])
-        if resp == self.RESP_ERROR:
-            return None
-        info_arr = self.get_data(resp).split(',')
-        if info_arr[0] == '0':  # 蓝牙转串口是主设备，连接到的目标控制器或者仪表是从设备，因此在新一的手册中，从设备应当是字符串 '0'
-            return info_arr[1]
-        return None
+        return self.call("DEV?")
 
     def disconnect_slave_device(self):
         """
             断开所有的从设备连接，也就是断开适配器主动连接的目标蓝牙设备
         @return:
         """
-        resp = self.exec(f"DISCONN=0", ["+DISCONN", self.RESP_ERROR])
-        if resp == self.RESP_ERROR:
-            raise AdapterException("断开设备失败，可能设备并没有连接")
+        self.call("DISCONN=", 0)
 
     def get_device_by_name(self, name: str) -> BLEDevice | None:
         """
@@ -483,32 +1251,39 @@ class BLEToUartAdapter:
 
     def exec_set(self, cmd: str, action_name: str, timeout: float = 3):
         """
-            通用设置指令的执行封装函数
+            通用设置指令的执行封装函数，如果设置的值与配置缓存中的一致，则跳过执行
         @param timeout: 应答超时，以秒为单位
         @param cmd: 要执行的指令，不带AT+开头，不带\r\n结尾
         @param action_name: 操作的名字，在出现异常时，此名称将携带在异常消息中一起抛出
         @return:
         """
+        if self.get_resp_from_config_cache(cmd) == self.RESP_OK:
+            return
         resp = self.exec(cmd, [self.RESP_ERROR, self.RESP_OK], timeout)
         if resp == self.RESP_ERROR:
             raise AdapterException(f"执行 '{action_name}' BLE转串口模块上报错误")
 
-    def exec_get_no_error(self, cmd: str, timeout: float = 3):
+    def exec_get_no_error(self, cmd: str, timeout: float = 3, use_cache: bool = True):
         """
             执行获取指令
+        @param use_cache: 是否允许直接从配置缓存中获取，需要回读验证的场景应当禁用
         @param timeout: 应答超时，以秒为单位
         @param cmd: 要执行的指令，不到AT+开头，不带 ?\r\n结尾
         @return:
         """
-        resp = self.exec(f"{cmd}?", f"+{cmd}", timeout)
+        resp = self.get_resp_from_config_cache(f"{cmd}?") if use_cache else None
+        if resp is None:
+            resp = self.exec(f"{cmd}?", f"+{cmd}", timeout)
         return self.get_data(resp)
 
-    def get_version(self, timeout: float = 1):
+    def get_version(self, timeout: float = 1, use_cache: bool = True):
         """
             获取当前蓝牙转串口的适配器的固件版本号
+        @param timeout: 应答超时，以秒为单位
+        @param use_cache: 是否允许直接从配置缓存中获取
         @return:
         """
-        return self.exec_get_no_error("VER", timeout)
+        return self.call("VER?", timeout=timeout, use_cache=use_cache)
 
     def change_adv_interval(self, adv_interval: int):
         """
@@ -516,7 +1291,7 @@ class BLEToUartAdapter:
         @param adv_interval: 广播间隔，以毫秒为单位，支持20-10240毫米
         @return:
         """
-        self.exec_set(f"INTVL={adv_interval}", f"设置广播间隔为{adv_interval}")
+        self.call("INTVL=", adv_interval)
 
     def set_auto_reconnect_device(self, device_mac: str, mac_type: int):
         """
@@ -525,7 +1300,7 @@ class BLEToUartAdapter:
         @param mac_type: 设备的类型
         @return:
         """
-        self.exec_set(f"AUTO_MAC={device_mac},{mac_type}", "设置自动重连的设备")
+        self.call("AUTO_MAC=", device_mac, mac_type)
 
     def set_auto_reconnect_enable(self, enable: bool):
         """
@@ -533,21 +1308,21 @@ class BLEToUartAdapter:
         @param enable: 是否使能
         @return:
         """
-        self.exec_set(f"AUTO_CFG={1 if enable else 0}", f"设置自动重连功能为 {'使能' if enable else '禁用'}")
+        self.call("AUTO_CFG=", enable)
 
     def get_auto_reconnect_enable(self) -> bool:
         """
             判断当前是否启用自动回连
         @return:
         """
-        return self.exec_get_no_error("AUTO_CFG") == '1'
+        return self.call("AUTO_CFG?")
 
     def del_auto_reconnect_list(self):
         """
             删除自动重连列表
         @return:
         """
-        self.exec_set(f"AUTO_DEL", "删除自动重连列表")
+        self.call("AUTO_DEL")
 
     def set_transfer_main_service_uuid(self, uuid_s):
         """
@@ -555,14 +1330,14 @@ class BLEToUartAdapter:
         @param uuid_s: 服务的UUID，16bit 格式或 128bit 格式的 UUID
         @return:
         """
-        self.exec_set(f"UUIDS={uuid_s}", "设置蓝牙透传主服务UUID")
+        self.call("UUIDS=", uuid_s)
 
     def get_transfer_main_service_uuid(self):
         """
             获取透传主服务的UUID
         @return:
         """
-        return self.exec_get_no_error("UUIDS")
+        return self.call("UUIDS?")
 
     def set_transfer_characteristic_w_uuid(self, uuid_w):
         """
@@ -570,14 +1345,14 @@ class BLEToUartAdapter:
         @param uuid_w: 特征的UUID，，16bit 格式或 128bit 格式的 UUID
         @return:
         """
-        self.exec_set(f"UUIDW={uuid_w}", "设置蓝牙透传写特征UUID")
+        self.call("UUIDW=", uuid_w)
 
     def get_transfer_characteristic_w_uuid(self):
         """
             获取透传服务的写特征的UUID
         @return:
         """
-        return self.exec_get_no_error("UUIDW")
+        return self.call("UUIDW?")
 
     def set_transfer_characteristic_n_uuid(self, uuid_n):
         """
@@ -585,14 +1360,14 @@ class BLEToUartAdapter:
         @param uuid_n: 特征的UUID，，16bit 格式或 128bit 格式的 UUID
         @return:
         """
-        self.exec_set(f"UUIDN={uuid_n}", "设置蓝牙透传通知特征UUID")
+        self.call("UUIDN=", uuid_n)
 
     def get_transfer_characteristic_n_uuid(self):
         """
             获取透传服务的通知特征的UUID
         @return:
         """
-        return self.exec_get_no_error("UUIDN")
+        return self.call("UUIDN?")
 
     def is_opened(self) -> bool:
         """
@@ -604,6 +1379,119 @@ class BLEToUartAdapter:
         return self._ser.is_open
 
 
+def encode_bool(enable) -> str:
+    """
+        编码开关类的参数，支持 bool，int 以及 '0'/'1' 字符串
+    @param enable: 是否使能
+    @return:
+    """
+    return '1' if int(enable) else '0'
+
+
+def encode_mac_and_type(mac: str, typ: int | None = None) -> str:
+    """
+        编码 MAC地址,MAC地址类型 格式的参数
+    @param mac: 设备的MAC地址，typ为None时可以是已经拼接好的 'MAC地址,MAC地址类型'
+    @param typ: MAC地址的类型
+    @return:
+    """
+    if typ is None:
+        mac, _, typ = str(mac).partition(',')
+    return f"{mac.strip()},{int(typ)}"
+
+
+def encode_baudrate_index(baudrate: int) -> str:
+    """
+        编码波特率参数
+    @param baudrate: 波特率参数，并非波特率本身
+    @return:
+    """
+    if int(baudrate) not in BLEToUartAdapter.BAUDRATE_MAP:
+        raise ValueError(f"根据新一的手册，波特率只能是 {BLEToUartAdapter.BAUDRATE_MAP}")
+    return str(int(baudrate))
+
+
+def encode_adv_interval(adv_interval: int) -> str:
+    """
+        编码广播间隔参数
+    @param adv_interval: 广播间隔，以毫秒为单位，支持20-10240毫秒
+    @return:
+    """
+    if not 20 <= int(adv_interval) <= 10240:
+        raise ValueError(f"广播间隔只支持20-10240毫秒，当前为 {adv_interval}")
+    return str(int(adv_interval))
+
+
+def decode_get_bool(resp: str | typing.List[str], _) -> bool:
+    return BLEToUartAdapter.get_data(get_last_line(resp)) == '1'
+
+
+def decode_get_int(resp: str | typing.List[str], _) -> int:
+    return int(BLEToUartAdapter.get_data(get_last_line(resp)))
+
+
+def decode_ignore(_, __):
+    return None
+
+
+def decode_connect(resp: str | typing.List[str], args: tuple):
+    if get_last_line(resp) == BLEToUartAdapter.RESP_CON_TIMEOUT:
+        raise TimeoutError(f"BLE转串口模块上报连接到MAC为{args[0]}，MAC Type为{args[1]}的设备超时")
+
+
+def decode_slave_device_connected(resp: str | typing.List[str], _) -> str | None:
+    line = get_last_line(resp)
+    if line == BLEToUartAdapter.RESP_ERROR:
+        return None
+    info_arr = BLEToUartAdapter.get_data(line).split(',')
+    if info_arr[0] == '0':  # 蓝牙转串口是主设备，连接到的目标控制器或者仪表是从设备，因此在新一的手册中，从设备应当是字符串 '0'
+        return info_arr[1]
+    return None
+
+
+def decode_disconnect(resp: str | typing.List[str], _):
+    if get_last_line(resp) == BLEToUartAdapter.RESP_ERROR:
+        raise AdapterException("断开设备失败，可能设备并没有连接")
+
+
+def create_at_command_table(*at_cmds: ATCommand) -> typing.Dict[str, ATCommand]:
+    return {at_cmd.key: at_cmd for at_cmd in at_cmds}
+
+
+_RESP_SET = [BLEToUartAdapter.RESP_ERROR, BLEToUartAdapter.RESP_OK]
+_Kind = ATCommand.Kind
+
+# 指令表，键为 ATCommand.key，BLEToUartAdapter.call 按照此表执行指令
+AT_COMMAND_TABLE: typing.Dict[str, ATCommand] = create_at_command_table(
+    ATCommand("VER", _Kind.GET, "+VER", "获取固件版本号", timeout=1),
+    ATCommand("MAC", _Kind.GET, "+MAC", "获取适配器的MAC地址"),
+    ATCommand("TXPOWER", _Kind.GET, "+TXPOWER", "获取发射功率"),
+    ATCommand("UART", _Kind.GET, "+UART", "获取波特率", decoder=decode_get_int),
+    ATCommand("UART", _Kind.SET, _RESP_SET, "设置波特率", encoder=encode_baudrate_index),
+    ATCommand("INTVL", _Kind.GET, "+INTVL", "获取广播间隔", decoder=decode_get_int),
+    ATCommand("INTVL", _Kind.SET, _RESP_SET, "设置广播间隔", encoder=encode_adv_interval),
+    ATCommand("UUIDS", _Kind.GET, "+UUIDS", "获取蓝牙透传主服务UUID"),
+    ATCommand("UUIDS", _Kind.SET, _RESP_SET, "设置蓝牙透传主服务UUID", encoder=str),
+    ATCommand("UUIDW", _Kind.GET, "+UUIDW", "获取蓝牙透传写特征UUID"),
+    ATCommand("UUIDW", _Kind.SET, _RESP_SET, "设置蓝牙透传写特征UUID", encoder=str),
+    ATCommand("UUIDN", _Kind.GET, "+UUIDN", "获取蓝牙透传通知特征UUID"),
+    ATCommand("UUIDN", _Kind.SET, _RESP_SET, "设置蓝牙透传通知特征UUID", encoder=str),
+    ATCommand("AUTO_CFG", _Kind.GET, "+AUTO_CFG", "获取自动重连功能", decoder=decode_get_bool),
+    ATCommand("AUTO_CFG", _Kind.SET, _RESP_SET, "设置自动重连功能", encoder=encode_bool),
+    ATCommand("AUTO_MAC", _Kind.GET, "+AUTO_MAC", "获取自动重连的设备"),
+    ATCommand("AUTO_MAC", _Kind.SET, _RESP_SET, "设置自动重连的设备", encoder=encode_mac_and_type),
+    ATCommand("AUTO_DEL", _Kind.SET, _RESP_SET, "删除自动重连列表"),
+    ATCommand("REBOOT", _Kind.ACTION, BLEToUartAdapter.RESP_READY, "软复位",
+              encoder=str, decoder=decode_ignore, adaptive_timeout=False),
+    ATCommand("CONN", _Kind.ACTION, [BLEToUartAdapter.RESP_CONNECTED, BLEToUartAdapter.RESP_CON_TIMEOUT],
+              "连接到设备", timeout=10, encoder=encode_mac_and_type, decoder=decode_connect, adaptive_timeout=False),
+    ATCommand("DEV", _Kind.GET, ["+DEV", BLEToUartAdapter.RESP_ERROR], "获取已连接的设备",
+              decoder=decode_slave_device_connected),
+    ATCommand("DISCONN", _Kind.ACTION, ["+DISCONN", BLEToUartAdapter.RESP_ERROR], "断开设备",
+              encoder=str, decoder=decode_disconnect),
+)
+
+
 def test():
     with BLEToUartAdapter("com23") as adapter:
         # # 切换波特率
@@ -643,8 +1531,7 @@ def test():
         #     adapter.disconnect_slave_device(mac_for_connected)
         #     logger.info("断开设备连接成功")
 
-        resp = adapter.exec("TXPOWER?", "+TXPOWER")
-        data = adapter.get_data(resp)
+        data = adapter.call("TXPOWER?")
         logger.info(f"发射功率为：{data}")
 
         while True:
@@ -652,4 +1539,7 @@ def test():
 
 
 if __name__ == '__main__':
-    test()
+    # python -m bleuart 运行命令行工具，命令行工具中导入的是正常的 bleuart 模块，而不是这里的 __main__
+    import bleuart_cli
+
+    raise SystemExit(bleuart_cli.main())
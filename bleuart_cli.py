@@ -0,0 +1,424 @@
+"""
+    BLE转串口适配器的命令行工具，不依赖GUI，适合在脚本中并行驱动多个适配器
+
+    用法：
+        python -m bleuart scan --port COM3 --duration 10 --name-prefix Device     # 以JSON行的形式输出扫描结果
+        python -m bleuart scan --port COM3 --duration 0 --output scan.csv         # 长时间扫描，流式导出到文件
+        python -m bleuart scan --port COM3 --fast-baudrate                        # 扫描期间临时使用230400波特率
+        python -m bleuart connect --port COM3 AA:BB:CC:DD:EE:FF                   # 根据MAC地址或者名称连接
+        python -m bleuart config --port COM3 --profiles 方案.json 产线方案          # 应用配置方案
+        python -m bleuart monitor --port COM3 --duration 3600                     # 监视链路状态，输出状态变化
+        python -m bleuart scan --port COM3 --duration 0 --history 历史.db          # 扫描并记录设备历史
+        python -m bleuart history --db 历史.db --mac AA:BB:CC:DD:EE:FF              # 查询设备是否出现过
+        python -m bleuart verify --port COM3 --golden 托盘.txt --report 报告.csv     # 核对清单中的设备是否都在广播
+        python -m bleuart bench --quick                                           # 运行离线性能基准测试
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import typing
+
+import adapter_profile
+import bleuart
+import command_latency
+import device_history
+import golden_list
+import link_monitor
+import scan_export
+
+
+def setup_logger(level: str) -> logging.Logger:
+    """
+        命令行下的日志只输出到标准错误，标准输出留给结果，也不创建日志文件，
+        库中的模块都在调用时才通过 bleuart.logger 输出日志，因此替换后全部生效
+    @param level: 日志等级
+    @return:
+    """
+    logger = logging.getLogger("bleuart_cli")
+    if len(logger.handlers) == 0:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)-5.5s]  %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level.upper())
+    bleuart.set_logger(logger)
+    return logger
+
+
+def emit(obj: typing.Dict[str, typing.Any]):
+    """
+        输出一行JSON结果
+    @param obj: 结果
+    @return:
+    """
+    sys.stdout.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def device_to_dict(device: bleuart.BLEDevice) -> typing.Dict[str, typing.Any]:
+    return {
+        "t": round(time.time(), 3),
+        "mac": device.mac,
+        "mac_type": device.mac_type,
+        "rssi": device.rssi,
+        "name": device.name,
+    }
+
+
+def open_adapter(args: argparse.Namespace) -> bleuart.BLEToUartAdapter:
+    """
+        打开并检查适配器
+    @param args: 命令行参数
+    @return:
+    """
+    config_cache = bleuart.AdapterConfigCache(args.cache) if args.cache is not None else None
+    latency_tracker = command_latency.CommandLatencyTracker(args.latency) if args.latency is not None else None
+    adapter = bleuart.BLEToUartAdapter(args.port, config_cache, latency_tracker)
+    if not adapter.open():
+        raise bleuart.AdapterException(f"打开串口 {args.port} 失败，请检查串口是否被占用")
+    try:
+        adapter.check_is_ble_to_uart_device()
+    except Exception:
+        adapter.close()
+        raise
+    return adapter
+
+
+def close_adapter(adapter: bleuart.BLEToUartAdapter):
+    adapter.callback_on_device_found = None
+    adapter.stop_scan().wait(3)
+    adapter.close()
+
+
+def create_device_filter(args: argparse.Namespace) -> typing.Callable[[bleuart.BLEDevice], bool]:
+    """
+        根据命令行参数创建设备过滤器，也可以用于过滤扫描事件，两者的字段名是一致的
+    @param args: 命令行参数
+    @return: 设备符合条件时返回True
+    """
+    macs = {mac.upper() for mac in args.mac} if args.mac else None
+
+    def accept(device: bleuart.BLEDevice) -> bool:
+        if args.name_prefix is not None and not device.name.startswith(args.name_prefix):
+            return False
+        if macs is not None and device.mac.upper() not in macs:
+            return False
+        if args.min_rssi is not None and device.rssi < args.min_rssi:
+            return False
+        return True
+
+    return accept
+
+
+def cmd_scan(args: argparse.Namespace) -> int:
+    """
+        扫描设备，每发现一次设备输出一行JSON，到达持续时间后退出
+    """
+    accept = create_device_filter(args)
+    macs_seen = set()
+
+    def on_device_found(device: bleuart.BLEDevice):
+        if not accept(device):
+            return
+        if args.unique:
+            if device.mac in macs_seen:
+                return
+            macs_seen.add(device.mac)
+        emit(device_to_dict(device))
+
+    history = device_history.DeviceHistoryStore(args.history) if args.history is not None else None
+    adapter = open_adapter(args)
+    if args.fast_baudrate:
+        adapter.scan_baudrate_index = adapter.SCAN_BAUDRATE_INDEX
+    exporter = None
+    try:
+        if history is not None:
+            history.attach(adapter.scan_events)
+        if args.output is not None:
+            # 导出到文件时不再输出到标准输出，文件的写入在导出线程中进行
+            exporter = scan_export.ScanExporter(adapter.scan_events, args.output, snapshot=args.snapshot,
+                                                max_bytes=int(args.max_mb * 1024 * 1024), event_filter=accept)
+            exporter.start()
+        else:
+            adapter.callback_on_device_found = on_device_found
+        adapter.start_scan()
+        time_end = time.monotonic() + args.duration if args.duration > 0 else None
+        while time_end is None or time.monotonic() < time_end:
+            time.sleep(0.1 if time_end is None else min(0.1, max(0.0, time_end - time.monotonic())))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_adapter(adapter)
+        if exporter is not None:
+            exporter.stop()
+            emit({"output": args.output, "exported": exporter.exported})
+        if history is not None:
+            history.close()
+    return 0
+
+
+def find_device(adapter: bleuart.BLEToUartAdapter, target: str, timeout: float) -> bleuart.BLEDevice | None:
+    """
+        扫描直到找到目标设备
+    @param adapter: 适配器
+    @param target: MAC地址或者设备名称
+    @param timeout: 最多扫描多久，以秒为单位
+    @return: 找到的设备，超时返回None
+    """
+    is_mac = bleuart.MAC_PATTERN.match(target) is not None
+    found: typing.List[bleuart.BLEDevice] = []
+    found_event = threading.Event()
+
+    def on_device_found(device: bleuart.BLEDevice):
+        if found_event.is_set():
+            return
+        if (device.mac.upper() == target.upper()) if is_mac else (device.name == target):
+            found.append(device)
+            found_event.set()
+
+    adapter.callback_on_device_found = on_device_found
+    adapter.start_scan()
+    try:
+        found_event.wait(timeout)
+    finally:
+        adapter.callback_on_device_found = None
+        adapter.stop_scan().wait(3)
+    return found[0] if len(found) > 0 else None
+
+
+def cmd_connect(args: argparse.Namespace) -> int:
+    """
+        连接到设备，已知MAC地址类型时直接连接，否则先扫描找到设备
+    """
+    adapter = open_adapter(args)
+    try:
+        is_mac = bleuart.MAC_PATTERN.match(args.target) is not None
+        if is_mac and args.mac_type is not None:
+            mac, mac_type, name = args.target.upper(), args.mac_type, None
+        else:
+            device = find_device(adapter, args.target, args.scan_timeout)
+            if device is None:
+                emit({"connected": False, "target": args.target, "error": "没有扫描到目标设备"})
+                return 1
+            mac, mac_type, name = device.mac, device.mac_type, device.name
+
+        # 先断开已有的连接，没有连接时模块会上报错误，可以忽略
+        adapter.call_batch([("DISCONN=", 0)])
+        try:
+            adapter.connect_slave_device(mac, mac_type)
+        except (bleuart.AdapterException, TimeoutError) as e:
+            emit({"connected": False, "mac": mac, "name": name, "error": str(e)})
+            return 1
+        emit({"connected": True, "mac": mac, "mac_type": mac_type, "name": name})
+        return 0
+    finally:
+        close_adapter(adapter)
+
+
+def cmd_config(args: argparse.Namespace) -> int:
+    """
+        应用配置方案
+    """
+    profile_map = {adapter_profile.PROFILE_DEFAULT.name: adapter_profile.PROFILE_DEFAULT}
+    if args.profiles is not None:
+        profile_map.update(adapter_profile.load_profiles(args.profiles))
+    profile = profile_map.get(args.profile)
+    if profile is None:
+        raise ValueError(f"没有名为 '{args.profile}' 的配置方案，可用的方案：{list(profile_map.keys())}")
+
+    adapter = open_adapter(args)
+    try:
+        changes = adapter_profile.apply_profile(adapter, profile, verify=not args.no_verify)
+    finally:
+        close_adapter(adapter)
+    emit({"profile": profile.name, "changes": dict(changes)})
+    return 0
+
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    """
+        产线核对，扫描直到清单中的设备全部发现或者超时，每发现一个输出一行JSON，最后输出报告
+    """
+    entries = (golden_list.parse_golden_list(sys.stdin.read()) if args.golden == "-"
+               else golden_list.load_golden_list(args.golden))
+    run = golden_list.GoldenListRun(entries, args.min_rssi)
+    run.on_unit_found = lambda unit: emit(unit.to_dict())
+    adapter = open_adapter(args)
+    if args.fast_baudrate:
+        adapter.scan_baudrate_index = adapter.SCAN_BAUDRATE_INDEX
+    try:
+        run.start(adapter.scan_events)
+        adapter.start_scan()
+        try:
+            run.wait(args.timeout if args.timeout > 0 else None)
+        except KeyboardInterrupt:
+            pass
+        run.finish()
+    finally:
+        close_adapter(adapter)
+    if args.report is not None:
+        run.export_report(args.report)
+    report = run.report()
+    emit({key: report[key] for key in ("elapsed", "total", "found", "missing", "found_after_max")})
+    return 0 if run.found_count == run.total else 1
+
+
+def cmd_history(args: argparse.Namespace) -> int:
+    """
+        查询设备历史，指定了 --sightings 时输出这个设备的每一次出现，否则输出符合条件的设备汇总
+    """
+    if not os.path.exists(args.db):
+        raise ValueError(f"设备历史数据库 {args.db} 不存在")
+    history = device_history.DeviceHistoryStore(args.db)
+    since = time.time() - args.since if args.since is not None else None
+    if args.sightings:
+        if args.mac is None:
+            raise ValueError("查询每一次出现时需要指定 --mac")
+        for event in history.sightings(args.mac, since, limit=args.limit):
+            emit({"t": round(event.time, 3), "mac": event.mac, "mac_type": event.mac_type,
+                  "rssi": event.rssi, "name": event.name})
+        return 0
+
+    if args.mac is not None and bleuart.MAC_PATTERN.match(args.mac) is not None:
+        record = history.find_device(args.mac)
+        records = [record] if record is not None and (since is None or record.last_seen >= since) else []
+    else:
+        records = history.search_devices(args.name, args.mac, since, args.limit)
+    for record in records:
+        emit(record._asdict())
+    return 0 if len(records) > 0 else 1
+
+
+def cmd_monitor(args: argparse.Namespace) -> int:
+    """
+        监视已有连接的链路状态，每次状态变化输出一行JSON，结束时输出统计
+    """
+    adapter = open_adapter(args)
+    try:
+        monitor = link_monitor.LinkMonitor(adapter, adapter.get_auto_reconnect_enable(),
+                                           args.confirm_interval if args.confirm_interval > 0 else None)
+        monitor.on_state_changed = lambda change: emit({
+            "t": round(change.time, 3),
+            "state": link_monitor.LinkState.NAMES[change.state],
+            "source": change.source,
+        })
+        monitor.confirm()
+        monitor.start()
+        try:
+            time_end = time.monotonic() + args.duration if args.duration > 0 else None
+            while time_end is None or time.monotonic() < time_end:
+                time.sleep(0.1 if time_end is None else min(0.1, max(0.0, time_end - time.monotonic())))
+        except KeyboardInterrupt:
+            pass
+        monitor.stop()
+        emit({"stats": monitor.stats()})
+    finally:
+        close_adapter(adapter)
+    return 0
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    import bench_bleuart
+    bench_argv = ["--threshold", str(args.threshold)]
+    if args.quick:
+        bench_argv.append("--quick")
+    if args.output is not None:
+        bench_argv += ["--output", args.output]
+    if args.baseline is not None:
+        bench_argv += ["--baseline", args.baseline]
+    return bench_bleuart.main(bench_argv)
+
+
+def add_adapter_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--port", required=True, help="适配器的串口号，比如 COM3 或者 /dev/ttyUSB0")
+    parser.add_argument("--cache", help="配置缓存文件的路径，不指定时不使用缓存")
+    parser.add_argument("--latency", help="指令耗时统计文件的路径，指定后根据学习到的耗时缩短指令的超时")
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m bleuart", description="BLE转串口适配器的命令行工具")
+    parser.add_argument("--log-level", default="WARNING", help="输出到标准错误的日志等级，默认WARNING")
+    sub_parsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_scan = sub_parsers.add_parser("scan", help="扫描设备，以JSON行的形式输出")
+    add_adapter_arguments(parser_scan)
+    parser_scan.add_argument("--duration", type=float, default=10, help="扫描的持续时间，以秒为单位，0表示一直扫描")
+    parser_scan.add_argument("--name-prefix", help="只输出以此开头的设备名称")
+    parser_scan.add_argument("--mac", action="append", help="只输出这些MAC地址，可以指定多次")
+    parser_scan.add_argument("--min-rssi", type=int, help="只输出信号强度不低于此值的设备")
+    parser_scan.add_argument("--unique", action="store_true", help="每个设备只输出第一次发现")
+    parser_scan.add_argument("-o", "--output", help="导出到文件而不是标准输出，扩展名为 .jsonl 时导出JSON行，否则导出CSV")
+    parser_scan.add_argument("--snapshot", action="store_true", help="导出文件只保留每个设备的最新状态")
+    parser_scan.add_argument("--history", help="把每一次发现记录到这个设备历史数据库中")
+    parser_scan.add_argument("--max-mb", type=float, default=64, help="导出文件超过多少MB后滚动，0表示不滚动")
+    parser_scan.add_argument("--fast-baudrate", action="store_true",
+                             help="扫描期间临时切换到230400波特率，结束后恢复，适合设备密集的环境")
+    parser_scan.set_defaults(func=cmd_scan)
+
+    parser_connect = sub_parsers.add_parser("connect", help="根据MAC地址或者名称连接设备")
+    add_adapter_arguments(parser_connect)
+    parser_connect.add_argument("target", help="设备的MAC地址或者名称")
+    parser_connect.add_argument("--mac-type", type=int, choices=(0, 1),
+                                help="MAC地址的类型，0-静态地址 1-随机地址，指定后不需要先扫描")
+    parser_connect.add_argument("--scan-timeout", type=float, default=10, help="扫描目标设备的超时，以秒为单位")
+    parser_connect.set_defaults(func=cmd_connect)
+
+    parser_config = sub_parsers.add_parser("config", help="应用配置方案")
+    add_adapter_arguments(parser_config)
+    parser_config.add_argument("profile", help="配置方案的名字")
+    parser_config.add_argument("--profiles", help="配置方案文件（JSON或者TOML），不指定时只有默认方案")
+    parser_config.add_argument("--no-verify", action="store_true", help="写入后不回读验证")
+    parser_config.set_defaults(func=cmd_config)
+
+    parser_verify = sub_parsers.add_parser("verify", help="产线核对，确认清单中的设备都在广播")
+    add_adapter_arguments(parser_verify)
+    parser_verify.add_argument("--golden", required=True,
+                               help="期望的设备清单，每行一个MAC地址或者设备名称，'-' 表示从标准输入读取")
+    parser_verify.add_argument("--timeout", type=float, default=30, help="最多扫描多久，以秒为单位，0表示一直扫描")
+    parser_verify.add_argument("--min-rssi", type=int, help="信号强度低于此值的发现不算数")
+    parser_verify.add_argument("--report", help="核对报告的保存路径，扩展名为 .json 时保存JSON，否则保存CSV")
+    parser_verify.add_argument("--fast-baudrate", action="store_true",
+                               help="扫描期间临时切换到230400波特率，结束后恢复，适合设备密集的环境")
+    parser_verify.set_defaults(func=cmd_verify)
+
+    parser_history = sub_parsers.add_parser("history", help="查询设备历史，以JSON行的形式输出")
+    parser_history.add_argument("--db", required=True, help="设备历史数据库的路径")
+    parser_history.add_argument("--mac", help="完整的MAC地址，或者MAC地址的开头")
+    parser_history.add_argument("--name", help="设备名中包含的字符串")
+    parser_history.add_argument("--since", type=float, help="只查询最近多少秒内出现过的")
+    parser_history.add_argument("--limit", type=int, default=100, help="最多输出多少条")
+    parser_history.add_argument("--sightings", action="store_true", help="输出 --mac 指定的设备的每一次出现")
+    parser_history.set_defaults(func=cmd_history)
+
+    parser_monitor = sub_parsers.add_parser("monitor", help="监视链路状态，以JSON行的形式输出状态变化")
+    add_adapter_arguments(parser_monitor)
+    parser_monitor.add_argument("--duration", type=float, default=0, help="监视的持续时间，以秒为单位，0表示一直监视")
+    parser_monitor.add_argument("--confirm-interval", type=float, default=60,
+                                help="用 'DEV?' 确认状态的间隔，以秒为单位，0表示只依靠模块上报的事件")
+    parser_monitor.set_defaults(func=cmd_monitor)
+
+    parser_bench = sub_parsers.add_parser("bench", help="运行离线性能基准测试，参数同 bench_bleuart")
+    parser_bench.add_argument("-o", "--output", help="结果保存的JSON文件路径")
+    parser_bench.add_argument("--baseline", help="用于对比的基线结果JSON文件路径")
+    parser_bench.add_argument("--threshold", type=float, default=0.2, help="允许的回退比例，默认0.2")
+    parser_bench.add_argument("--quick", action="store_true", help="快速模式，只用于冒烟检查")
+    parser_bench.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv: typing.List[str] | None = None) -> int:
+    args = create_parser().parse_args(argv)
+    logger = setup_logger(args.log_level)
+    try:
+        return args.func(args)
+    except (bleuart.AdapterException, TimeoutError, ValueError, OSError) as e:
+        logger.error(f"执行 '{args.command}' 失败：{e}")
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+import typing
+
+import bleuart
+import span_timer
+
+
+def command_key(cmd: str) -> str:
+    """
+        指令的统计键，参数不同的同一条指令一起统计，与指令表的键一致
+    @param cmd: 指令，不带AT+开头，比如 'UUIDS=FFF0'
+    @return: 比如 'UUIDS='、'VER?'、'AUTO_DEL'
+    """
+    index = cmd.find("=")
+    return cmd if index == -1 else cmd[:index + 1]
+
+
+class CommandLatencyTracker:
+    """
+        学习每个适配器每条指令在各个波特率下的应答耗时，并据此给出等待应答的超时。
+        样本足够时超时为 p99 的若干倍，并且不会超过指令声明的超时，没有应答的模块能更快的被发现；
+        在学习到的超时内没有应答时，会作为一个样本记录下来，真的变慢的固件会让超时逐渐变长。
+        只适用于应答耗时稳定的读取与设置指令，连接、软复位这类耗时取决于外部的指令需要在指令表中声明不学习
+    """
+
+    MIN_SAMPLES = 10  # 样本少于此数时使用指令声明的超时
+    MAX_SAMPLES = 1000  # 样本超过此数时所有的桶减半，固件变化后能跟上新的耗时
+    SAFETY_FACTOR = 2.0  # 超时为 p99 的多少倍
+    SAFETY_MARGIN = 0.1  # 在倍数之外额外加上的余量，以秒为单位，覆盖系统调度与串口驱动的抖动
+    MIN_TIMEOUT = 0.3  # 学习到的超时的下限，以秒为单位
+    SAVE_INTERVAL = 30  # 自动保存的最短间隔，以秒为单位
+
+    def __init__(self, file_path: str | None = None):
+        """
+            创建耗时统计
+        @param file_path: 持久化的文件路径，为None时只在内存中统计
+        """
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._histogram_map: typing.Dict[str, typing.Dict[str, span_timer.PhaseHistogram]] = {
+            # 适配器ID到各条指令的耗时的映射表，布局为：
+            # 适配器ID: {'指令的统计键@波特率': 耗时直方图}
+        }
+        self._dirty = False
+        self._time_saved = time.monotonic()
+        if self.file_path is not None:
+            self.load()
+
+    def load(self):
+        """
+            从文件中加载统计，文件不存在或者损坏时忽略
+        @return:
+        """
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data_map = json.load(f)
+            histogram_map = {
+                adapter_id: {key: span_timer.PhaseHistogram.from_dict(data) for key, data in histograms.items()}
+                for adapter_id, histograms in data_map.items()
+            }
+            with self._lock:
+                self._histogram_map = histogram_map
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            bleuart.logger.warning(f"加载指令耗时统计失败，将重新学习：{e}")
+
+    def save(self):
+        """
+            保存统计到文件中，先写临时文件再替换，没有变化时不写入
+        @return:
+        """
+        if self.file_path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._time_saved = time.monotonic()
+            content = json.dumps({
+                adapter_id: {key: histogram.to_dict() for key, histogram in histograms.items()}
+                for adapter_id, histograms in self._histogram_map.items()
+            })
+        try:
+            file_tmp = f"{self.file_path}.tmp"
+            with open(file_tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(file_tmp, self.file_path)
+        except Exception as e:
+            bleuart.logger.warning(f"保存指令耗时统计失败：{e}")
+
+    def _add(self, histogram: span_timer.PhaseHistogram, seconds: float):
+        histogram.add(seconds)
+        if histogram.count > self.MAX_SAMPLES:
+            histogram.halve()
+        self._dirty = True
+
+    def record(self, adapter_id: str, cmd: str, baudrate: int, seconds: float):
+        """
+            记录一次应答耗时，距离上次保存超过 SAVE_INTERVAL 时顺便保存
+        @param adapter_id: 适配器ID，一般为模块自身的MAC地址
+        @param cmd: 指令
+        @param baudrate: 执行指令时的波特率
+        @param seconds: 从发送完指令到收完应答的耗时
+        @return:
+        """
+        key = f"{command_key(cmd)}@{baudrate}"
+        with self._lock:
+            histograms = self._histogram_map.setdefault(adapter_id, {})
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = span_timer.PhaseHistogram()
+            self._add(histogram, seconds)
+            need_save = time.monotonic() - self._time_saved >= self.SAVE_INTERVAL
+        if need_save:
+            self.save()
+
+    def record_timeout(self, adapter_id: str, cmd: str, baudrate: int, timeout: float):
+        """
+            记录一次在学习到的超时内没有应答，把超时作为一个样本，只记录在这个波特率下已经学习过的指令，
+            识别波特率时在错误的波特率下的超时不会污染统计
+        @param adapter_id: 适配器ID
+        @param cmd: 指令
+        @param baudrate: 执行指令时的波特率
+        @param timeout: 使用的超时
+        @return:
+        """
+        with self._lock:
+            histogram = self._histogram_map.get(adapter_id, {}).get(f"{command_key(cmd)}@{baudrate}")
+            if histogram is None or histogram.count < self.MIN_SAMPLES:
+                return
+            self._add(histogram, timeout)
+
+    def _find_histogram(self, adapter_id: str, cmd: str, baudrate: int) -> span_timer.PhaseHistogram | None:
+        """
+            找到样本足够的直方图，这个波特率下样本不够时，使用同一条指令在其他波特率下样本最多的直方图，
+            应答只有几十个字节，波特率对耗时的影响在余量之内，调用者需要持有锁
+        @return: 样本都不够时返回None
+        """
+        histograms = self._histogram_map.get(adapter_id)
+        if histograms is None:
+            return None
+        key_prefix = f"{command_key(cmd)}@"
+        histogram = histograms.get(f"{key_prefix}{baudrate}")
+        if histogram is None or histogram.count < self.MIN_SAMPLES:
+            candidates = [h for key, h in histograms.items() if key.startswith(key_prefix)]
+            histogram = max(candidates, key=lambda h: h.count, default=None)
+        return histogram if histogram is not None and histogram.count >= self.MIN_SAMPLES else None
+
+    def timeout(self, adapter_id: str, cmd: str, baudrate: int, timeout_declared: float) -> float:
+        """
+            给出等待应答的超时
+        @param adapter_id: 适配器ID
+        @param cmd: 指令
+        @param baudrate: 当前的波特率
+        @param timeout_declared: 指令声明的超时，也是超时的上限
+        @return: 以秒为单位
+        """
+        with self._lock:
+            histogram = self._find_histogram(adapter_id, cmd, baudrate)
+            if histogram is None:
+                return timeout_declared
+            p99 = histogram.percentile(99)
+        timeout_learned = p99 * self.SAFETY_FACTOR + self.SAFETY_MARGIN
+        return min(timeout_declared, max(self.MIN_TIMEOUT, timeout_learned))
+
+    def stats(self, adapter_id: str) -> typing.Dict[str, typing.Dict[str, float]]:
+        """
+            一个适配器各条指令的耗时统计
+        @param adapter_id: 适配器ID
+        @return: '指令的统计键@波特率': {'count': 样本数, 'p50': 秒, 'p99': 秒}
+        """
+        with self._lock:
+            histograms = self._histogram_map.get(adapter_id, {})
+            return {key: {"count": h.count, "p50": h.percentile(50), "p99": h.percentile(99)}
+                    for key, h in sorted(histograms.items())}
@@ -0,0 +1,264 @@
+import sqlite3
+import threading
+import time
+import typing
+
+import bleuart
+import scan_events
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sightings (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    mac TEXT NOT NULL,
+    mac_type INTEGER NOT NULL,
+    rssi INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sightings_mac_time ON sightings (mac, time);
+CREATE INDEX IF NOT EXISTS idx_sightings_name ON sightings (name);
+CREATE INDEX IF NOT EXISTS idx_sightings_time ON sightings (time);
+
+CREATE TABLE IF NOT EXISTS devices (
+    mac TEXT PRIMARY KEY,
+    mac_type INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    sightings INTEGER NOT NULL,
+    rssi_last INTEGER NOT NULL,
+    rssi_max INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_devices_name ON devices (name);
+CREATE INDEX IF NOT EXISTS idx_devices_last_seen ON devices (last_seen);
+"""
+
+SQL_INSERT_SIGHTING = "INSERT INTO sightings (time, mac, mac_type, rssi, name) VALUES (?, ?, ?, ?, ?)"
+# 同一批次中同一个设备只更新一次，设备名为空时保留之前的名称
+SQL_UPSERT_DEVICE = """
+INSERT INTO devices (mac, mac_type, name, first_seen, last_seen, sightings, rssi_last, rssi_max)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (mac) DO UPDATE SET
+    mac_type = excluded.mac_type,
+    name = CASE WHEN excluded.name != '' THEN excluded.name ELSE devices.name END,
+    last_seen = excluded.last_seen,
+    sightings = devices.sightings + excluded.sightings,
+    rssi_last = excluded.rssi_last,
+    rssi_max = MAX(devices.rssi_max, excluded.rssi_max)
+"""
+
+
+class DeviceRecord(typing.NamedTuple):
+    """
+        一个设备的历史汇总
+    """
+    mac: str
+    mac_type: int
+    name: str
+    first_seen: float
+    last_seen: float
+    sightings: int
+    rssi_last: int
+    rssi_max: int
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+        打开数据库，使用WAL模式，写入时不会阻塞查询
+    @param path: 数据库文件路径
+    @return:
+    """
+    conn = sqlite3.connect(path, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL模式下断电最多丢失最后几个事务，不会损坏数据库
+    return conn
+
+
+class DeviceHistoryStore:
+    """
+        设备的历史记录，保存在SQLite数据库中。写入线程通过扫描事件的游标批量读取，
+        一个事务写入一批，扫描线程从不等待磁盘；查询使用独立的连接，可以在任意线程中调用
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000, flush_interval: float = 0.5):
+        """
+            创建历史记录，数据库与表不存在时自动创建
+        @param path: 数据库文件路径
+        @param batch_size: 一个事务最多写入的事件个数
+        @param flush_interval: 凑批的最长等待时间，以秒为单位，事件少的时候也不会等太久才写入
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        with connect(path) as conn:
+            conn.executescript(SCHEMA)
+        conn.close()
+
+        self.written = 0  # 累计写入的事件个数
+        self._lock = threading.Lock()
+        self._cursor: scan_events.ScanEventCursor | None = None
+        self._retired_cursors: typing.List[scan_events.ScanEventCursor] = []  # 被替换的游标，剩下的事件还需要写完
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def attach(self, ring: scan_events.ScanEventRing):
+        """
+            开始记录一个适配器的扫描事件，之前记录的适配器会被替换，第一次调用时启动写入线程
+        @param ring: 扫描事件的环形缓冲区，一般为适配器的 scan_events
+        @return:
+        """
+        with self._lock:
+            if self._cursor is not None:
+                self._retired_cursors.append(self._cursor)
+            self._cursor = ring.subscribe()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self.thread_write, name="设备历史", daemon=True)
+            self._thread.start()
+
+    def detach(self):
+        """
+            停止记录，已经发生的事件会在下一批中写完
+        @return:
+        """
+        with self._lock:
+            if self._cursor is not None:
+                self._retired_cursors.append(self._cursor)
+            self._cursor = None
+
+    def write_batch(self, conn: sqlite3.Connection, events: typing.List[scan_events.ScanEvent]):
+        """
+            在一个事务中写入一批事件
+        @param conn: 写入线程的连接
+        @param events: 事件
+        @return:
+        """
+        devices: typing.Dict[str, list] = {}
+        for e in events:
+            device = devices.get(e.mac)
+            if device is None:
+                devices[e.mac] = [e.mac, e.mac_type, e.name, e.time, e.time, 1, e.rssi, e.rssi]
+            else:
+                device[1] = e.mac_type
+                if e.name != "":
+                    device[2] = e.name
+                device[4] = e.time
+                device[5] += 1
+                device[6] = e.rssi
+                device[7] = max(device[7], e.rssi)
+        with conn:
+            conn.executemany(SQL_INSERT_SIGHTING, ((e.time, e.mac, e.mac_type, e.rssi, e.name) for e in events))
+            conn.executemany(SQL_UPSERT_DEVICE, devices.values())
+        self.written += len(events)
+
+    def drain(self, conn: sqlite3.Connection, cursor: scan_events.ScanEventCursor):
+        dropped = cursor.dropped
+        while True:
+            events = cursor.read(self.batch_size)
+            if len(events) == 0:
+                break
+            self.write_batch(conn, events)
+        if cursor.dropped > dropped:
+            bleuart.logger.warning(f"设备历史写入太慢，丢失了{cursor.dropped - dropped}个扫描事件")
+
+    def thread_write(self):
+        conn = connect(self.path)
+        try:
+            while not self._stop_event.is_set():
+                with self._lock:
+                    retired_cursors = self._retired_cursors
+                    self._retired_cursors = []
+                    cursor = self._cursor
+                for retired_cursor in retired_cursors:
+                    self.drain(conn, retired_cursor)
+                if cursor is None:
+                    self._stop_event.wait(self.flush_interval)
+                    continue
+                # 等一会儿再读取，凑成更大的批次，减少事务的个数
+                if cursor.wait(self.flush_interval) and cursor.lag < self.batch_size:
+                    self._stop_event.wait(min(0.05, self.flush_interval))
+                self.drain(conn, cursor)
+            with self._lock:
+                cursors = [*self._retired_cursors, self._cursor]
+                self._retired_cursors = []
+            for cursor in cursors:
+                if cursor is not None:
+                    self.drain(conn, cursor)
+        except Exception as e:
+            bleuart.logger.error(f"写入设备历史到 {self.path} 失败：{e}")
+        finally:
+            conn.close()
+
+    def close(self, timeout: float | None = 3):
+        """
+            停止写入线程，剩余的事件会被写入
+        @param timeout: 最多等待写入线程多久
+        @return:
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def query(self, sql: str, params: tuple = ()) -> typing.List[tuple]:
+        """
+            使用独立的连接执行查询
+        @param sql: 查询语句
+        @param params: 参数
+        @return: 结果行
+        """
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def find_device(self, mac: str) -> DeviceRecord | None:
+        """
+            查询一个设备是否出现过，以及第一次与最后一次出现的时间
+        @param mac: MAC地址，不区分大小写
+        @return: 设备的历史汇总，没有出现过时返回None
+        """
+        rows = self.query("SELECT * FROM devices WHERE mac = ?", (mac.upper(),))
+        return DeviceRecord(*rows[0]) if len(rows) > 0 else None
+
+    def search_devices(self, name: str | None = None, mac_prefix: str | None = None, since: float | None = None,
+                       limit: int = 100) -> typing.List[DeviceRecord]:
+        """
+            按照条件查询设备，按照最后出现的时间倒序
+        @param name: 设备名中包含的字符串
+        @param mac_prefix: MAC地址的开头，不区分大小写
+        @param since: 只查询这个时间戳之后出现过的设备
+        @param limit: 最多返回多少个
+        @return:
+        """
+        conditions = []
+        params = []
+        if name is not None:
+            conditions.append("name LIKE ?")
+            params.append(f"%{name}%")
+        if mac_prefix is not None:
+            conditions.append("mac LIKE ?")
+            params.append(f"{mac_prefix.upper()}%")
+        if since is not None:
+            conditions.append("last_seen >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if len(conditions) > 0 else ""
+        rows = self.query(f"SELECT * FROM devices {where} ORDER BY last_seen DESC LIMIT ?", (*params, limit))
+        return [DeviceRecord(*row) for row in rows]
+
+    def sightings(self, mac: str, since: float | None = None, until: float | None = None,
+                  limit: int = 1000) -> typing.List[scan_events.ScanEvent]:
+        """
+            查询一个设备的每一次出现，按照时间顺序
+        @param mac: MAC地址，不区分大小写
+        @param since: 开始的时间戳
+        @param until: 结束的时间戳
+        @param limit: 最多返回多少次
+        @return: 事件，序号为数据库中的行号
+        """
+        rows = self.query(
+            "SELECT id, time, mac, mac_type, rssi, name FROM sightings "
+            "WHERE mac = ? AND time >= ? AND time <= ? ORDER BY time LIMIT ?",
+            (mac.upper(), since if since is not None else 0, until if until is not None else time.time() + 86400,
+             limit))
+        return [scan_events.ScanEvent(*row) for row in rows]
@@ -0,0 +1,226 @@
+import csv
+import json
+import threading
+import time
+import typing
+
+import bleuart
+import scan_events
+import scan_export
+
+
+def parse_golden_list(text: str) -> typing.List[str]:
+    """
+        解析期望的设备清单，每行一个MAC地址或者设备名称，CSV格式时取第一列，
+        空行与 '#' 开头的注释行会被忽略，重复的条目只保留一个
+    @param text: 清单的文本，可以是文件内容，也可以是直接粘贴的文本
+    @return: 条目，MAC地址统一为大写
+    """
+    entries = []
+    seen = set()
+    for row in csv.reader(text.splitlines()):
+        if len(row) == 0:
+            continue
+        entry = row[0].strip()
+        if len(entry) == 0 or entry.startswith("#"):
+            continue
+        if bleuart.MAC_PATTERN.match(entry) is not None:
+            entry = entry.upper()
+        if entry not in seen:
+            seen.add(entry)
+            entries.append(entry)
+    return entries
+
+
+def load_golden_list(path: str) -> typing.List[str]:
+    """
+        从文件中加载期望的设备清单
+    @param path: 文件路径
+    @return: 条目
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return parse_golden_list(f.read())
+
+
+class GoldenUnit:
+    """
+        清单中的一个被测设备
+    """
+
+    def __init__(self, key: str, is_mac: bool):
+        self.key = key  # 清单中的条目
+        self.is_mac = is_mac  # 条目是MAC地址还是设备名称
+        self.found_after: float | None = None  # 从开始核对到第一次发现的秒数，没有发现时为None
+        self.mac: str = key if is_mac else ""
+        self.name: str = "" if is_mac else key
+        self.rssi: int | None = None
+
+    @property
+    def found(self) -> bool:
+        return self.found_after is not None
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "key": self.key,
+            "found": self.found,
+            "found_after": round(self.found_after, 3) if self.found else None,
+            "mac": self.mac,
+            "name": self.name,
+            "rssi": self.rssi,
+        }
+
+
+class GoldenListRun:
+    """
+        一次产线核对，把扫描事件与期望的设备清单按照MAC地址或者名称进行哈希匹配，
+        记录每个设备的发现耗时，全部发现后立刻结束
+    """
+
+    def __init__(self, entries: typing.Iterable[str], min_rssi: int | None = None):
+        """
+            创建核对
+        @param entries: 清单中的条目，MAC地址或者设备名称
+        @param min_rssi: 信号强度低于此值的发现不算数，用于排除旁边托盘上的设备
+        """
+        self.min_rssi = min_rssi
+        self.units: typing.List[GoldenUnit] = []
+        self._mac_map: typing.Dict[str, GoldenUnit] = {}
+        self._name_map: typing.Dict[str, GoldenUnit] = {}
+        for entry in entries:
+            is_mac = bleuart.MAC_PATTERN.match(entry) is not None
+            unit = GoldenUnit(entry.upper() if is_mac else entry, is_mac)
+            self.units.append(unit)
+            (self._mac_map if is_mac else self._name_map)[unit.key] = unit
+        if len(self.units) == 0:
+            raise ValueError("期望的设备清单是空的")
+
+        self.found_count = 0
+        self.time_start: float | None = None  # 开始核对时的时间戳，time.time()
+        self.time_end: float | None = None  # 结束核对时的时间戳
+        self.done_event = threading.Event()  # 全部发现时置位
+        self._lock = threading.Lock()
+        self._cursor: scan_events.ScanEventCursor | None = None
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        # 发现清单中的设备时的回调，运行在核对线程中
+        self.on_unit_found: typing.Callable[[GoldenUnit], None] | None = None
+        # 核对结束时的回调，参数为是否全部发现，运行在核对线程中
+        self.on_finished: typing.Callable[[bool], None] | None = None
+
+    @property
+    def total(self) -> int:
+        return len(self.units)
+
+    @property
+    def missing(self) -> typing.List[GoldenUnit]:
+        return [unit for unit in self.units if not unit.found]
+
+    @property
+    def elapsed(self) -> float:
+        if self.time_start is None:
+            return 0.0
+        return (self.time_end if self.time_end is not None else time.time()) - self.time_start
+
+    def match(self, event: scan_events.ScanEvent) -> GoldenUnit | None:
+        """
+            用一个扫描事件匹配清单
+        @param event: 扫描事件
+        @return: 因为这个事件第一次被发现的设备，没有时返回None
+        """
+        unit = self._mac_map.get(event.mac)
+        if unit is None:
+            unit = self._name_map.get(event.name)
+            if unit is None:
+                return None
+        if unit.found or (self.min_rssi is not None and event.rssi < self.min_rssi):
+            return None
+        unit.found_after = max(0.0, event.time - self.time_start)
+        unit.mac, unit.name, unit.rssi = event.mac, event.name, event.rssi
+        self.found_count += 1
+        return unit
+
+    def thread_match(self):
+        cursor = self._cursor
+        while not self._stop_event.is_set():
+            if not cursor.wait(0.2):
+                continue
+            for event in cursor.read():
+                unit = self.match(event)
+                if unit is None:
+                    continue
+                bleuart.logger.info(f"核对发现 {unit.key}（{unit.found_after:.2f}s），"
+                                    f"已发现{self.found_count}/{self.total}")
+                if self.on_unit_found is not None:
+                    self.on_unit_found(unit)
+                if self.found_count == self.total:
+                    self.done_event.set()
+                    self.finish()
+                    return
+
+    def start(self, ring: scan_events.ScanEventRing):
+        """
+            开始核对，只匹配之后的扫描事件
+        @param ring: 扫描事件的环形缓冲区，一般为适配器的 scan_events
+        @return:
+        """
+        self._cursor = ring.subscribe()
+        self.time_start = time.time()
+        self._thread = threading.Thread(target=self.thread_match, name="产线核对", daemon=True)
+        self._thread.start()
+
+    def finish(self):
+        """
+            结束核对，超时或者被取消时由外部调用，全部发现时自动调用，重复调用无效
+        @return:
+        """
+        with self._lock:
+            if self.time_end is not None:
+                return
+            self.time_end = time.time()
+        self._stop_event.set()
+        all_found = self.found_count == self.total
+        bleuart.logger.info(f"核对结束，发现{self.found_count}/{self.total}，耗时 {self.elapsed:.2f}s")
+        if self.on_finished is not None:
+            self.on_finished(all_found)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+            等待全部发现
+        @param timeout: 最多等多久
+        @return: 是否全部发现
+        """
+        return self.done_event.wait(timeout)
+
+    def report(self) -> typing.Dict[str, typing.Any]:
+        """
+            核对报告
+        @return: 可以直接序列化为JSON的报告
+        """
+        found_afters = sorted(unit.found_after for unit in self.units if unit.found)
+        return {
+            "time_start": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.time_start or time.time())),
+            "elapsed": round(self.elapsed, 3),
+            "total": self.total,
+            "found": self.found_count,
+            "missing": [unit.key for unit in self.missing],
+            "found_after_max": round(found_afters[-1], 3) if len(found_afters) > 0 else None,
+            "units": [unit.to_dict() for unit in self.units],
+        }
+
+    def export_report(self, path: str):
+        """
+            导出核对报告，扩展名为 .json 或者 .jsonl 时导出JSON，否则导出每个设备一行的CSV
+        @param path: 文件路径
+        @return:
+        """
+        report = self.report()
+        if scan_export.format_from_path(path) == scan_export.FORMAT_JSONL:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=4)
+            return
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("key", "found", "found_after", "mac", "name", "rssi"))
+            for unit in report["units"]:
+                writer.writerow(unit.values())
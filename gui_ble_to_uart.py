@@ -1,16 +1,37 @@
 import datetime
+import os
 import threading
 import time
 import tkinter as tk
-from tkinter import ttk, messagebox
-import serial.tools.list_ports
+import typing
+from tkinter import ttk, messagebox, filedialog, simpledialog
 
+import adapter_profile
+import adapter_recovery
 import bleuart
+import command_latency
+import device_history
+import golden_list
+import link_monitor
 import log
+import port_watch
+import rssi_timeline
+import scan_events
+import scan_export
+import span_timer
 import widget
+import wire_trace
 
 DEFAULT_BACKGROUND = "#3F3F3F"
 
+# 配置方案文件，文件不存在时只提供默认的配置方案
+PROFILES_FILE_PATH = "./BLE转串口适配器配置方案.json"
+# 列表中的信号趋势显示最近多少次采样
+SPARKLINE_SAMPLES = 16
+
+# 设备历史数据库，勾选记录设备历史后才会创建
+DEVICE_HISTORY_FILE_PATH = "./BLE转串口设备历史.db"
+
 logger = log.getLogger("BLE转串口桥接GUI日志")
 
 
@@ -31,6 +52,32 @@ class App:
 
         # 存放已经打开的适配器的句柄
         self.ble_adapter: bleuart.BLEToUartAdapter | None = None
+        # 已经打开的适配器的设备订阅，在UI线程中按照自己的节奏读取，不拖慢扫描线程，
+        # 同一个设备最多半秒更新一次，对于显示来说已经足够了
+        self.device_subscription: scan_events.DeviceSubscription | None = None
+        # 已经打开的适配器的恢复管理，串口短暂丢失时自动重新打开
+        self.recovery_supervisor: adapter_recovery.RecoverySupervisor | None = None
+        # 连接设备后保持适配器打开时的链路监视，以及被监视的设备的MAC地址
+        self.link_monitor: link_monitor.LinkMonitor | None = None
+        self.link_monitor_mac: str | None = None
+        # 扫描结果的流式导出，为None时没有在导出
+        self.scan_exporter: scan_export.ScanExporter | None = None
+        # 设备历史，清空列表或者关闭程序后仍然可以查询设备是否出现过，为None时没有在记录
+        self.device_history: device_history.DeviceHistoryStore | None = None
+        # 正在进行的产线核对，为None时没有在核对
+        self.golden_run: golden_list.GoldenListRun | None = None
+        # 适配器的配置缓存，持久化到文件中，重新打开适配器时可以跳过没有变化的配置读写
+        self.adapter_config_cache = bleuart.AdapterConfigCache("./BLE转串口适配器配置缓存.json")
+        # 指令耗时的统计，同样按照适配器持久化，学习到耗时之后没有应答的模块能更快的被发现
+        self.adapter_latency_tracker = command_latency.CommandLatencyTracker("./BLE转串口适配器指令耗时.json")
+        # 通信追踪器，记录最近的串口收发，任务失败时导出到文件中，方便分析现场的问题，
+        # 扫描结果行只计数，否则扫描一会儿缓冲区中就只剩下设备信息了
+        self.wire_tracer = wire_trace.WireTracer(trace_scan_lines=False)
+        # 子线程任务的分阶段耗时统计，用来找出最慢的阶段
+        self.span_recorder = span_timer.SpanRecorder()
+        # 启动的分阶段耗时，串口选择可用时就已经可以操作了，设备面板随后创建
+        self.startup_timer = span_timer.TaskTimer(self.span_recorder, "启动")
+        self.startup_timer.phase("串口选择")
 
         # 串口选择下拉列表
         self.frame_serial = tk.Frame(self.root, bg=DEFAULT_BACKGROUND)
@@ -51,6 +98,45 @@ class App:
         self.port_list.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         widget.disable_combobox_mouse_wheel(self.port_list)
 
+        # 串口的热插拔监视，下拉列表直接使用缓存的串口列表，适配器被拔出时自动关闭
+        self.port_watcher = port_watch.PortWatcher()
+        self.port_watcher.on_port_added = self.on_port_added
+        self.port_watcher.on_port_removed = self.on_port_removed
+        self.port_watcher.start()
+
+        self.device_adv_record_map = {
+            # 设备的mac地址到设备的相关信息与最后一次更新的时间戳的映射表
+            # 结构如下：
+            # mac: {
+            #     device: bleuart.BLEDevice,
+            #     time: 时间戳
+            # }
+        }
+        # 每个设备最近的信号强度，通过自己的游标读取每一次发现，不受列表刷新节流的影响
+        self.rssi_timelines = rssi_timeline.RssiTimelineMap()
+        self.rssi_cursor: scan_events.ScanEventCursor | None = None
+        self.rssi_sparkline_map = {
+            # 已经渲染到列表中的信号趋势，只有显示过的设备才会有，布局为：
+            # mac地址: (渲染时时间线的采样计数, 信号趋势的文本)
+        }
+        self.rssi_detail_rendered: typing.Tuple[str, int] | None = None  # 详情图中已经画出的 (mac地址, 采样计数)
+
+        # 设备面板（设备列表，样式，配置方案等）在串口选择绘制出来之后再创建，先让串口选择尽快可用，
+        # 窗口一直没有绘制时（比如最小化启动）也会在一段时间后创建
+        self.frame_device_fun: tk.Frame | None = None
+        self.startup_timer.phase("等待首次绘制")
+        self.frame_serial.bind("<Expose>", self.on_port_selector_drawn)
+        self.root.after(500, self.build_device_panel)
+
+    def build_device_panel(self):
+        """
+            创建设备相关的面板，在首次绘制之后的空闲时执行，重复调用无效
+        @return:
+        """
+        if self.frame_device_fun is not None:
+            return
+        self.startup_timer.phase("设备面板")
+
         # 在适配器成功的初始化之后，我们可以显示一些设备相关的UI，此时需要一个整体容纳适配器的UI
         self.frame_device_fun = tk.Frame(self.root, bg=DEFAULT_BACKGROUND)
         self.frame_device_fun.pack(expand=True, fill=tk.BOTH, padx=10)
@@ -65,7 +151,7 @@ class App:
         ble_device_list_y_scroll = ttk.Scrollbar(self.frame_ble_device_list, orient=tk.VERTICAL)
         ble_device_list_x_scroll.pack(side=tk.BOTTOM, fill=tk.X)
         ble_device_list_y_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-        ble_device_columns = ["蓝牙名", "MAC地址", "MAC类型", "RSSI", "最后更新"]
+        ble_device_columns = ["蓝牙名", "MAC地址", "MAC类型", "RSSI", "最后更新", "信号趋势"]
         self.tree_view_device_list = ttk.Treeview(
             master=self.frame_ble_device_list,  # 父容器
             columns=ble_device_columns,  # 列标识符列表
@@ -90,8 +176,15 @@ class App:
                 width = 60
             if column == ble_device_columns[4]:
                 width = 140
+            if column == ble_device_columns[5]:
+                width = 130
             self.tree_view_device_list.column(column=column, width=width, anchor=tk.CENTER, )  # 定义列
 
+        # 选中设备的信号强度详情图
+        self.canvas_rssi_detail = tk.Canvas(self.frame_center_content, height=48, bg=DEFAULT_BACKGROUND,
+                                            highlightthickness=0)
+        self.canvas_rssi_detail.pack(fill=tk.X)
+
         # 底部区域可以用来显示一些功能按钮，比如切换波特率之类的
         self.frame_bottom_content = tk.Frame(self.frame_device_fun, bg=DEFAULT_BACKGROUND)
         self.frame_bottom_content.pack(anchor=tk.NW, side=tk.TOP, fill=tk.X)
@@ -114,6 +207,22 @@ class App:
             fg=DEFAULT_BACKGROUND,
         ).pack(side=tk.LEFT)
 
+        # 配置方案的选择，选择后直接把方案应用到适配器中
+        tk.Label(
+            frame_bottom_content_line_1,
+            text="配置方案: ",
+            bg=DEFAULT_BACKGROUND,
+            fg="white",
+        ).pack(side=tk.LEFT, padx=(10, 0))
+        self.profile_map = self.load_profiles()
+        self.var_profile_selected = tk.StringVar()
+        self.profile_list = ttk.Combobox(
+            frame_bottom_content_line_1, width=16, textvariable=self.var_profile_selected,
+            values=list(self.profile_map.keys()), state="readonly")
+        self.profile_list.pack(side=tk.LEFT)
+        self.profile_list.bind("<<ComboboxSelected>>", self.on_profile_select)
+        widget.disable_combobox_mouse_wheel(self.profile_list)
+
         # 开始搜索设备的按钮，开启搜索后，其他的按钮功能全部都需要禁用掉
         self.btn_start_ble_scan = tk.Button(
             frame_bottom_content_line_1,
@@ -132,6 +241,16 @@ class App:
         )
         self.btn_clear_device_list.pack(side=tk.RIGHT, padx=5)
 
+        # 导出扫描结果的按钮，导出期间再次点击停止导出
+        self.btn_export_scan = tk.Button(
+            frame_bottom_content_line_1,
+            text="导出扫描结果",
+            bg=DEFAULT_BACKGROUND,
+            fg="white",
+            command=self.on_export_scan_click,
+        )
+        self.btn_export_scan.pack(side=tk.RIGHT, padx=5)
+
         # 软重置蓝牙适配器的按钮
         self.btn_soft_reset_adapter = tk.Button(
             frame_bottom_content_line_1,
@@ -162,6 +281,31 @@ class App:
         )
         self.checkbox_auto_reconnect_on_connect.pack(side=tk.RIGHT, padx=5)
 
+        # 勾选框，连接后不释放串口，继续监视链路状态，适合长时间的老化测试
+        self.var_config_monitor_link_on_connect = tk.BooleanVar(value=False)
+        self.checkbox_monitor_link_on_connect = ttk.Checkbutton(
+            frame_bottom_content_line_1,
+            text='连接后监视链路',
+            variable=self.var_config_monitor_link_on_connect,
+            onvalue=True,
+            offvalue=False,
+            style='Red.TCheckbutton',
+        )
+        self.checkbox_monitor_link_on_connect.pack(side=tk.RIGHT, padx=5)
+
+        # 勾选框，扫描期间临时切换到230400波特率，扫描停止后恢复，设备密集时低波特率会丢失扫描结果
+        self.var_config_fast_baudrate_on_scan = tk.BooleanVar(value=False)
+        self.checkbox_fast_baudrate_on_scan = ttk.Checkbutton(
+            frame_bottom_content_line_1,
+            text='扫描时使用高波特率',
+            variable=self.var_config_fast_baudrate_on_scan,
+            onvalue=True,
+            offvalue=False,
+            style='Red.TCheckbutton',
+            command=self.on_fast_baudrate_on_scan_toggle,
+        )
+        self.checkbox_fast_baudrate_on_scan.pack(side=tk.RIGHT, padx=5)
+
         # 第二行内容
         frame_bottom_content_line_2 = tk.Frame(self.frame_bottom_content, bg=DEFAULT_BACKGROUND)
         frame_bottom_content_line_2.pack(expand=True, fill=tk.BOTH, padx=5, pady=(10, 5), )
@@ -178,6 +322,39 @@ class App:
         self.baudrate_list.bind("<<ComboboxSelected>>", self.on_baudrate_select)
         widget.disable_combobox_mouse_wheel(self.baudrate_list)
 
+        # 设备历史的记录与查询
+        self.var_config_device_history_enable = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            frame_baudrate,
+            text='记录设备历史',
+            variable=self.var_config_device_history_enable,
+            onvalue=True,
+            offvalue=False,
+            style='Red.TCheckbutton',
+            command=self.on_device_history_toggle,
+        ).pack(side=tk.LEFT, padx=(10, 0))
+        tk.Button(
+            frame_baudrate,
+            text="历史查询",
+            bg=DEFAULT_BACKGROUND,
+            fg="white",
+            command=self.on_device_history_query_click,
+        ).pack(side=tk.LEFT, padx=5)
+
+        # 产线核对，载入期望的设备清单后扫描，实时显示发现与缺少的个数
+        self.btn_golden_list = tk.Button(
+            frame_baudrate,
+            text="产线核对",
+            bg=DEFAULT_BACKGROUND,
+            fg="white",
+            command=self.on_golden_list_click,
+        )
+        self.btn_golden_list.pack(side=tk.LEFT, padx=5)
+        self.var_golden_status = tk.StringVar(value="")
+        tk.Label(frame_baudrate, bg=DEFAULT_BACKGROUND, fg="white", textvariable=self.var_golden_status).pack(
+            side=tk.LEFT)
+        self.tree_view_device_list.tag_configure("golden_found", background="#2E8B57", foreground="white")
+
         # 服务特征的UUID的配置部分
         frame_uuid_config = tk.Frame(
             frame_bottom_content_line_2,
@@ -236,22 +413,30 @@ class App:
         )
         self.btn_update_uuid_to_device.grid(column=6, row=0, padx=(10, 0))
 
-        self.device_adv_record_map = {
-            # 设备的mac地址到设备的相关信息与最后一次更新的时间戳的映射表
-            # 结构如下：
-            # mac: {
-            #     device: bleuart.BLEDevice,
-            #     time: 时间戳
-            # }
-        }
         # 首次启动扫描设备广播更新时间
         self.task_check_device_adv_time()
+        # 启动读取扫描事件的任务
+        self.task_drain_scan_events()
+        self.task_update_link_state()
+        self.task_render_rssi_timelines()
+        self.task_update_golden_run()
 
         # 首次启动，更新view状态为未启动扫描
         self.set_view_for_scan_state(False)
         # 更新view未适配器未打开的状态
         self.set_view_for_adapter_close(True)
 
+        self.startup_timer.finish()
+        logger.info(f"启动耗时：{self.startup_timer.summary()}")
+
+    def on_port_selector_drawn(self, _):
+        """
+            串口选择首次绘制完成，在空闲时创建设备面板，让绘制的结果先显示出来
+        @return:
+        """
+        self.frame_serial.unbind("<Expose>")
+        self.root.after_idle(self.build_device_panel)
+
     def set_view_for_scan_state(self, scanning: bool):
         """
             设置扫描按钮的UI样式
@@ -267,6 +452,7 @@ class App:
             self.entry_input_notify_characteristic.config(state=tk.DISABLED)
             self.entry_input_write_characteristic.config(state=tk.DISABLED)
             self.btn_update_uuid_to_device.config(state=tk.DISABLED)
+            self.profile_list.config(state=tk.DISABLED)
         else:
             self.btn_start_ble_scan.config(bg="green", text="开启扫描")
             self.baudrate_list.config(state="readonly")
@@ -276,6 +462,7 @@ class App:
             self.entry_input_notify_characteristic.config(state=tk.NORMAL)
             self.entry_input_write_characteristic.config(state=tk.NORMAL)
             self.btn_update_uuid_to_device.config(state=tk.NORMAL)
+            self.profile_list.config(state="readonly")
 
     def set_view_for_adapter_close(self, closed: bool):
         """
@@ -292,6 +479,7 @@ class App:
             self.entry_input_notify_characteristic,
             self.entry_input_write_characteristic,
             self.btn_update_uuid_to_device,
+            self.profile_list,
         ]
         for view in view_handle:
             if closed:
@@ -330,6 +518,11 @@ class App:
         self.tree_view_device_list.delete(*self.tree_view_device_list.get_children())
         # 清空缓存中记录的最后更新时间
         self.device_adv_record_map.clear()
+        # 清空信号强度的时间线
+        self.rssi_timelines.clear()
+        self.rssi_sparkline_map.clear()
+        self.rssi_detail_rendered = None
+        self.canvas_rssi_detail.delete("all")
 
     def is_adapter_closed(self):
         """
@@ -364,13 +557,142 @@ class App:
         # 隔一段时间后再重启这个任务继续检查
         self.root.after(1000, self.task_check_device_adv_time)
 
+    def task_drain_scan_events(self):
+        """
+            在UI线程中读取订阅的设备变化并更新设备列表
+        @return:
+        """
+        subscription = self.device_subscription
+        adapter = self.ble_adapter
+        rssi_cursor = self.rssi_cursor
+        if rssi_cursor is not None:
+            add = self.rssi_timelines.add
+            for event in rssi_cursor.read():
+                add(event.mac, event.time, event.rssi)
+        if subscription is not None and adapter is not None:
+            dropped = subscription.cursor.dropped
+            events = subscription.poll()
+            if subscription.cursor.dropped > dropped:
+                logger.warning(f"设备列表更新太慢，丢失了{subscription.cursor.dropped - dropped}个扫描事件")
+            for event in events:
+                device = adapter.scan_device_map.get(event.mac)
+                if device is not None:
+                    self.on_device_found(device)
+
+        self.root.after(50, self.task_drain_scan_events)
+
+    def task_render_rssi_timelines(self):
+        """
+            渲染信号趋势，只处理当前可见的行以及选中的设备，并且只在有新的采样时更新，
+            与设备总数以及采样的频率无关
+        @return:
+        """
+        tree = self.tree_view_device_list
+        children = tree.get_children()
+        if len(children) > 0:
+            first, last = tree.yview()
+            start = int(first * len(children))
+            end = min(len(children), int(last * len(children)) + 1)
+            for mac in children[start:end]:
+                timeline = self.rssi_timelines.get(mac)
+                if timeline is None:
+                    continue
+                rendered = self.rssi_sparkline_map.get(mac)
+                if rendered is not None and rendered[0] == timeline.count:
+                    continue
+                text = rssi_timeline.sparkline(timeline.rssis(SPARKLINE_SAMPLES))
+                self.rssi_sparkline_map[mac] = (timeline.count, text)
+                tree.set(mac, "信号趋势", text)
+
+        selections = tree.selection()
+        if len(selections) > 0:
+            timeline = self.rssi_timelines.get(selections[0])
+            if timeline is not None and self.rssi_detail_rendered != (selections[0], timeline.count):
+                self.draw_rssi_detail(selections[0], timeline)
+
+        self.root.after(500, self.task_render_rssi_timelines)
+
+    def draw_rssi_detail(self, mac: str, timeline: rssi_timeline.RssiTimeline, low: int = -100, high: int = -30):
+        """
+            在详情图中画出一个设备缓冲区中全部的信号强度采样，横轴为时间
+        @param mac: 设备的MAC地址
+        @param timeline: 设备的信号强度时间线
+        @param low: 图中最低处对应的信号强度
+        @param high: 图中最高处对应的信号强度
+        @return:
+        """
+        canvas = self.canvas_rssi_detail
+        canvas.delete("all")
+        self.rssi_detail_rendered = (mac, timeline.count)
+        samples = timeline.samples()
+        if len(samples) == 0:
+            return
+        width = max(canvas.winfo_width(), 200)
+        height = int(canvas["height"])
+        text_width = 260  # 左侧留给文字说明
+        time_first, time_last = samples[0][0], samples[-1][0]
+        time_span = max(time_last - time_first, 1e-3)
+        points = []
+        for timestamp, rssi in samples:
+            points.append(text_width + (timestamp - time_first) / time_span * (width - text_width - 10))
+            points.append(height - 4 - (max(low, min(high, rssi)) - low) / (high - low) * (height - 8))
+        if len(points) == 2:
+            points += [points[0] + 1, points[1]]  # 只有一个采样时画成一个点
+        canvas.create_line(*points, fill="#7FDBFF", width=1)
+        rssis = [rssi for _, rssi in samples]
+        canvas.create_text(
+            6, height // 2, anchor=tk.W, fill="white",
+            text=f"{mac}  最近{len(rssis)}次 {time_span:.0f}S\n"
+                 f"最小{min(rssis)} 平均{sum(rssis) / len(rssis):.0f} 最大{max(rssis)} dbm")
+
+    def task_update_link_state(self):
+        """
+            在UI线程中把链路的实时状态显示到被监视的设备的行上
+        @return:
+        """
+        monitor = self.link_monitor
+        mac = self.link_monitor_mac
+        if monitor is not None and mac is not None and self.tree_view_device_list.exists(mac):
+            values = list(self.tree_view_device_list.item(mac)['values'])
+            record = self.device_adv_record_map.get(mac)
+            name = record['device'].name if record is not None else values[0]
+            duration = int(monitor.state_duration)
+            values[0] = (f"{name}（{link_monitor.LinkState.NAMES[monitor.state]}"
+                         f" {duration // 3600:02d}:{duration // 60 % 60:02d}:{duration % 60:02d}）")
+            self.tree_view_device_list.item(mac, values=values)
+
+        self.root.after(1000, self.task_update_link_state)
+
+    def stop_link_monitor(self):
+        """
+            停止链路监视，并且把统计写入日志
+        @return:
+        """
+        if self.link_monitor is not None:
+            logger.info(f"链路监视结束：{self.link_monitor.stats()}")
+            self.link_monitor.stop()
+            self.link_monitor = None
+            self.link_monitor_mac = None
+
     def close_adapter(self):
         """
             关闭适配器且设置引用为空
         @return:
         """
+        self.stop_link_monitor()
+        self.stop_scan_export()
+        if self.golden_run is not None:
+            self.golden_run.finish()
+        if self.device_history is not None:
+            self.device_history.detach()
+        if self.recovery_supervisor is not None:
+            self.recovery_supervisor.cancel()
+            self.recovery_supervisor = None
+        if self.device_subscription is not None:
+            self.device_subscription.close()
+            self.device_subscription = None
+        self.rssi_cursor = None
         if self.ble_adapter is not None:
-            self.ble_adapter.callback_on_device_found = None  # 解注册回调，不然适配器会一直持有本GUI对象导致无法释放
             self.ble_adapter.close()
             self.ble_adapter = None
 
@@ -382,32 +704,47 @@ class App:
         try:
             # 确保旧的设备关掉了，避免没有释放资源导致后续的操作异常
             self.close_adapter()
-            self.ble_adapter = bleuart.BLEToUartAdapter(self.port_num_selected)
+            self.ble_adapter = bleuart.BLEToUartAdapter(self.port_num_selected, self.adapter_config_cache,
+                                                        self.adapter_latency_tracker)
+            self.ble_adapter.wire_tracer = self.wire_tracer
+            self.on_fast_baudrate_on_scan_toggle()
             if self.ble_adapter.open():
                 wd.update_message("正在检测有效性和波特率")
                 self.ble_adapter.check_is_ble_to_uart_device()
                 # 设置当前的设备选择的波特率到UI上显示，让用户了解当前使用了什么波特率
                 self.var_baudrate.set(bleuart.BLEToUartAdapter.BAUDRATE_MAP[self.ble_adapter.baudrate_current_index])
 
-                wd.update_message("正在关闭自动重连")
-                self.ble_adapter.set_auto_reconnect_enable(False)
-                wd.update_message("正在断开所有蓝牙链接")
-                try:
-                    self.ble_adapter.disconnect_slave_device()
-                except:
-                    pass
-
-                # 获取当前的服务特征的UUID，显示在UI上
-                wd.update_message("正在获取当前透传服务的UUID信息")
-                uuid_s = self.ble_adapter.get_transfer_main_service_uuid()
-                self.var_uuid_service_main.set(uuid_s)
-                uuid_n = self.ble_adapter.get_transfer_characteristic_n_uuid()
-                self.var_uuid_characteristic_notify.set(uuid_n)
-                uuid_w = self.ble_adapter.get_transfer_characteristic_w_uuid()
-                self.var_uuid_characteristic_write.set(uuid_w)
-
-                # 设备开启成功后，注册扫描回调
-                self.ble_adapter.callback_on_device_found = self.on_device_found
+                # 关闭自动重连、断开所有蓝牙链接以及获取当前的服务特征的UUID，这些指令合并为一个批次执行，
+                # 模块可能被其他上位机改过配置，打开时显示的必须是模块真实的配置，因此不使用配置缓存，
+                # 执行的结果会刷新配置缓存，之后的操作依旧可以使用缓存
+                wd.update_message("正在关闭自动重连、断开所有蓝牙链接并获取当前透传服务的UUID信息")
+                results = self.ble_adapter.call_batch([
+                    ("AUTO_CFG=", False),
+                    ("DISCONN=", 0),  # 可能本来就没有连接，此指令的错误可以忽略
+                    ("UUIDS?",),
+                    ("UUIDN?",),
+                    ("UUIDW?",),
+                ], use_cache=False)
+                for result in (results[0], *results[2:]):
+                    if not result.ok:
+                        raise result.error
+                # 显示在UI上
+                self.var_uuid_service_main.set(results[2].value)
+                self.var_uuid_characteristic_notify.set(results[3].value)
+                self.var_uuid_characteristic_write.set(results[4].value)
+
+                # 设备开启成功后，订阅设备的变化
+                self.device_subscription = self.ble_adapter.subscribe(
+                    scan_events.SubscriptionPolicy(every_sighting=True, min_interval_ms=500))
+                self.rssi_cursor = self.ble_adapter.scan_events.subscribe()
+                if self.device_history is not None:
+                    self.device_history.attach(self.ble_adapter.scan_events)
+                # 串口短暂丢失时自动恢复，恢复后同样需要关闭自动重连
+                self.recovery_supervisor = adapter_recovery.RecoverySupervisor(
+                    self.ble_adapter, restore_calls=[("AUTO_CFG=", False)])
+                self.recovery_supervisor.on_recovery_start = self.on_adapter_recovery_start
+                self.recovery_supervisor.on_recovered = self.on_adapter_recovered
+                self.recovery_supervisor.on_recovery_failed = self.on_adapter_recovery_failed
                 wd.destroy()
                 self.set_view_for_adapter_close(False)  # 更新视图为未关闭适配器的状态
 
@@ -437,32 +774,24 @@ class App:
             重置适配器的子线程
         @return:
         """
-        # 先把自动重连功能禁用掉
-        wd.update_message("正在禁用自动重连功能")
-        self.ble_adapter.set_auto_reconnect_enable(False)
-        wd.update_message("正在清除自动重连列表")
-        self.ble_adapter.del_auto_reconnect_list()
-
-        # 然后把可能存在的设备给断掉
-        wd.update_message("正在断开可能存在的设备连接")
-        try:
-            self.ble_adapter.disconnect_slave_device()
-        except:
-            pass
-
-        # 把服务特征复位
-        uuid_s = "FFF0"
-        uuid_n = "FFF1"
-        uuid_w = "FFF2"
-        wd.update_message(f"正在复位服务(s)与特征(c)为："
-                          f"\n 主服务 = {uuid_s}, 通知特征 = {uuid_n}, 写特征 = {uuid_w}"
-                          f"\n此信息可在新一的手册中获取")
-        self.ble_adapter.set_transfer_main_service_uuid(uuid_s)
-        self.ble_adapter.set_transfer_characteristic_w_uuid(uuid_w)
-        self.ble_adapter.set_transfer_characteristic_n_uuid(uuid_n)
-        self.var_uuid_service_main.set(uuid_s)
-        self.var_uuid_characteristic_notify.set(uuid_n)
-        self.var_uuid_characteristic_write.set(uuid_w)
+        # 先把自动重连列表清除，并把可能存在的设备给断掉
+        wd.update_message("正在清除自动重连列表，断开可能存在的设备连接")
+        adapter = self.ble_adapter
+        results = adapter.call_batch([
+            ("AUTO_DEL",),
+            ("DISCONN=", 0),  # 可能本来就没有连接，此指令的错误可以忽略
+        ])
+        if not results[0].ok:
+            raise results[0].error
+
+        # 禁用自动重连功能，并把服务特征复位
+        profile = adapter_profile.PROFILE_DEFAULT
+        wd.update_message(f"正在禁用自动重连功能，并复位服务(s)与特征(c)为："
+                          f"\n 主服务 = {profile.config['UUIDS']}, 通知特征 = {profile.config['UUIDN']}, "
+                          f"写特征 = {profile.config['UUIDW']}"
+                          f"\n此信息可在新一的手册中获取", "复位服务与特征")
+        adapter_profile.apply_profile(adapter, profile)
+        self.set_view_uuid_by_profile(profile)
 
         # 软重置
         wd.update_message("正在进行软复位适配器")
@@ -475,7 +804,7 @@ class App:
             等待结束扫描的子线程
         @return:
         """
-        self.ble_adapter.stop_scan()
+        self.ble_adapter.stop_scan().wait()
         wd.destroy()
         widget.Toast.create(self.root, "扫描已停止")
         self.set_view_for_scan_state(False)
@@ -486,8 +815,9 @@ class App:
         @return:
         """
         try:
+            self.stop_link_monitor()  # 之前监视的设备会在复位时断开
             wd.update_message("正在停止扫描")
-            self.ble_adapter.stop_scan()
+            self.ble_adapter.stop_scan().wait()
             self.set_view_for_scan_state(False)
 
             wd.update_message("正在重置适配器以此避免某些未知问题")
@@ -496,21 +826,39 @@ class App:
             device: bleuart.BLEDevice = self.device_adv_record_map[mac]['device']
             device_str = f"{device.name}, {device.mac}"
 
-            wd.update_message("正在删除旧的重连列表")
-            self.ble_adapter.del_auto_reconnect_list()
-
+            # 删除旧的重连列表与设置自动重连合并为一个批次执行
             auto_reconnect_enable = self.var_config_auto_reconnect_on_connect_enable.get()
+            calls_reconnect = [("AUTO_DEL",)]
             if auto_reconnect_enable:
-                wd.update_message(f"正在为 {device_str} 设置自动重连")
-                self.ble_adapter.set_auto_reconnect_device(device.mac, device.mac_type)
-
-            wd.update_message(f"开始连接到设备 {device_str}")
+                wd.update_message(f"正在删除旧的重连列表并为 {device_str} 设置自动重连", "设置自动重连")
+                calls_reconnect.append(("AUTO_MAC=", device.mac, device.mac_type))
+            else:
+                wd.update_message("正在删除旧的重连列表", "设置自动重连")
+            for result in self.ble_adapter.call_batch(calls_reconnect, stop_on_error=True):
+                if not result.ok:
+                    raise result.error
+
+            # 需要监视链路时，在连接之前开始接收事件，连接的应答本身就是第一个事件
+            monitor_link = self.var_config_monitor_link_on_connect.get()
+            if monitor_link:
+                self.link_monitor = link_monitor.LinkMonitor(self.ble_adapter, auto_reconnect_enable,
+                                                             confirm_interval=60)
+                self.link_monitor_mac = device.mac
+
+            wd.update_message(f"开始连接到设备 {device_str}", "连接设备")
             self.ble_adapter.connect_slave_device(device.mac, device.mac_type)
 
             if auto_reconnect_enable:
                 wd.update_message("正在开启自动重连功能")
                 self.ble_adapter.set_auto_reconnect_enable(True)
 
+            if monitor_link:
+                # 保持适配器打开，由事件实时更新链路状态，偶尔用 'DEV?' 确认一次
+                self.link_monitor.start()
+                wd.destroy()
+                widget.Toast.create(self.root, f"已连接 {device_str}，正在监视链路状态")
+                return
+
             # 连接成功后，关闭适配器，释放串口
             wd.update_message("正在释放串口")
             self.close_adapter()
@@ -535,6 +883,7 @@ class App:
                                 f"\n为了不抢占串口，本程序已自动关闭蓝牙适配器")
         except Exception as e:
             wd.destroy()
+            self.stop_link_monitor()
             # 连接失败后，尝试重新开启搜索
             if self.ble_adapter is not None:
                 self.ble_adapter.start_scan()
@@ -557,15 +906,60 @@ class App:
             执行更新服务特征的UUID
         @return:
         """
-        wd.update_message("正在设置主服务的UUID")
-        self.ble_adapter.set_transfer_main_service_uuid(self.var_uuid_service_main.get())
-        wd.update_message("正在设置通知特征的UUID")
-        self.ble_adapter.set_transfer_characteristic_n_uuid(self.var_uuid_characteristic_notify.get())
-        wd.update_message("正在设置写特征的UUID")
-        self.ble_adapter.set_transfer_characteristic_w_uuid(self.var_uuid_characteristic_write.get())
+        wd.update_message("正在设置主服务、通知特征与写特征的UUID")
+        profile = adapter_profile.AdapterProfile("手动输入", {
+            "UUIDS": self.var_uuid_service_main.get(),
+            "UUIDN": self.var_uuid_characteristic_notify.get(),
+            "UUIDW": self.var_uuid_characteristic_write.get(),
+        })
+        adapter_profile.apply_profile(self.ble_adapter, profile)
         wd.destroy()
         messagebox.showinfo("恭喜", "设置透传服务的UUID成功")
 
+    def thread_apply_profile(self, wd: widget.WorkingDialog, profile: adapter_profile.AdapterProfile):
+        """
+            应用配置方案的子线程
+        @return:
+        """
+        wd.update_message(f"正在应用配置方案 '{profile.name}'", "应用配置方案")
+        changes = adapter_profile.apply_profile(self.ble_adapter, profile)
+        self.set_view_uuid_by_profile(profile)
+        if adapter_profile.PROFILE_KEY_BAUDRATE in profile.config:
+            self.var_baudrate.set(bleuart.BLEToUartAdapter.BAUDRATE_MAP[self.ble_adapter.baudrate_current_index])
+        wd.destroy()
+        if len(changes) > 0:
+            messagebox.showinfo("恭喜", f"应用配置方案 '{profile.name}' 成功，共修改了{len(changes)}项配置")
+        else:
+            widget.Toast.create(self.root, "适配器已是此配置方案，无需修改")
+
+    def set_view_uuid_by_profile(self, profile: adapter_profile.AdapterProfile):
+        """
+            把配置方案中的服务特征的UUID显示在UI上
+        @param profile: 配置方案
+        @return:
+        """
+        if "UUIDS" in profile.config:
+            self.var_uuid_service_main.set(profile.config["UUIDS"])
+        if "UUIDN" in profile.config:
+            self.var_uuid_characteristic_notify.set(profile.config["UUIDN"])
+        if "UUIDW" in profile.config:
+            self.var_uuid_characteristic_write.set(profile.config["UUIDW"])
+
+    @staticmethod
+    def load_profiles():
+        """
+            加载配置方案，默认的配置方案总是存在
+        @return: 方案名到方案的映射表
+        """
+        profile_map = {adapter_profile.PROFILE_DEFAULT.name: adapter_profile.PROFILE_DEFAULT}
+        try:
+            profile_map.update(adapter_profile.load_profiles(PROFILES_FILE_PATH))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"加载配置方案文件 '{PROFILES_FILE_PATH}' 失败：{e}")
+        return profile_map
+
     def create_task_sub_thread(self, task_name: str, task_fn, setup_msg: str, args=None):
         """
             创建一个子线程任务
@@ -576,6 +970,10 @@ class App:
         @return:
         """
         wd = widget.WorkingDialog(self.root)
+        # 每一条进度消息都是一个计时阶段，对话框销毁时任务的主要工作就结束了
+        task_timer = span_timer.TaskTimer(self.span_recorder, task_name)
+        wd.on_update_message = task_timer.phase
+        wd.on_destroy = lambda: self.on_task_timer_finish(task_timer)
         wd.update_message(setup_msg)
         wd.show()
 
@@ -588,10 +986,35 @@ class App:
                     task_fn(wd)
             except Exception as e:
                 wd.destroy()
+                self.dump_wire_trace(task_name)
                 messagebox.showerror(f"任务 '{task_name}' 执行失败", str(e))
 
         threading.Thread(target=thread_impl).start()
 
+    @staticmethod
+    def on_task_timer_finish(task_timer: span_timer.TaskTimer):
+        """
+            子线程任务结束时，输出本次任务的分阶段耗时
+        @param task_timer: 任务计时
+        @return:
+        """
+        task_timer.finish()
+        logger.info(f"任务耗时：{task_timer.summary()}")
+
+    def dump_wire_trace(self, task_name: str):
+        """
+            导出通信追踪记录到文件中
+        @param task_name: 任务的名字，用于日志中说明导出的原因
+        @return:
+        """
+        file_path = f"./BLE转串口通信追踪_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        try:
+            count = self.wire_tracer.dump_jsonl(file_path)
+            logger.info(f"任务 '{task_name}' 执行失败，已导出{count}条通信追踪记录到：{file_path}，"
+                        f"未记录的扫描结果行：{self.wire_tracer.scan_lines_skipped}")
+        except Exception as e:
+            logger.error(f"导出通信追踪记录失败：{e}")
+
     def on_device_found(self, device: bleuart.BLEDevice):
         """
             设备发现时的回调
@@ -620,6 +1043,7 @@ class App:
             "静态地址" if device.mac_type == 0 else "随机地址",
             f"{device.rssi}dbm",
             formatted_time,  # 最后更新的时间，只需要显示几时几分几秒
+            self.rssi_sparkline_map.get(device.mac, (0, ""))[1],  # 信号趋势只在可见时渲染，这里沿用上次的结果
         ]
 
         # 检查是否是存在的行记录，如果是，直接更新，否则插入到结尾
@@ -638,7 +1062,13 @@ class App:
                 self.create_task_sub_thread("切换波特率", self.thread_change_baudrate, "正在切换波特率")
         return
 
+    def on_profile_select(self, _):
+        profile = self.profile_map[self.var_profile_selected.get()]
+        logger.info(f"选择了配置方案：{profile}")
+        self.create_task_sub_thread("应用配置方案", self.thread_apply_profile, "正在应用配置方案", profile)
+
     def on_port_select(self, _):
+        self.build_device_panel()  # 打开适配器时需要用到设备面板，还没有创建的话先创建
         index_selected = self.port_list.current()
         new_port_selected = self.port_obj_list[index_selected].device
 
@@ -690,23 +1120,271 @@ class App:
     def on_clear_device_list_click(self):
         self.clear_device_list()
 
+    def on_export_scan_click(self):
+        """
+            开始或者停止导出扫描结果，导出的是之后的每一次设备更新，与列表的刷新节奏无关
+        @return:
+        """
+        if self.scan_exporter is not None:
+            self.stop_scan_export()
+            return
+        if self.is_adapter_closed():
+            messagebox.showerror("适配器已关闭", "请重新选择串口号连接到BLE转串口适配器")
+            return
+        path = filedialog.asksaveasfilename(
+            title="导出扫描结果", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+        if not path:
+            return
+        snapshot = messagebox.askyesno("导出方式", "是否只保留每个设备的最新状态？\n选择“否”时记录每一次设备更新")
+        name_prefix = self.var_filter_device_name.get()
+        self.scan_exporter = scan_export.ScanExporter(
+            self.ble_adapter.scan_events, path, snapshot=snapshot,
+            event_filter=(lambda event: event.name.startswith(name_prefix)) if len(name_prefix) > 0 else None)
+        self.scan_exporter.start()
+        self.btn_export_scan.config(text="停止导出", bg="red")
+        logger.info(f"开始导出扫描结果到 {path}，{'快照' if snapshot else '流水'}模式")
+
+    def on_device_history_toggle(self):
+        """
+            开始或者停止记录设备历史，已经打开的适配器立刻开始记录
+        @return:
+        """
+        if self.var_config_device_history_enable.get():
+            if self.device_history is None:
+                self.device_history = device_history.DeviceHistoryStore(DEVICE_HISTORY_FILE_PATH)
+            if not self.is_adapter_closed():
+                self.device_history.attach(self.ble_adapter.scan_events)
+            logger.info(f"开始记录设备历史到 {DEVICE_HISTORY_FILE_PATH}")
+        elif self.device_history is not None:
+            self.device_history.close()
+            self.device_history = None
+            logger.info("停止记录设备历史")
+
+    def on_device_history_query_click(self):
+        """
+            查询设备历史，输入完整的MAC地址时查询这个设备，否则按照名称查询
+        @return:
+        """
+        if not os.path.exists(DEVICE_HISTORY_FILE_PATH):
+            messagebox.showinfo("历史查询", "还没有记录过设备历史，请先勾选“记录设备历史”")
+            return
+        keyword = simpledialog.askstring("历史查询", "请输入MAC地址或者设备名称：", parent=self.root)
+        if keyword is None or len(keyword.strip()) == 0:
+            return
+        keyword = keyword.strip()
+        store = self.device_history
+        if store is None:
+            store = device_history.DeviceHistoryStore(DEVICE_HISTORY_FILE_PATH)
+        if bleuart.MAC_PATTERN.match(keyword) is not None:
+            record = store.find_device(keyword)
+            records = [record] if record is not None else []
+        else:
+            records = store.search_devices(name=keyword, limit=20)
+        if len(records) == 0:
+            messagebox.showinfo("历史查询", f"没有出现过 '{keyword}'")
+            return
+
+        def format_time(timestamp: float) -> str:
+            return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+        messagebox.showinfo("历史查询", "\n\n".join(
+            f"{record.name} {record.mac}\n"
+            f"首次出现：{format_time(record.first_seen)}，最后出现：{format_time(record.last_seen)}\n"
+            f"共出现{record.sightings}次，最强信号 {record.rssi_max}dbm" for record in records))
+
+    def on_fast_baudrate_on_scan_toggle(self):
+        """
+            更新适配器扫描时使用的波特率，下一次开始扫描时生效
+        @return:
+        """
+        if self.ble_adapter is None:
+            return
+        fast = self.var_config_fast_baudrate_on_scan.get()
+        self.ble_adapter.scan_baudrate_index = bleuart.BLEToUartAdapter.SCAN_BAUDRATE_INDEX if fast else None
+
+    def on_golden_list_click(self):
+        """
+            开始产线核对，核对进行中时再次点击则提前结束
+        @return:
+        """
+        if self.golden_run is not None:
+            self.golden_run.finish()
+            return
+        if self.is_adapter_closed():
+            messagebox.showerror("适配器已关闭", "请重新选择串口号连接到BLE转串口适配器")
+            return
+
+        dialog = tk.Toplevel(self.root, bg=DEFAULT_BACKGROUND)
+        dialog.title("产线核对")
+        dialog.transient(self.root)
+        tk.Label(dialog, bg=DEFAULT_BACKGROUND, fg="white",
+                 text="期望的设备清单，每行一个MAC地址或者设备名称：").pack(anchor=tk.W, padx=10, pady=(10, 5))
+        text = tk.Text(dialog, width=48, height=16)
+        text.pack(fill=tk.BOTH, expand=True, padx=10)
+        frame_buttons = tk.Frame(dialog, bg=DEFAULT_BACKGROUND)
+        frame_buttons.pack(fill=tk.X, padx=10, pady=10)
+
+        def on_load_click():
+            path = filedialog.askopenfilename(parent=dialog, title="载入设备清单",
+                                              filetypes=[("文本或CSV", "*.txt *.csv"), ("全部文件", "*.*")])
+            if path:
+                text.delete("1.0", tk.END)
+                text.insert("1.0", "\n".join(golden_list.load_golden_list(path)))
+
+        def on_start_click():
+            entries = golden_list.parse_golden_list(text.get("1.0", tk.END))
+            if len(entries) == 0:
+                messagebox.showerror("产线核对", "期望的设备清单是空的", parent=dialog)
+                return
+            dialog.destroy()
+            self.start_golden_run(entries)
+
+        tk.Button(frame_buttons, text="从文件载入", bg=DEFAULT_BACKGROUND, fg="white",
+                  command=on_load_click).pack(side=tk.LEFT)
+        tk.Button(frame_buttons, text="开始核对", bg="green", fg="white",
+                  command=on_start_click).pack(side=tk.RIGHT)
+
+    def start_golden_run(self, entries: typing.List[str]):
+        """
+            开始核对，没有在扫描时自动开始扫描
+        @param entries: 期望的设备清单
+        @return:
+        """
+        for child_iid in self.tree_view_device_list.get_children():
+            self.tree_view_device_list.item(child_iid, tags=())
+        self.golden_run = golden_list.GoldenListRun(entries)
+        self.golden_run.start(self.ble_adapter.scan_events)
+        self.btn_golden_list.config(text="结束核对", bg="red")
+        logger.info(f"开始产线核对，共{len(entries)}个设备")
+        if self.ble_adapter.scan_state != bleuart.BLEToUartAdapter.ScanState.RUNNING:
+            self.create_task_sub_thread("启动BLE扫描", self.thread_start_scan, "正在启动扫描")
+
+    def task_update_golden_run(self):
+        """
+            在UI线程中显示核对的进度，核对结束后导出报告
+        @return:
+        """
+        run = self.golden_run
+        if run is not None:
+            for unit in run.units:
+                if unit.found and self.tree_view_device_list.exists(unit.mac):
+                    self.tree_view_device_list.item(unit.mac, tags=("golden_found",))
+            self.var_golden_status.set(f"已发现 {run.found_count}/{run.total}，缺少 {run.total - run.found_count}，"
+                                       f"用时 {run.elapsed:.1f}S")
+            if run.time_end is not None:
+                self.finish_golden_run(run)
+
+        self.root.after(200, self.task_update_golden_run)
+
+    def finish_golden_run(self, run: golden_list.GoldenListRun):
+        """
+            核对结束，停止扫描并且导出报告
+        @param run: 已经结束的核对
+        @return:
+        """
+        self.golden_run = None
+        self.btn_golden_list.config(text="产线核对", bg=DEFAULT_BACKGROUND)
+        report_path = f"./产线核对报告_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        try:
+            run.export_report(report_path)
+        except Exception as e:
+            logger.error(f"导出核对报告失败：{e}")
+            report_path = None
+        if self.ble_adapter is not None and self.ble_adapter.scan_state == bleuart.BLEToUartAdapter.ScanState.RUNNING:
+            self.create_task_sub_thread("停止BLE扫描", self.thread_wait_scan_stopped, "正在停止扫描")
+        missing = [unit.key for unit in run.missing]
+        summary = f"发现 {run.found_count}/{run.total}，用时 {run.elapsed:.1f}S"
+        if report_path is not None:
+            summary += f"\n报告已导出到 {report_path}"
+        if len(missing) == 0:
+            widget.Toast.create(self.root, "核对通过，" + summary)
+        else:
+            messagebox.showwarning("核对未通过", f"{summary}\n缺少：\n" + "\n".join(missing[:50]))
+
+    def stop_scan_export(self):
+        """
+            停止导出扫描结果，剩余的结果会被写出
+        @return:
+        """
+        exporter = self.scan_exporter
+        if exporter is None:
+            return
+        self.scan_exporter = None
+        exporter.stop()
+        self.btn_export_scan.config(text="导出扫描结果", bg=DEFAULT_BACKGROUND)
+        logger.info(f"扫描结果已导出到 {exporter.path}，共{exporter.exported}条")
+
     def show_ports(self):
         """
             更新需要显示的串口下拉选择的列表
         @return:
         """
-        self.port_obj_list = serial.tools.list_ports.comports()
-        logger.info(f"搜索到的串口总数：{len(self.port_obj_list)}")
-        for port, desc, hwid in self.port_obj_list:
-            logger.info("串口信息：{}: {} [{}]".format(port, desc, hwid))
+        self.port_obj_list = self.port_watcher.ports()
         self.port_list['values'] = [device.description for device in self.port_obj_list]
 
+    def on_port_added(self, port):
+        """
+            有新的串口插入，运行在串口监视线程中，界面的更新交给UI线程
+        @param port: 串口信息
+        @return:
+        """
+        self.root.after(0, self.show_ports)
+        if port.device == self.port_num_selected and self.recovery_supervisor is not None:
+            self.recovery_supervisor.notify_port_added()  # 适配器重新插入，立刻尝试恢复
+
+    def on_port_removed(self, port):
+        """
+            有串口拔出，运行在串口监视线程中，界面的更新交给UI线程，如果拔出的是已经打开的适配器，就开始恢复
+        @param port: 串口信息
+        @return:
+        """
+        self.root.after(0, self.show_ports)
+        if port.device == self.port_num_selected and self.recovery_supervisor is not None:
+            self.recovery_supervisor.notify_port_lost()
+
+    def on_adapter_recovery_start(self, _):
+        self.root.after(0, widget.Toast.create, self.root, "适配器连接中断，正在恢复")
+
+    def on_adapter_recovered(self, duration: float):
+        self.root.after(0, widget.Toast.create, self.root, f"适配器已恢复（{duration:.1f}s）")
+
+    def on_adapter_recovery_failed(self, error):
+        """
+            适配器恢复失败，运行在恢复线程中，界面的更新交给UI线程
+        @param error: 最后一次失败的异常
+        @return:
+        """
+        logger.info(f"适配器 {self.port_num_selected} 恢复失败，自动关闭：{error}")
+        self.root.after(0, self.close_adapter_after_recovery_failed, self.recovery_supervisor)
+
+    def close_adapter_after_recovery_failed(self, recovery_supervisor: adapter_recovery.RecoverySupervisor):
+        """
+            适配器恢复失败后，关闭适配器并且重置视图
+        @param recovery_supervisor: 恢复失败的恢复监督者，期间用户已经关闭或者重新打开了适配器时不再处理
+        @return:
+        """
+        if recovery_supervisor is None or recovery_supervisor is not self.recovery_supervisor:
+            return
+        self.close_adapter()
+        self.clear_port_selected()
+        self.clear_device_list()
+        self.set_view_for_scan_state(False)
+        self.update_view_if_adapter_is_closed()
+        widget.Toast.create(self.root, "适配器已断开")
+
     def on_window_close_confirm(self) -> bool:
         """
             在确认关闭窗口的时候回调此函数
         @return: 返回False表示不关闭，返回True表示关闭
         """
+        self.port_watcher.stop()
         self.close_adapter()
+        if self.device_history is not None:
+            self.device_history.close()
+        report = self.span_recorder.report()
+        if len(report) > 0:
+            logger.info(f"本次运行的各阶段耗时汇总：\n{report}")
         return True
 
 
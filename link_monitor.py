@@ -0,0 +1,191 @@
+import collections
+import threading
+import time
+import typing
+
+import bleuart
+
+
+class LinkState:
+    UNKNOWN = 0
+    CONNECTED = 1
+    DISCONNECTED = 2
+
+    NAMES = {
+        UNKNOWN: "未知",
+        CONNECTED: "已连接",
+        DISCONNECTED: "已断开",
+    }
+
+
+class LinkChange(typing.NamedTuple):
+    """
+        一次链路状态的变化
+    """
+    time: float  # 变化时的时间戳，time.time()
+    state: int  # 变化后的状态，参考 LinkState
+    source: str  # 发现变化的途径，'event' 为模块上报的事件，'poll' 为 'DEV?' 的确认查询
+
+
+class LinkMonitor:
+    """
+        适配器与目标设备之间的链路状态监视，由模块主动上报的 '+CONNECTED'、'+DISCONN' 事件驱动，断开可以立刻发现，
+        可选的以很低的频率用 'DEV?' 确认一次，弥补可能丢失的事件。
+        同时统计每次连接的持续时间，开启了自动重连时统计从断开到重新连上的耗时
+    """
+
+    def __init__(self, adapter: bleuart.BLEToUartAdapter, auto_reconnect: bool = False,
+                 confirm_interval: float | None = None, history: int = 256):
+        """
+            创建链路监视，同时接管适配器的事件回调
+        @param adapter: 适配器，需要保持打开，事件才能被接收
+        @param auto_reconnect: 适配器是否开启了自动重连，开启时统计重连耗时
+        @param confirm_interval: 用 'DEV?' 确认状态的间隔，以秒为单位，为None时只依靠事件
+        @param history: 保留最近多少次状态变化，以及最近多少次重连耗时
+        """
+        self.adapter = adapter
+        self.auto_reconnect = auto_reconnect
+        self.confirm_interval = confirm_interval
+
+        self._lock = threading.Lock()
+        self.state = LinkState.UNKNOWN
+        self.changes: typing.Deque[LinkChange] = collections.deque(maxlen=history)
+        self._state_since = time.monotonic()  # 进入当前状态时的单调时间
+        # 已经结束的连接的累计统计，长时间的老化测试中也不会随断开次数增长
+        self.disconnects = 0
+        self.uptime_total = 0.0
+        self.uptime_longest = 0.0
+        # 自动重连的统计，耗时只保留最近的若干次用于估计中位数
+        self.reconnects = 0
+        self.reconnect_latency_max = 0.0
+        self.reconnect_latencies: typing.Deque[float] = collections.deque(maxlen=history)
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        # 链路状态变化时的回调，参数为变化记录，运行在读取串口的线程或者确认线程中
+        self.on_state_changed: typing.Callable[[LinkChange], None] | None = None
+
+        adapter.callback_on_event = self.on_event
+
+    @property
+    def state_duration(self) -> float:
+        """
+            当前状态已经持续了多久，以秒为单位
+        @return:
+        """
+        return time.monotonic() - self._state_since
+
+    def on_event(self, event: str):
+        """
+            模块上报事件时的处理
+        @param event: 事件行
+        @return:
+        """
+        if event.startswith(bleuart.BLEToUartAdapter.RESP_CONNECTED):
+            self.set_state(LinkState.CONNECTED, "event")
+        elif event.startswith("+DISCONN") or event.startswith(bleuart.BLEToUartAdapter.RESP_READY):
+            self.set_state(LinkState.DISCONNECTED, "event")  # 模块复位后原有的连接也就不存在了
+
+    def set_state(self, state: int, source: str):
+        """
+            更新链路状态，状态没有变化时只是确认，不会记录
+        @param state: 状态，参考 LinkState
+        @param source: 发现变化的途径
+        @return:
+        """
+        now = time.monotonic()
+        with self._lock:
+            last_state = self.state
+            if state == last_state:
+                return
+            duration = now - self._state_since
+            self.state = state
+            self._state_since = now
+            change = LinkChange(time.time(), state, source)
+            self.changes.append(change)
+            if last_state == LinkState.CONNECTED:
+                self.disconnects += 1
+                self.uptime_total += duration
+                self.uptime_longest = max(self.uptime_longest, duration)
+            elif last_state == LinkState.DISCONNECTED and state == LinkState.CONNECTED and self.auto_reconnect:
+                self.reconnects += 1
+                self.reconnect_latency_max = max(self.reconnect_latency_max, duration)
+                self.reconnect_latencies.append(duration)
+
+        if last_state == LinkState.CONNECTED:
+            bleuart.logger.warning(f"链路已断开，本次连接持续了 {duration:.1f}s（{source}）")
+        elif last_state == LinkState.DISCONNECTED and self.auto_reconnect:
+            bleuart.logger.info(f"链路已自动重连，耗时 {duration:.2f}s（{source}）")
+        else:
+            bleuart.logger.info(f"链路状态：{LinkState.NAMES[state]}（{source}）")
+        if self.on_state_changed is not None:
+            self.on_state_changed(change)
+
+    def confirm(self) -> int:
+        """
+            用 'DEV?' 查询一次实际的链路状态，扫描时无法执行指令，此时直接返回当前状态
+        @return: 确认后的状态
+        """
+        adapter = self.adapter
+        if not adapter.is_opened() or adapter.scan_state != adapter.ScanState.STOPPED:
+            return self.state
+        mac = adapter.call("DEV?", use_cache=False)
+        self.set_state(LinkState.CONNECTED if mac is not None else LinkState.DISCONNECTED, "poll")
+        return self.state
+
+    def thread_confirm(self):
+        while not self._stop_event.wait(self.confirm_interval):
+            try:
+                self.confirm()
+            except Exception as e:
+                bleuart.logger.warning(f"确认链路状态失败：{e}")
+
+    def start(self):
+        """
+            启动确认线程，没有设置确认间隔时不需要调用，重复调用无效
+        @return:
+        """
+        if self.confirm_interval is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.thread_confirm, name="链路确认", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+            停止确认线程，并且交还适配器的事件回调
+        @return:
+        """
+        self._stop_event.set()
+        if self.adapter.callback_on_event == self.on_event:
+            self.adapter.callback_on_event = None
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        """
+            链路的统计信息，当前还在持续的连接也计入在线时长
+        @return: 可以直接序列化为JSON的统计
+        """
+        with self._lock:
+            state = self.state
+            disconnects = self.disconnects
+            uptime_total = self.uptime_total
+            uptime_longest = self.uptime_longest
+            if state == LinkState.CONNECTED:
+                uptime_current = time.monotonic() - self._state_since
+                uptime_total += uptime_current
+                uptime_longest = max(uptime_longest, uptime_current)
+            reconnects = self.reconnects
+            reconnect_latency_max = self.reconnect_latency_max
+            latencies = sorted(self.reconnect_latencies)
+        stats = {
+            "state": LinkState.NAMES[state],
+            "disconnects": disconnects,
+            "uptime_total": round(uptime_total, 3),
+            "uptime_longest": round(uptime_longest, 3),
+        }
+        if reconnects > 0:
+            stats["reconnects"] = reconnects
+            stats["reconnect_latency_p50"] = round(latencies[len(latencies) // 2], 3)  # 最近若干次重连的中位数
+            stats["reconnect_latency_max"] = round(reconnect_latency_max, 3)
+        return stats
@@ -1,24 +1,141 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
+import threading
 
 LOG_FORMATTER = logging.Formatter("%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s")
 
+# 日志文件存放的目录，为None时只输出到控制台，不创建日志文件
+LOG_DIR: str | None = "./"
+# 单个日志文件的最大字节数，超过后滚动到备份文件中
+LOG_MAX_BYTES = 10 * 1024 * 1024
+# 滚动保留的备份文件的个数
+LOG_BACKUP_COUNT = 5
 
-def getLogger(name):
+_lock = threading.Lock()
+_logger_map = {
+    # 已经创建过的日志管理对象，保证同一个名称只会添加一次处理器，布局为：
+    # 名称: logging.Logger
+}
+_log_queue = queue.SimpleQueue()
+_dispatch_handler: "_DispatchHandler | None" = None
+_listener: logging.handlers.QueueListener | None = None
+
+
+class _DispatchHandler(logging.Handler):
     """
-        获取一个日志管理对象
-    @param name: 对象名称
+        运行在后台写日志线程中的处理器，把日志分发到控制台以及各自名称对应的日志文件中
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.console_handler = logging.StreamHandler(sys.stdout)
+        self.console_handler.setFormatter(LOG_FORMATTER)
+        self.file_handler_map = {
+            # 日志名称到文件处理器的映射表
+        }
+
+    def add_file_handler(self, name: str):
+        if LOG_DIR is None or name in self.file_handler_map:
+            return
+        file_handler = logging.handlers.RotatingFileHandler(
+            "{0}/{1}.log".format(LOG_DIR, name), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+            encoding="utf-8", delay=True)
+        file_handler.setFormatter(LOG_FORMATTER)
+        self.file_handler_map[name] = file_handler
+
+    def emit(self, record: logging.LogRecord):
+        self.console_handler.handle(record)
+        file_handler = self.file_handler_map.get(record.name)
+        if file_handler is not None:
+            file_handler.handle(record)
+
+    def close(self):
+        for file_handler in self.file_handler_map.values():
+            file_handler.close()
+        super().close()
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+        把日志放入队列的处理器，第一次有日志输出时才启动后台写日志线程并且登记日志文件，
+        仅仅导入模块或者获取日志对象不会创建线程与文件
+    """
+
+    def __init__(self, name: str):
+        super().__init__(_log_queue)
+        self.logger_name = name
+        self._ready = False
+
+    def emit(self, record: logging.LogRecord):
+        if not self._ready:
+            with _lock:
+                _start_listener()
+                _dispatch_handler.add_file_handler(self.logger_name)
+            self._ready = True
+        super().emit(record)
+
+
+def _start_listener():
+    """
+        启动后台写日志线程，所有的日志对象共用这一个线程，调用者需要持有 _lock
+    @return:
+    """
+    global _dispatch_handler, _listener
+    if _listener is not None:
+        return
+    _dispatch_handler = _DispatchHandler()
+    _listener = logging.handlers.QueueListener(_log_queue, _dispatch_handler)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """
+        停止后台写日志线程，并且把队列中剩余的日志写完，
+        之后再有日志输出时会重新启动后台写日志线程，日志不会留在队列中无人处理
     @return:
     """
-    logger = logging.getLogger(name)
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _dispatch_handler.close()
+        _listener = None
+        for logger in _logger_map.values():
+            for handler in logger.handlers:
+                if isinstance(handler, _LazyQueueHandler):
+                    handler._ready = False
 
-    file_handler = logging.FileHandler("{0}/{1}.log".format("./", name))
-    file_handler.setFormatter(LOG_FORMATTER)
-    logger.addHandler(file_handler)
 
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(LOG_FORMATTER)
-    logger.addHandler(console_handler)
+def set_level(name: str, level: int | str):
+    """
+        设置某个子系统的日志等级
+    @param name: 日志对象名称
+    @param level: 日志等级，比如 logging.INFO 或者 'INFO'
+    @return:
+    """
+    logging.getLogger(name).setLevel(level)
+
+
+def getLogger(name, level: int | str = logging.DEBUG):
+    """
+        获取一个日志管理对象，日志通过队列交给后台线程写入控制台与文件，调用方不会被IO阻塞，
+        同一个名称多次获取时返回同一个对象，不会重复添加处理器，
+        后台线程与日志文件在第一条日志输出时才创建，因此可以在模块导入时调用
+    @param name: 对象名称
+    @param level: 首次创建时使用的日志等级
+    @return:
+    """
+    with _lock:
+        if name in _logger_map:
+            return _logger_map[name]
 
-    logger.setLevel(logging.DEBUG)
-    return logger
+        logger = logging.getLogger(name)
+        logger.addHandler(_LazyQueueHandler(name))
+        logger.setLevel(level)
+        _logger_map[name] = logger
+        return logger
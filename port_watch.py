@@ -0,0 +1,153 @@
+import os
+import sys
+import threading
+import typing
+
+import serial.tools.list_ports
+from serial.tools.list_ports_common import ListPortInfo
+
+import bleuart
+
+# 常见的USB转串口芯片的 (VID, PID)，可以作为过滤器只显示这些串口，适配器也可能使用其他的芯片（比如CH343、PL2303），
+# 因此默认不过滤
+USB_UART_BRIDGE_IDS = (
+    (0x1A86, 0x7523),  # CH340
+    (0x1A86, 0x5523),  # CH341
+    (0x1A86, 0x55D4),  # CH9102
+    (0x10C4, 0xEA60),  # CP210x
+    (0x0403, 0x6001),  # FT232R
+    (0x0403, 0x6015),  # FT231X
+)
+
+
+def get_ports_fingerprint() -> typing.Tuple[str, ...] | None:
+    """
+        获取当前系统串口的指纹，只读取很少的信息，用于在完整的枚举之前判断串口有没有变化
+    @return: 指纹，无法获取时返回None，此时需要每次都完整的枚举
+    """
+    if sys.platform == "win32":
+        import winreg
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"HARDWARE\DEVICEMAP\SERIALCOMM") as key:
+                values = []
+                index = 0
+                while True:
+                    try:
+                        name, value, _ = winreg.EnumValue(key, index)
+                    except OSError:
+                        break
+                    values.append(f"{name}={value}")
+                    index += 1
+                return tuple(sorted(values))
+        except OSError:
+            return ()  # 没有任何串口时这个键不存在
+    try:
+        return tuple(sorted(name for name in os.listdir("/dev") if name.startswith(("tty", "cu."))))
+    except OSError:
+        return None
+
+
+class PortWatcher:
+    """
+        串口的热插拔监视器，在后台线程中周期性的检查串口的变化，维护一份缓存的串口列表，
+        串口插入与拔出时通过回调通知，回调运行在监视线程中
+    """
+
+    def __init__(self, interval: float = 1.0,
+                 vid_pid_filter: typing.Iterable[typing.Tuple[int, int]] | None = None):
+        """
+            创建监视器
+        @param interval: 检查的间隔，以秒为单位
+        @param vid_pid_filter: 只关心这些 (VID, PID) 的串口，为None时不过滤
+        """
+        self.interval = interval
+        self.vid_pid_filter = set(vid_pid_filter) if vid_pid_filter is not None else None
+
+        self._lock = threading.Lock()
+        self._port_map: typing.Dict[str, ListPortInfo] = {
+            # 串口号到串口信息的映射表
+        }
+        self._fingerprint: typing.Tuple[str, ...] | None = None
+        self._refreshed = False
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        # 有串口插入时的回调
+        self.on_port_added: typing.Callable[[ListPortInfo], None] | None = None
+        # 有串口拔出时的回调
+        self.on_port_removed: typing.Callable[[ListPortInfo], None] | None = None
+
+    def is_port_accepted(self, port: ListPortInfo) -> bool:
+        if self.vid_pid_filter is None:
+            return True
+        return (port.vid, port.pid) in self.vid_pid_filter
+
+    def refresh(self, force: bool = False) -> typing.Tuple[typing.List[ListPortInfo], typing.List[ListPortInfo]]:
+        """
+            检查一次串口的变化，串口的指纹没有变化时跳过完整的枚举
+        @param force: 是否忽略指纹强制枚举
+        @return: (插入的串口, 拔出的串口)
+        """
+        fingerprint = get_ports_fingerprint()
+        if not force and self._refreshed and fingerprint is not None and fingerprint == self._fingerprint:
+            return [], []
+
+        port_map = {}
+        for port in serial.tools.list_ports.comports():
+            if self.is_port_accepted(port):
+                port_map[port.device] = port
+
+        with self._lock:
+            old_port_map = self._port_map
+            added = [port for device, port in port_map.items()
+                     if device not in old_port_map or old_port_map[device].hwid != port.hwid]
+            removed = [port for device, port in old_port_map.items()
+                       if device not in port_map or port_map[device].hwid != port.hwid]
+            self._port_map = port_map
+            self._fingerprint = fingerprint
+            first_refresh = not self._refreshed
+            self._refreshed = True
+
+        if first_refresh:
+            return added, removed  # 第一次枚举只是建立缓存，不算作热插拔
+        for port in removed:
+            bleuart.logger.info(f"串口已拔出：{port.device} [{port.hwid}]")
+            if self.on_port_removed is not None:
+                self.on_port_removed(port)
+        for port in added:
+            bleuart.logger.info(f"串口已插入：{port.device} [{port.hwid}]")
+            if self.on_port_added is not None:
+                self.on_port_added(port)
+        return added, removed
+
+    def ports(self) -> typing.List[ListPortInfo]:
+        """
+            获取缓存的串口列表，还没有枚举过时会先枚举一次
+        @return: 按照串口号排序的串口列表
+        """
+        if not self._refreshed:
+            self.refresh()
+        with self._lock:
+            return [self._port_map[device] for device in sorted(self._port_map.keys())]
+
+    def thread_watch(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                bleuart.logger.error(f"检查串口变化失败：{e}")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """
+            启动后台的监视线程，重复调用无效
+        @return:
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.thread_watch, name="串口监视", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
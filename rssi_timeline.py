@@ -0,0 +1,85 @@
+import array
+import typing
+
+# 迷你折线图使用的字符，从低到高
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+class RssiTimeline:
+    """
+        一个设备的信号强度时间线，固定大小的环形缓冲区，存储空间在创建时一次性分配好，
+        每个设备占用的内存是固定的，不随扫描时长增长
+    """
+
+    def __init__(self, capacity: int = 64):
+        """
+            创建时间线
+        @param capacity: 能容纳的采样个数，写满后覆盖最旧的采样
+        """
+        self.capacity = capacity
+        self._times = array.array('d', [0.0]) * capacity
+        self._rssis = array.array('b', [0]) * capacity
+        self.count = 0  # 累计写入的采样个数，写入位置为 count % capacity，也可以用来判断有没有新的采样
+
+    def add(self, timestamp: float, rssi: int):
+        pos = self.count % self.capacity
+        self._times[pos] = timestamp
+        self._rssis[pos] = max(-128, min(127, rssi))
+        self.count += 1
+
+    def samples(self, max_count: int | None = None) -> typing.List[typing.Tuple[float, int]]:
+        """
+            获取最近的采样，按照时间顺序
+        @param max_count: 最多获取多少个，为None时获取缓冲区中全部的采样
+        @return: (时间戳, 信号强度) 的列表
+        """
+        size = min(self.count, self.capacity)
+        if max_count is not None:
+            size = min(size, max_count)
+        return [(self._times[i % self.capacity], self._rssis[i % self.capacity])
+                for i in range(self.count - size, self.count)]
+
+    def rssis(self, max_count: int | None = None) -> typing.List[int]:
+        return [rssi for _, rssi in self.samples(max_count)]
+
+
+def sparkline(rssis: typing.Sequence[int], low: int = -100, high: int = -30) -> str:
+    """
+        把信号强度渲染为一行迷你折线图
+    @param rssis: 信号强度，按照时间顺序
+    @param low: 对应最低字符的信号强度
+    @param high: 对应最高字符的信号强度
+    @return:
+    """
+    top = len(SPARK_CHARS) - 1
+    span = high - low
+    return "".join(SPARK_CHARS[max(0, min(top, (rssi - low) * top // span))] for rssi in rssis)
+
+
+class RssiTimelineMap:
+    """
+        所有设备的信号强度时间线，设备的MAC地址到时间线的映射表
+    """
+
+    def __init__(self, capacity: int = 64):
+        """
+            创建映射表
+        @param capacity: 每个设备的时间线能容纳的采样个数
+        """
+        self.capacity = capacity
+        self._timelines: typing.Dict[str, RssiTimeline] = {}
+
+    def add(self, mac: str, timestamp: float, rssi: int):
+        timeline = self._timelines.get(mac)
+        if timeline is None:
+            timeline = self._timelines[mac] = RssiTimeline(self.capacity)
+        timeline.add(timestamp, rssi)
+
+    def get(self, mac: str) -> RssiTimeline | None:
+        return self._timelines.get(mac)
+
+    def clear(self):
+        self._timelines.clear()
+
+    def __len__(self):
+        return len(self._timelines)
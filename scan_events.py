@@ -0,0 +1,280 @@
+import array
+import threading
+import time
+import typing
+
+
+class ScanEvent(typing.NamedTuple):
+    """
+        一次设备发现的事件，字段是发现时的快照，之后设备信息再更新也不会改变
+    """
+    seq: int  # 事件的序号，从0开始连续递增
+    time: float  # 发现时的时间戳，time.time()
+    mac: str
+    mac_type: int
+    rssi: int
+    name: str
+
+
+class ScanEventRing:
+    """
+        扫描事件的环形缓冲区，存储空间在创建时一次性分配好，写满后覆盖最旧的事件。
+        扫描线程只负责写入，从不等待消费者，每个消费者通过自己的游标按照自己的节奏读取，
+        读得太慢被覆盖掉的事件会记录在游标的 dropped 中
+    """
+
+    def __init__(self, capacity: int = 4096):
+        """
+            创建环形缓冲区
+        @param capacity: 能容纳的事件个数
+        """
+        self.capacity = capacity
+        self._times = array.array('d', [0.0]) * capacity
+        self._mac_types = bytearray(capacity)
+        self._rssis = array.array('h', [0]) * capacity
+        self._macs: typing.List[str] = [""] * capacity
+        self._names: typing.List[str] = [""] * capacity
+        self._seq = 0  # 下一个事件的序号，写入位置为 _seq % capacity
+        self._cond = threading.Condition(threading.Lock())
+
+    @property
+    def seq(self) -> int:
+        """
+            下一个写入的事件的序号，也就是累计写入的事件个数
+        @return:
+        """
+        return self._seq
+
+    def publish(self, mac: str, mac_type: int, rssi: int, name: str):
+        """
+            写入一个事件，只会短暂的持有锁，不会因为消费者而阻塞
+        @param mac: 设备的MAC地址
+        @param mac_type: 地址类型
+        @param rssi: 信号强度
+        @param name: 设备名
+        @return:
+        """
+        timestamp = time.time()
+        with self._cond:
+            pos = self._seq % self.capacity
+            self._times[pos] = timestamp
+            self._mac_types[pos] = mac_type
+            self._rssis[pos] = rssi
+            self._macs[pos] = mac
+            self._names[pos] = name
+            self._seq += 1
+            self._cond.notify_all()
+
+    def read(self, seq: int, max_count: int | None = None) -> typing.Tuple[typing.List[ScanEvent], int]:
+        """
+            从指定的序号开始读取事件
+        @param seq: 起始序号
+        @param max_count: 最多读取的个数，为None时读取全部
+        @return: (事件列表, 因为已经被覆盖而跳过的事件个数)
+        """
+        with self._cond:
+            oldest = max(0, self._seq - self.capacity)
+            dropped = max(0, oldest - seq)
+            seq = max(seq, oldest)
+            end = self._seq if max_count is None else min(self._seq, seq + max_count)
+            # 锁内只复制切片，构造事件对象放在锁外，慢的消费者不会拖住扫描线程的写入
+            start = seq % self.capacity
+            stop = start + (end - seq)
+            if stop <= self.capacity:
+                times = self._times[start:stop]
+                macs = self._macs[start:stop]
+                mac_types = self._mac_types[start:stop]
+                rssis = self._rssis[start:stop]
+                names = self._names[start:stop]
+            else:
+                stop -= self.capacity  # 跨过了缓冲区的末尾，分成两段复制
+                times = self._times[start:] + self._times[:stop]
+                macs = self._macs[start:] + self._macs[:stop]
+                mac_types = self._mac_types[start:] + self._mac_types[:stop]
+                rssis = self._rssis[start:] + self._rssis[:stop]
+                names = self._names[start:] + self._names[:stop]
+        events = list(map(ScanEvent, range(seq, end), times, macs, mac_types, rssis, names))
+        return events, dropped
+
+    def wait(self, seq: int, timeout: float | None = None) -> bool:
+        """
+            等待有序号不小于 seq 的事件写入
+        @param seq: 序号
+        @param timeout: 最多等多久，为None时一直等
+        @return: 是否有新的事件
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq > seq, timeout)
+
+    def subscribe(self, from_oldest: bool = False) -> "ScanEventCursor":
+        """
+            创建一个新的游标
+        @param from_oldest: 是否从缓冲区中最旧的事件开始读，默认只读之后写入的事件
+        @return:
+        """
+        with self._cond:
+            seq = max(0, self._seq - self.capacity) if from_oldest else self._seq
+        return ScanEventCursor(self, seq)
+
+
+class ScanEventCursor:
+    """
+        扫描事件的游标，每个消费者各自持有一个，游标之间互不影响，只应在一个线程中使用
+    """
+
+    def __init__(self, ring: ScanEventRing, seq: int):
+        self.ring = ring
+        self.seq = seq  # 下一个要读取的事件的序号
+        self.dropped = 0  # 累计因为读得太慢而丢失的事件个数
+
+    @property
+    def lag(self) -> int:
+        """
+            还没有读取的事件个数，超过缓冲区的容量时说明已经有事件丢失了
+        @return:
+        """
+        return self.ring.seq - self.seq
+
+    def read(self, max_count: int | None = None) -> typing.List[ScanEvent]:
+        """
+            读取新的事件，并且移动游标
+        @param max_count: 最多读取的个数，为None时读取全部
+        @return: 事件列表
+        """
+        events, dropped = self.ring.read(self.seq, max_count)
+        self.dropped += dropped
+        self.seq += dropped + len(events)
+        return events
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+            等待新的事件
+        @param timeout: 最多等多久，为None时一直等
+        @return: 是否有新的事件
+        """
+        return self.ring.wait(self.seq, timeout)
+
+
+class SubscriptionPolicy:
+    """
+        设备订阅的策略，满足任意一个变化条件的事件才会投递，同一个设备的投递间隔不小于 min_interval_ms
+    """
+
+    def __init__(self, new_device: bool = True, name_change: bool = False, rssi_delta: int | None = None,
+                 every_sighting: bool = False, min_interval_ms: int = 0):
+        """
+            创建订阅策略
+        @param new_device: 第一次发现设备时投递
+        @param name_change: 设备名变化时投递
+        @param rssi_delta: 信号强度与上次投递时相比变化达到这么多dB时投递，为None时不关心信号强度
+        @param every_sighting: 每次发现都投递，一般与 min_interval_ms 一起使用
+        @param min_interval_ms: 同一个设备两次投递之间的最小间隔，以毫秒为单位，间隔内的变化合并为一次投递
+        """
+        self.new_device = new_device
+        self.name_change = name_change
+        self.rssi_delta = rssi_delta
+        self.every_sighting = every_sighting
+        self.min_interval = min_interval_ms / 1000
+
+    def is_changed(self, last: ScanEvent | None, event: ScanEvent) -> bool:
+        """
+            判断事件相对于上次投递的是否满足变化条件
+        @param last: 上次投递的事件，没有投递过为None
+        @param event: 新的事件
+        @return:
+        """
+        if last is None:
+            return self.new_device or self.every_sighting
+        if self.every_sighting:
+            return True
+        if self.name_change and event.name != last.name:
+            return True
+        if self.rssi_delta is not None and abs(event.rssi - last.rssi) >= self.rssi_delta:
+            return True
+        return False
+
+
+class DeviceSubscription:
+    """
+        按照策略过滤与节流的设备订阅，基于自己的扫描事件游标，同一个设备在节流间隔内的多次变化只投递最新的一次。
+        可以由消费者自己调用 poll() 拉取，也可以调用 start() 在后台线程中通过回调推送
+    """
+
+    def __init__(self, ring: ScanEventRing, policy: SubscriptionPolicy):
+        self.cursor = ring.subscribe()
+        self.policy = policy
+        self._last_delivered: typing.Dict[str, typing.Tuple[float, ScanEvent]] = {
+            # 设备的MAC地址到 (上次投递的单调时间, 上次投递的事件) 的映射表
+        }
+        self._pending: typing.Dict[str, ScanEvent] = {
+            # 因为节流还没有投递的事件，同一个设备只保留最新的一个
+        }
+        self._thread: threading.Thread | None = None
+        self._closed = threading.Event()
+
+        # 推送模式下的回调，在订阅自己的线程中调用
+        self.callback: typing.Callable[[ScanEvent], None] | None = None
+
+    def poll(self) -> typing.List[ScanEvent]:
+        """
+            读取新的扫描事件，返回到期需要投递的事件
+        @return: 需要投递的事件，每个设备最多一个
+        """
+        policy = self.policy
+        last_delivered = self._last_delivered
+        pending = self._pending
+        for event in self.cursor.read():
+            if event.mac in pending:
+                pending[event.mac] = event  # 已经满足条件在等待投递了，合并为最新的状态
+                continue
+            last = last_delivered.get(event.mac)
+            if policy.is_changed(last[1] if last is not None else None, event):
+                pending[event.mac] = event
+            elif last is None:
+                # 不投递新设备时，第一次发现的状态作为之后判断变化的基准
+                last_delivered[event.mac] = (float("-inf"), event)
+
+        now = time.monotonic()
+        events = []
+        for mac, event in list(pending.items()):
+            last = last_delivered.get(mac)
+            if last is None or now - last[0] >= policy.min_interval:
+                events.append(event)
+                last_delivered[mac] = (now, event)
+                del pending[mac]
+        return events
+
+    def next_due(self) -> float | None:
+        """
+            距离下一个节流中的事件到期还有多久
+        @return: 秒数，没有节流中的事件时返回None
+        """
+        if len(self._pending) == 0:
+            return None
+        now = time.monotonic()
+        due = min(self._last_delivered[mac][0] + self.policy.min_interval
+                  for mac in self._pending.keys() if mac in self._last_delivered)
+        return max(0.0, due - now)
+
+    def thread_deliver(self):
+        while not self._closed.is_set():
+            for event in self.poll():
+                if self.callback is not None:
+                    self.callback(event)
+            due = self.next_due()
+            # 等待新的事件或者节流到期，定时醒来是为了能及时发现订阅已经关闭
+            self.cursor.wait(0.5 if due is None else min(0.5, due))
+
+    def start(self, callback: typing.Callable[[ScanEvent], None]):
+        """
+            启动推送线程
+        @param callback: 事件的回调
+        @return:
+        """
+        self.callback = callback
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.thread_deliver, name="设备订阅", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._closed.set()
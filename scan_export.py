@@ -0,0 +1,202 @@
+import csv
+import json
+import os
+import threading
+import time
+import typing
+
+import bleuart
+import scan_events
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FIELDS = ("time", "mac", "mac_type", "rssi", "name")
+
+
+def format_from_path(path: str) -> str:
+    """
+        根据文件的扩展名推断导出格式
+    @param path: 文件路径
+    @return: FORMAT_CSV 或者 FORMAT_JSONL
+    """
+    return FORMAT_JSONL if os.path.splitext(path)[1].lower() in (".jsonl", ".json") else FORMAT_CSV
+
+
+def event_to_row(event: scan_events.ScanEvent) -> tuple:
+    return round(event.time, 3), event.mac, event.mac_type, event.rssi, event.name
+
+
+def event_to_json_line(event: scan_events.ScanEvent) -> str:
+    return json.dumps(dict(zip(FIELDS, event_to_row(event))), ensure_ascii=False) + "\n"
+
+
+class ScanExporter:
+    """
+        扫描结果的流式导出，在自己的线程中通过扫描事件的游标读取，不会拖慢扫描线程的解析。
+        流水模式下每一次设备更新追加一行，超过大小后滚动到备份文件中；
+        快照模式下只保留每个设备的最新状态，定期整个重写文件。两种模式的内存占用都不随扫描时长增长
+    """
+
+    def __init__(self, ring: scan_events.ScanEventRing, path: str, fmt: str | None = None,
+                 snapshot: bool = False, flush_interval: float = 1.0,
+                 max_bytes: int = 64 * 1024 * 1024, backup_count: int = 5,
+                 event_filter: typing.Callable[[scan_events.ScanEvent], bool] | None = None):
+        """
+            创建导出器
+        @param ring: 扫描事件的环形缓冲区，一般为适配器的 scan_events
+        @param path: 导出的文件路径
+        @param fmt: 导出格式，FORMAT_CSV 或者 FORMAT_JSONL，为None时根据扩展名推断
+        @param snapshot: 是否是快照模式
+        @param flush_interval: 写入磁盘的间隔，以秒为单位，快照模式下也是重写文件的间隔
+        @param max_bytes: 流水模式下单个文件的最大字节数，超过后滚动，为0时不滚动
+        @param backup_count: 滚动保留的备份文件的个数
+        @param event_filter: 事件过滤器，返回True的事件才会导出，为None时全部导出
+        """
+        self.path = path
+        self.fmt = fmt if fmt is not None else format_from_path(path)
+        if self.fmt not in (FORMAT_CSV, FORMAT_JSONL):
+            raise ValueError(f"不支持的导出格式：{self.fmt}")
+        self.snapshot = snapshot
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.event_filter = event_filter
+
+        self.cursor = ring.subscribe()
+        self.exported = 0  # 累计写出的事件个数，快照模式下为快照中的设备个数
+        self._latest: typing.Dict[str, scan_events.ScanEvent] = {
+            # 快照模式下设备的MAC地址到最新事件的映射表
+        }
+        self._file: typing.TextIO | None = None
+        self._csv_writer = None
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def open_file(self):
+        """
+            打开流水文件，新文件或者空文件需要先写入CSV的表头
+        @return:
+        """
+        self._file = open(self.path, "a", encoding="utf-8", newline="", buffering=64 * 1024)
+        if self.fmt == FORMAT_CSV:
+            self._csv_writer = csv.writer(self._file)
+            if self._file.tell() == 0:
+                self._csv_writer.writerow(FIELDS)
+
+    def close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._csv_writer = None
+
+    def rotate(self):
+        """
+            滚动文件，与日志文件的滚动规则一致：path -> path.1 -> path.2 ...
+        @return:
+        """
+        self.close_file()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.open_file()
+
+    def write_events(self, events: typing.List[scan_events.ScanEvent]):
+        """
+            在流水文件中追加事件
+        @param events: 事件
+        @return:
+        """
+        if self._file is None:
+            self.open_file()
+        if self.fmt == FORMAT_CSV:
+            self._csv_writer.writerows(map(event_to_row, events))
+        else:
+            self._file.writelines(map(event_to_json_line, events))
+        self.exported += len(events)
+        if self.max_bytes > 0 and self._file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def write_snapshot(self):
+        """
+            把每个设备的最新状态写入快照文件，先写临时文件再替换，读取者不会看到写了一半的文件
+        @return:
+        """
+        events = sorted(self._latest.values(), key=lambda e: e.mac)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            if self.fmt == FORMAT_CSV:
+                writer = csv.writer(f)
+                writer.writerow(FIELDS)
+                writer.writerows(map(event_to_row, events))
+            else:
+                f.writelines(map(event_to_json_line, events))
+        os.replace(tmp_path, self.path)
+        self.exported = len(events)
+
+    def drain(self):
+        """
+            读取所有新的事件并写出，流水模式只是写入缓冲区，快照模式只是更新内存中的最新状态
+        @return:
+        """
+        dropped = self.cursor.dropped
+        while True:
+            events = self.cursor.read(1024)
+            if len(events) == 0:
+                break
+            if self.event_filter is not None:
+                events = list(filter(self.event_filter, events))
+            if self.snapshot:
+                for event in events:
+                    self._latest[event.mac] = event
+            else:
+                self.write_events(events)
+        if self.cursor.dropped > dropped:
+            bleuart.logger.warning(f"扫描结果导出太慢，丢失了{self.cursor.dropped - dropped}个扫描事件")
+
+    def flush(self):
+        if self.snapshot:
+            self.write_snapshot()
+        elif self._file is not None:
+            self._file.flush()
+
+    def thread_export(self):
+        time_flush = time.monotonic() + self.flush_interval
+        try:
+            while not self._stop_event.is_set():
+                self.cursor.wait(max(0.0, time_flush - time.monotonic()))
+                self.drain()
+                if time.monotonic() >= time_flush:
+                    self.flush()
+                    time_flush = time.monotonic() + self.flush_interval
+            self.drain()
+            self.flush()
+        except Exception as e:
+            bleuart.logger.error(f"导出扫描结果到 {self.path} 失败：{e}")
+        finally:
+            self.close_file()
+
+    def start(self):
+        """
+            启动导出线程，重复调用无效
+        @return:
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.thread_export, name="扫描导出", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 3):
+        """
+            停止导出，剩余的事件会被写出
+        @param timeout: 最多等待导出线程多久
+        @return:
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,218 @@
+import threading
+import time
+import typing
+
+
+class PhaseHistogram:
+    """
+        单个阶段的耗时直方图，桶的边界按照2倍递增，从1毫秒到约65秒，超出的落在最后一个桶中
+    """
+
+    BUCKET_BOUNDS = tuple(0.001 * (2 ** i) for i in range(17))
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, duration: float):
+        """
+            记录一次耗时
+        @param duration: 耗时，以秒为单位
+        @return:
+        """
+        index = 0
+        while index < len(self.BUCKET_BOUNDS) and duration > self.BUCKET_BOUNDS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+
+    def halve(self):
+        """
+            所有的桶减半，用于长期统计中让旧的样本逐渐淡出，最大值与最小值保持不变
+        @return:
+        """
+        self.buckets = [bucket_count // 2 for bucket_count in self.buckets]
+        count = sum(self.buckets)
+        self.total = self.total * count / self.count if self.count > 0 else 0.0
+        self.count = count
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {"buckets": self.buckets, "count": self.count, "total": self.total,
+                "min": self.min if self.count > 0 else None, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data: typing.Dict[str, typing.Any]) -> "PhaseHistogram":
+        """
+            从 to_dict 的结果恢复直方图，桶的个数不一致时抛出 ValueError
+        @param data: to_dict 的结果
+        @return:
+        """
+        histogram = cls()
+        if len(data["buckets"]) != len(histogram.buckets):
+            raise ValueError("耗时直方图的桶的个数不一致")
+        histogram.buckets = [int(bucket_count) for bucket_count in data["buckets"]]
+        histogram.count = sum(histogram.buckets)
+        histogram.total = float(data["total"])
+        histogram.min = float(data["min"]) if data["min"] is not None else float("inf")
+        histogram.max = float(data["max"])
+        return histogram
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def percentile(self, p: float) -> float:
+        """
+            估算百分位耗时，返回所在桶的上边界（不超过实际的最大值）
+        @param p: 百分位，0-100
+        @return: 耗时，以秒为单位
+        """
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100
+        accumulated = 0
+        for index, bucket_count in enumerate(self.buckets):
+            accumulated += bucket_count
+            if accumulated >= target:
+                if index < len(self.BUCKET_BOUNDS):
+                    return min(self.BUCKET_BOUNDS[index], self.max)
+                break
+        return self.max
+
+
+class SpanRecorder:
+    """
+        按照名称汇总各阶段耗时的记录器，线程安全
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogram_map: typing.Dict[str, PhaseHistogram] = {
+            # 阶段名称到耗时直方图的映射表
+        }
+
+    def record(self, name: str, duration: float):
+        """
+            记录一次阶段耗时
+        @param name: 阶段名称
+        @param duration: 耗时，以秒为单位
+        @return:
+        """
+        with self._lock:
+            histogram = self._histogram_map.get(name)
+            if histogram is None:
+                histogram = self._histogram_map[name] = PhaseHistogram()
+            histogram.add(duration)
+
+    def span(self, name: str) -> "Span":
+        """
+            创建一个计时的上下文，with 结束时自动记录耗时
+        @param name: 阶段名称
+        @return:
+        """
+        return Span(self, name)
+
+    def histograms(self) -> typing.Dict[str, PhaseHistogram]:
+        with self._lock:
+            return dict(self._histogram_map)
+
+    def report(self) -> str:
+        """
+            生成各阶段耗时的汇总报告，按照总耗时从大到小排列，方便找到最值得优化的阶段
+        @return:
+        """
+        lines = []
+        histograms = sorted(self.histograms().items(), key=lambda item: item[1].total, reverse=True)
+        for name, histogram in histograms:
+            lines.append(f"{name}：次数 {histogram.count}，总计 {histogram.total:.2f}s，"
+                         f"平均 {histogram.mean:.2f}s，p50 {histogram.percentile(50):.2f}s，"
+                         f"p99 {histogram.percentile(99):.2f}s，最大 {histogram.max:.2f}s")
+        return "\n".join(lines)
+
+
+class Span:
+    """
+        单个阶段的计时上下文
+    """
+
+    def __init__(self, recorder: SpanRecorder, name: str):
+        self.recorder = recorder
+        self.name = name
+        self.time_start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.time_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.perf_counter() - self.time_start
+        self.recorder.record(self.name, self.duration)
+
+
+class TaskTimer:
+    """
+        一次任务的分阶段计时，每进入一个新的阶段，上一个阶段就自动结束
+    """
+
+    def __init__(self, recorder: SpanRecorder, task_name: str):
+        """
+            创建任务计时
+        @param recorder: 阶段耗时的汇总记录器，记录时的名称为 '任务名/阶段名'
+        @param task_name: 任务的名字
+        """
+        self.recorder = recorder
+        self.task_name = task_name
+        self.phases: typing.List[typing.Tuple[str, float]] = []  # 已经结束的阶段 (阶段名, 耗时)
+        self._phase_name: str | None = None
+        self._phase_start = 0.0
+        self._time_start = time.perf_counter()
+        self.duration = 0.0
+        self.finished = False
+
+    def _end_phase(self, now: float):
+        if self._phase_name is not None:
+            duration = now - self._phase_start
+            self.phases.append((self._phase_name, duration))
+            self.recorder.record(f"{self.task_name}/{self._phase_name}", duration)
+            self._phase_name = None
+
+    def phase(self, name: str):
+        """
+            进入一个新的阶段
+        @param name: 阶段名称
+        @return:
+        """
+        if self.finished:
+            return
+        now = time.perf_counter()
+        self._end_phase(now)
+        self._phase_name = name
+        self._phase_start = now
+
+    def finish(self):
+        """
+            结束任务计时，重复调用无效
+        @return:
+        """
+        if self.finished:
+            return
+        now = time.perf_counter()
+        self._end_phase(now)
+        self.duration = now - self._time_start
+        self.recorder.record(self.task_name, self.duration)
+        self.finished = True
+
+    def summary(self) -> str:
+        """
+            生成本次任务的分阶段耗时，比如 '打开适配器 3.7s：检测 2.1s，读取UUID 1.6s'
+        @return:
+        """
+        phases = "，".join(f"{name} {duration:.1f}s" for name, duration in self.phases)
+        return f"{self.task_name} {self.duration:.1f}s：{phases}"
@@ -0,0 +1,156 @@
+import collections
+import functools
+import re
+import time
+import typing
+
+# 模块主动上报的事件行的开头，没有指令在等待这些应答时，它们会被分发到事件通道
+EVENT_PREFIXES = (b"+READY", b"+CONNECTED", b"+DISCONN")
+
+
+@functools.lru_cache(maxsize=64)
+def compile_end_lines_pattern(end_lines: typing.Tuple[str, ...]) -> re.Pattern:
+    """
+        把一组应答结束标志编译为一个字节串正则，一次搜索就能找到任意一个结束标志
+    @param end_lines: 应答结束标志
+    @return:
+    """
+    return re.compile(b"|".join(re.escape(end_line.encode()) for end_line in end_lines))
+
+
+class StreamDemux:
+    """
+        串口数据流的分路器，对接收到的字节流只扫描一遍，按行分发到三个通道：
+        正在等待的指令的应答，模块主动上报的事件，以及透传过来的数据。
+        应答中混有透传数据时（比如 'xx+UUIDS:FFF0'），结束标志之前的部分归入透传数据
+    """
+
+    def __init__(self, event_prefixes: typing.Tuple[bytes, ...] = EVENT_PREFIXES, event_history: int = 256):
+        """
+            创建分路器
+        @param event_prefixes: 事件行的开头
+        @param event_history: 保留最近多少条事件
+        """
+        self.event_prefixes = event_prefixes
+        self._buffer = bytearray()
+        self._scan_pos = 0  # 缓冲区中已经确认没有换行的位置，下次从这里继续找，保证每个字节只扫描一次
+        self._pending_pattern: re.Pattern | None = None
+        self._responses: typing.Deque[typing.Tuple[str, bool]] = collections.deque()
+
+        self.events: typing.Deque[typing.Tuple[float, str]] = collections.deque(maxlen=event_history)
+        self.payload_bytes = 0  # 累计的透传数据字节数
+
+        # 事件的回调，参数为去除了回车换行的事件行
+        self.on_event: typing.Callable[[str], None] | None = None
+        # 透传数据的回调，参数为原始数据
+        self.on_payload: typing.Callable[[bytes], None] | None = None
+        # 每一个完整行的回调，参数为带回车换行的原始数据，一般用于通信追踪
+        self.on_raw_line: typing.Callable[[bytes], None] | None = None
+
+    @property
+    def pending(self) -> bool:
+        return self._pending_pattern is not None
+
+    def begin(self, end_lines: str | typing.List[str]):
+        """
+            开始等待一条指令的应答，之后的行都属于这条指令，直到出现结束行
+        @param end_lines: 应答结束标志
+        @return:
+        """
+        end_lines = (end_lines,) if isinstance(end_lines, str) else tuple(end_lines)
+        self._pending_pattern = compile_end_lines_pattern(end_lines)
+        self._responses.clear()
+
+    def end(self):
+        """
+            结束等待，没有取走的应答行会被丢弃
+        @return:
+        """
+        self._pending_pattern = None
+        self._responses.clear()
+
+    def next_response(self) -> typing.Tuple[str, bool] | None:
+        """
+            取出下一行应答
+        @return: (应答行, 是否是结束行)，还没有时返回None
+        """
+        return self._responses.popleft() if len(self._responses) > 0 else None
+
+    def feed(self, data: bytes):
+        """
+            输入接收到的数据，完整的行会立刻被分发
+        @param data: 数据
+        @return:
+        """
+        buf = self._buffer
+        buf += data
+        start = 0
+        search_from = max(0, self._scan_pos - 1)  # 上次的结尾可能是单独的 '\r'
+        while True:
+            end = buf.find(b"\r\n", search_from)
+            if end == -1:
+                break
+            self.dispatch_line(buf, start, end)
+            start = search_from = end + 2
+        if start > 0:
+            del buf[:start]
+        self._scan_pos = len(buf)
+
+    def dispatch_line(self, buf: bytearray, start: int, end: int):
+        """
+            分发一行，直接在缓冲区上匹配，只有需要交出去的部分才会复制
+        @param buf: 缓冲区
+        @param start: 行的开始位置
+        @param end: 行的结束位置，也就是 '\\r\\n' 的位置
+        @return:
+        """
+        if self.on_raw_line is not None:
+            self.on_raw_line(bytes(buf[start:end + 2]))
+
+        pattern = self._pending_pattern
+        if pattern is not None:
+            match = pattern.search(buf, start, end)
+            if match is not None:
+                if match.start() > start:
+                    self.dispatch_payload(bytes(buf[start:match.start()]))
+                line = buf[match.start():end].decode("utf-8", errors="ignore")
+                self._responses.append((line, True))
+                self._pending_pattern = None  # 指令已经结束，同一批数据中后面的行不再属于它
+                # 结束行本身也可能是事件，比如连接指令的 '+CONNECTED'，事件的订阅者同样需要知道
+                if line.encode().startswith(self.event_prefixes):
+                    self.dispatch_event(line)
+                return
+
+        if buf.startswith(b"+", start, end):
+            for prefix in self.event_prefixes:
+                if buf.startswith(prefix, start, end):
+                    self.dispatch_event(buf[start:end].decode("utf-8", errors="ignore"))
+                    return
+
+        if pattern is not None:
+            self._responses.append((buf[start:end].decode("utf-8", errors="ignore"), False))
+        else:
+            self.dispatch_payload(bytes(buf[start:end + 2]))
+
+    def dispatch_event(self, event: str):
+        self.events.append((time.time(), event))
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def dispatch_payload(self, data: bytes):
+        self.payload_bytes += len(data)
+        if self.on_payload is not None:
+            self.on_payload(data)
+
+    def flush_partial(self):
+        """
+            把缓冲区中不完整的行作为透传数据分发出去，只在没有指令等待应答时生效，
+            以 '+' 开头的可能是还没有收完的事件行，会继续等待
+        @return:
+        """
+        buf = self._buffer
+        if self._pending_pattern is not None or len(buf) == 0 or buf.startswith(b"+"):
+            return
+        self.dispatch_payload(bytes(buf))
+        buf.clear()
+        self._scan_pos = 0
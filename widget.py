@@ -7,11 +7,14 @@ from ctypes.wintypes import HWND, UINT, RECT
 from ctypes import c_int, Structure, POINTER
 from tkinter import ttk
 
-import win32con
-import win32gui
-from win32api import SetWindowLong as Win32ApiSetWindowLong
-from win32api import RGB as WIN32API_RGB
-from PIL import ImageColor, Image, ImageTk
+try:
+    import win32con
+    import win32gui
+    from win32api import SetWindowLong as Win32ApiSetWindowLong
+    from win32api import RGB as WIN32API_RGB
+except ImportError:
+    # 非WINDOWS平台（比如在Xvfb下跑GUI的性能测试）没有pywin32，此时只是 BorderlessWindow 无法使用
+    win32con = win32gui = Win32ApiSetWindowLong = WIN32API_RGB = None
 
 EVENT_NAME_CLICK = "<Button-1>"
 
@@ -21,21 +24,43 @@ yesno_bool = {
 }
 
 
+_img_cache = {
+    # 已经生成过的图片，同样的参数只会解码与生成一次，布局为：
+    # (文件路径或者颜色, 大小): ImageTk.PhotoImage
+}
+
+
 def get_img_for_tk(img_file: str, size: typing.Tuple[int, int]):
-    image = Image.open(img_file)
-    image = image.resize(size, Image.LANCZOS)
-    return ImageTk.PhotoImage(image)
+    """
+        加载图片并缩放到指定的大小，结果会被缓存，PIL也是在第一次用到时才导入，减少启动的耗时
+    @param img_file: 图片文件路径
+    @param size: 大小
+    @return:
+    """
+    key = (img_file, tuple(size))
+    img = _img_cache.get(key)
+    if img is None:
+        from PIL import Image, ImageTk
+        image = Image.open(img_file)
+        image = image.resize(size, Image.LANCZOS)
+        img = _img_cache[key] = ImageTk.PhotoImage(image)
+    return img
 
 
 def make_img_alpha(size: typing.Tuple[int, int], rgba):
     """
-        使用指定的RGBA生成一个图片
+        使用指定的RGBA生成一个图片，结果会被缓存
     @param size: 大小
     @param rgba: RGBA，可以是字符串或者是元组
     @return:
     """
-    image = Image.new('RGBA', size, rgba)
-    return ImageTk.PhotoImage(image)
+    key = (rgba, tuple(size))
+    img = _img_cache.get(key)
+    if img is None:
+        from PIL import Image, ImageTk
+        image = Image.new('RGBA', size, rgba)
+        img = _img_cache[key] = ImageTk.PhotoImage(image)
+    return img
 
 
 def set_win_center_by_screen(root, width=200, height=200):
@@ -141,6 +166,8 @@ class BorderlessWindow:
     BORDER_WIDTH = 5
 
     def __init__(self, window: tk.Tk | tk.Toplevel):
+        if win32gui is None:
+            raise RuntimeError("无边框窗体依赖WIN32的GUI，当前平台没有安装pywin32")
         self.window = window
 
         # 存放最后点击的位置
@@ -247,6 +274,7 @@ class BorderlessWindow:
 
     @staticmethod
     def create_win32_rgb_by_string(string_color):
+        from PIL import ImageColor
         rgb_arr = ImageColor.getrgb(string_color)
         rgb_win = WIN32API_RGB(rgb_arr[0], rgb_arr[1], rgb_arr[2])
         return rgb_win
@@ -380,11 +408,14 @@ class ImageButton(tk.Canvas):
 
     def on_mouse_enter(self, _):
         # print("鼠标悬停")
-        if self.img_canvas_mask is not None:
-            self.delete(self.TAG_NAME_MASK)
-            self.create_image(0, 0, image=self.img_canvas_mask, anchor=tk.NW, tags=self.TAG_NAME_MASK)
-            # 把图片元素移动到顶层，让按钮蒙版处于最底下，既能做出鼠标悬停时的按钮变色效果，又能不影响之前显示的图片
-            self.tag_raise(self.TAG_NAME_BTN)
+        if self.img_canvas_mask is None:
+            # 遮罩图在鼠标第一次悬停时才生成，不占用启动的时间
+            self.img_canvas_mask = make_img_alpha((self.winfo_width(), self.winfo_height()),
+                                                  self.color_mouse_enter_mask)
+        self.delete(self.TAG_NAME_MASK)
+        self.create_image(0, 0, image=self.img_canvas_mask, anchor=tk.NW, tags=self.TAG_NAME_MASK)
+        # 把图片元素移动到顶层，让按钮蒙版处于最底下，既能做出鼠标悬停时的按钮变色效果，又能不影响之前显示的图片
+        self.tag_raise(self.TAG_NAME_BTN)
 
     def on_mouse_leave(self, _):
         # print("鼠标移走")
@@ -395,8 +426,8 @@ class ImageButton(tk.Canvas):
         # 居中摆放这个图片
         img_w, img_h = self.img_topmost.width(), self.img_topmost.height()
         self.moveto(self.img_btn, windows_w / 2 - img_w / 2, windows_h / 2 - img_h / 2)
-        # 绘制一个新的遮罩图
-        self.img_canvas_mask = make_img_alpha((windows_w, windows_h), self.color_mouse_enter_mask)
+        # 大小变化后遮罩图需要重新生成
+        self.img_canvas_mask = None
 
     def hide_border(self):
         """
@@ -439,7 +470,6 @@ class MaximizeWindowButton(ImageButton):
     def __init__(self, master, window):
         super().__init__(master, IMG_PATH_NAV_ICON_MAXIMIZE)
         self.window = window
-        self.img_restore = get_img_for_tk(IMG_PATH_NAV_ICON_RESTORE_WIN, (16, 16))
         self.bind(EVENT_NAME_CLICK, self.on_maximize)  # 窗口最大化事件
 
     def on_maximize(self, _):
@@ -449,7 +479,7 @@ class MaximizeWindowButton(ImageButton):
             self.itemconfig(self.img_btn, image=self.img_topmost)
         else:
             self.window.state(zoomed)
-            self.itemconfig(self.img_btn, image=self.img_restore)
+            self.itemconfig(self.img_btn, image=get_img_for_tk(IMG_PATH_NAV_ICON_RESTORE_WIN, (16, 16)))
 
 
 class TopmostWindowButton(ImageButton):
@@ -460,7 +490,6 @@ class TopmostWindowButton(ImageButton):
     def __init__(self, master, window):
         super().__init__(master, IMG_PATH_NAV_ICON_TOPPING_WHITE)
         self.window = window
-        self.img_no_topmost = get_img_for_tk(IMG_PATH_NAV_ICON_TOPPING_BLUE, (16, 16))
         self.bind(EVENT_NAME_CLICK, self.on_topping)
 
     def on_topping(self, _):
@@ -471,7 +500,7 @@ class TopmostWindowButton(ImageButton):
             self.itemconfig(self.img_btn, image=self.img_topmost)
         else:
             self.window.attributes(attr_key, True)
-            self.itemconfig(self.img_btn, image=self.img_no_topmost)
+            self.itemconfig(self.img_btn, image=get_img_for_tk(IMG_PATH_NAV_ICON_TOPPING_BLUE, (16, 16)))
 
 
 class TitleBarSimple(tk.Frame):
@@ -544,6 +573,11 @@ class WorkingDialog(tk.Toplevel):
         self.bind('<Button-1>', self._click_win)
         self.bind('<B1-Motion>', self._drag_win)
 
+        # 更新消息时的回调，参数为阶段名称，可以用来统计每个阶段的耗时
+        self.on_update_message: typing.Callable[[str], None] | None = None
+        # 对话框销毁时的回调，也就是任务的主要工作结束了
+        self.on_destroy: typing.Callable[[], None] | None = None
+
         self.withdraw()  # 默认隐藏对话框
 
     def _drag_win(self, event):
@@ -569,8 +603,22 @@ class WorkingDialog(tk.Toplevel):
         self.withdraw()
         self.grab_release()
 
-    def update_message(self, new_message):
+    def update_message(self, new_message, phase: str | None = None):
+        """
+            更新显示的消息
+        @param new_message: 新的消息
+        @param phase: 阶段名称，为None时使用消息本身，消息中包含变化的内容（比如设备名）时应当指定
+        @return:
+        """
         self.message_label.config(text=new_message)  # 更新文本消息控件的文本内容
+        if self.on_update_message is not None:
+            self.on_update_message(new_message if phase is None else phase)
+
+    def destroy(self):
+        if self.on_destroy is not None:
+            on_destroy, self.on_destroy = self.on_destroy, None
+            on_destroy()
+        super().destroy()
 
 
 def round_polygon_in_canvas(canvas, x, y, sharpness, **kwargs):
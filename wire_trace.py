@@ -0,0 +1,177 @@
+import array
+import json
+import struct
+import threading
+import time
+import typing
+
+
+class WireTracer:
+    """
+        串口通信的追踪器，把每一条发送的指令与接收的行记录到固定大小的环形缓冲区中，
+        在需要时导出为JSONL或者二进制文件，用于分析哪些指令拖慢了打开与连接的流程
+    """
+
+    DIR_TX = 0  # 发送给适配器的指令
+    DIR_RX = 1  # 从适配器接收到的行
+    DIR_NAMES = ("TX", "RX")
+
+    # 二进制格式：文件头，适配器ID表，然后是一条条的记录
+    BINARY_MAGIC = b"BLEWTRC1"
+    BINARY_RECORD = struct.Struct("<dBHI")  # 单调时间戳，方向，适配器ID的索引，数据长度
+
+    def __init__(self, capacity: int = 10000, trace_scan_lines: bool = True):
+        """
+            创建追踪器，缓冲区在创建时一次性分配好
+        @param capacity: 环形缓冲区能容纳的记录条数，写满后覆盖最旧的记录
+        @param trace_scan_lines: 是否记录扫描时上报的设备信息行，扫描时每秒有上百行，
+            不记录时只计数，缓冲区中留下的是指令与应答
+        """
+        self.capacity = capacity
+        self.trace_scan_lines = trace_scan_lines
+        self.scan_lines_skipped = 0  # 没有记录到缓冲区中的设备信息行数
+        self._timestamps = array.array('d', [0.0]) * capacity
+        self._directions = bytearray(capacity)
+        self._adapter_indexes = array.array('H', [0]) * capacity
+        self._data: typing.List[bytes] = [b""] * capacity
+        self._count = 0  # 累计记录的条数，写入位置为 _count % capacity
+
+        self._adapter_ids: typing.List[str] = []
+        self._adapter_id_index_map = {
+            # 适配器ID到ID表索引的映射表
+        }
+        self._lock = threading.Lock()
+
+        # 单调时钟与墙上时钟的对应关系，导出时用于换算出可读的时间
+        self.time_base_monotonic = time.monotonic()
+        self.time_base_wall = time.time()
+
+    def record(self, adapter_id: str, direction: int, data: bytes):
+        """
+            记录一条通信数据
+        @param adapter_id: 适配器ID，一般为串口号
+        @param direction: 方向，DIR_TX 或者 DIR_RX
+        @param data: 原始数据
+        @return:
+        """
+        timestamp = time.monotonic()
+        with self._lock:
+            adapter_index = self._adapter_id_index_map.get(adapter_id)
+            if adapter_index is None:
+                adapter_index = len(self._adapter_ids)
+                self._adapter_ids.append(adapter_id)
+                self._adapter_id_index_map[adapter_id] = adapter_index
+            pos = self._count % self.capacity
+            self._timestamps[pos] = timestamp
+            self._directions[pos] = direction
+            self._adapter_indexes[pos] = adapter_index
+            self._data[pos] = data
+            self._count += 1
+
+    def skip_scan_line(self):
+        """
+            不记录一条设备信息行，只计数
+        @return:
+        """
+        with self._lock:
+            self.scan_lines_skipped += 1
+
+    @property
+    def dropped(self) -> int:
+        """
+            因为缓冲区写满而被覆盖掉的记录条数
+        @return:
+        """
+        return max(0, self._count - self.capacity)
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+            self.scan_lines_skipped = 0
+
+    def snapshot(self) -> typing.List[typing.Tuple[float, int, str, bytes]]:
+        """
+            按照时间顺序取出缓冲区中的全部记录
+        @return: [(单调时间戳, 方向, 适配器ID, 数据)]
+        """
+        with self._lock:
+            count = min(self._count, self.capacity)
+            start = self._count - count
+            records = []
+            for i in range(start, self._count):
+                pos = i % self.capacity
+                records.append((self._timestamps[pos], self._directions[pos],
+                                self._adapter_ids[self._adapter_indexes[pos]], self._data[pos]))
+            return records
+
+    def dump_jsonl(self, file_path: str) -> int:
+        """
+            导出为JSONL，每行一条记录
+        @param file_path: 文件路径
+        @return: 导出的记录条数
+        """
+        records = self.snapshot()
+        with open(file_path, "w", encoding="utf-8") as f:
+            for timestamp, direction, adapter_id, data in records:
+                f.write(json.dumps({
+                    "t": round(timestamp - self.time_base_monotonic, 6),  # 相对于追踪器创建时的秒数
+                    "wall": round(self.time_base_wall + timestamp - self.time_base_monotonic, 6),
+                    "dir": self.DIR_NAMES[direction],
+                    "adapter": adapter_id,
+                    "data": data.decode("utf-8", errors="backslashreplace"),
+                }, ensure_ascii=False))
+                f.write("\n")
+        return len(records)
+
+    def dump_binary(self, file_path: str) -> int:
+        """
+            导出为紧凑的二进制格式，可以使用 load_binary 读取
+        @param file_path: 文件路径
+        @return: 导出的记录条数
+        """
+        records = self.snapshot()
+        with self._lock:
+            adapter_ids = list(self._adapter_ids)
+        with open(file_path, "wb") as f:
+            f.write(self.BINARY_MAGIC)
+            f.write(struct.pack("<dd", self.time_base_monotonic, self.time_base_wall))
+            f.write(struct.pack("<H", len(adapter_ids)))
+            for adapter_id in adapter_ids:
+                adapter_id_bytes = adapter_id.encode("utf-8")
+                f.write(struct.pack("<H", len(adapter_id_bytes)))
+                f.write(adapter_id_bytes)
+            for timestamp, direction, adapter_id, data in records:
+                f.write(self.BINARY_RECORD.pack(timestamp, direction, adapter_ids.index(adapter_id), len(data)))
+                f.write(data)
+        return len(records)
+
+    @classmethod
+    def load_binary(cls, file_path: str) -> typing.List[typing.Tuple[float, int, str, bytes]]:
+        """
+            读取 dump_binary 导出的文件
+        @param file_path: 文件路径
+        @return: [(相对于追踪器创建时的秒数, 方向, 适配器ID, 数据)]
+        """
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if not content.startswith(cls.BINARY_MAGIC):
+            raise ValueError(f"'{file_path}' 不是通信追踪的二进制文件")
+        offset = len(cls.BINARY_MAGIC)
+        time_base_monotonic, _ = struct.unpack_from("<dd", content, offset)
+        offset += 16
+        (adapter_id_count,) = struct.unpack_from("<H", content, offset)
+        offset += 2
+        adapter_ids = []
+        for _ in range(adapter_id_count):
+            (length,) = struct.unpack_from("<H", content, offset)
+            offset += 2
+            adapter_ids.append(content[offset:offset + length].decode("utf-8"))
+            offset += length
+        records = []
+        while offset < len(content):
+            timestamp, direction, adapter_index, length = cls.BINARY_RECORD.unpack_from(content, offset)
+            offset += cls.BINARY_RECORD.size
+            records.append((timestamp - time_base_monotonic, direction, adapter_ids[adapter_index],
+                            content[offset:offset + length]))
+            offset += length
+        return records